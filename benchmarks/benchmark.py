@@ -0,0 +1,332 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Throughput benchmark of datedown.down.download against a local HTTP server.
+
+The server generates files in memory and can add a latency to every
+request and limit the bandwidth of every connection. For every backend
+and concurrency level the benchmark reports files/s, MB/s and the median
+and 99th percentile of the time per file.
+
+Examples
+--------
+datedown has to be importable, e.g. after ``pip install -e .``.
+Run all backends at 1, 4 and 16 workers with 10 ms latency::
+
+    python benchmarks/benchmark.py --latency 0.01 --concurrency 1 4 16
+
+Store the results and compare a later run against them::
+
+    python benchmarks/benchmark.py --output baseline.json
+    python benchmarks/benchmark.py --compare baseline.json --tolerance 0.2
+'''
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+from datedown.down import download
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+BLOCKSIZE = 16384
+
+
+def parse_size(sizestring):
+    """
+    Convert a size like 512, 64K or 10M to bytes.
+    """
+    sizestring = sizestring.strip().upper().rstrip('B')
+    unit = sizestring[-1:] if sizestring[-1:] in UNITS else ''
+    return int(float(sizestring[:len(sizestring) - len(unit)]) * UNITS[unit])
+
+
+def file_sizes(distribution, n, seed=0):
+    """
+    Draw n file sizes from a distribution.
+
+    Parameters
+    ----------
+    distribution: string
+        fixed:SIZE, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA,
+        e.g. lognormal:1M:1.5
+    n: int
+        number of files
+    seed: int, optional
+        seed of the random numbers so that runs are comparable
+
+    Returns
+    -------
+    sizes: list
+        file sizes in bytes
+    """
+    rng = random.Random(seed)
+    name, args = distribution.split(':', 1)
+    args = args.split(':')
+    if name == 'fixed':
+        return [parse_size(args[0])] * n
+    if name == 'uniform':
+        low, high = parse_size(args[0]), parse_size(args[1])
+        return [rng.randint(low, high) for i in range(n)]
+    if name == 'lognormal':
+        median, sigma = parse_size(args[0]), float(args[1])
+        return [max(1, int(rng.lognormvariate(0, sigma) * median))
+                for i in range(n)]
+    raise ValueError("Unknown size distribution {}".format(distribution))
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients close connections at the end of a run
+        if not isinstance(sys.exc_info()[1], (IOError, OSError)):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """
+    Serve /SIZE/NAME with SIZE bytes after server.latency seconds and
+    at most server.bandwidth bytes per second and connection.
+    """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        try:
+            size = int(self.path.split('/')[1])
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        block = b'x' * BLOCKSIZE
+        bandwidth = self.server.bandwidth
+        start = time.time()
+        sent = 0
+        while sent < size:
+            chunk = block[:min(BLOCKSIZE, size - sent)]
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if bandwidth:
+                wait = sent / float(bandwidth) - (time.time() - start)
+                if wait > 0:
+                    time.sleep(wait)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(latency=0, bandwidth=None):
+    """
+    Start the benchmark server in a thread.
+
+    Returns
+    -------
+    server: HTTPServer
+        running server, stop it with shutdown
+    url: string
+        root URL of the server
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    server.latency = latency
+    server.bandwidth = bandwidth
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+def percentile(values, q):
+    """
+    q-th percentile of values by the nearest rank.
+    NaN if there are no values, e.g. if no download finished.
+    """
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    rank = int(round(q / 100. * (len(values) - 1)))
+    return values[rank]
+
+
+def run(url, sizes, backend, concurrency):
+    """
+    Download files of the given sizes with one backend and
+    concurrency level into a temporary directory.
+
+    Returns
+    -------
+    result: dict
+        files/s, MB/s, p50 and p99 time per file in seconds
+        and the number of failed files
+    """
+    urls = ['{}/{}/file{}'.format(url, size, i)
+            for i, size in enumerate(sizes)]
+    tmp_path = tempfile.mkdtemp(prefix='datedown_benchmark')
+    targets = [os.path.join(tmp_path, 'file{}'.format(i))
+               for i in range(len(sizes))]
+    durations = []
+    failed = []
+
+    def callback(url, target, status, duration):
+        durations.append(duration)
+        if status not in (0, 200):
+            failed.append(url)
+
+    kwargs = {'backend': backend, 'callback': callback}
+    if backend == 'async':
+        kwargs['concurrency'] = concurrency
+    else:
+        kwargs['num_proc'] = concurrency
+    try:
+        start = time.time()
+        download(urls, targets, **kwargs)
+        elapsed = time.time() - start
+    finally:
+        shutil.rmtree(tmp_path)
+    return {'backend': backend,
+            'concurrency': concurrency,
+            'files': len(sizes),
+            'seconds': elapsed,
+            'files_per_s': len(sizes) / elapsed,
+            'mb_per_s': sum(sizes) / 1024. ** 2 / elapsed,
+            'p50': percentile(durations, 50),
+            'p99': percentile(durations, 99),
+            'failed': len(failed)}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare files/s of results with a baseline.
+
+    Returns
+    -------
+    regressions: list
+        (backend, concurrency, files/s, baseline files/s) of every run that
+        is more than tolerance slower than the baseline
+    """
+    reference = dict(((r['backend'], r['concurrency']), r['files_per_s'])
+                     for r in baseline)
+    regressions = []
+    for result in results:
+        key = (result['backend'], result['concurrency'])
+        if key not in reference:
+            continue
+        if result['files_per_s'] < reference[key] * (1 - tolerance):
+            regressions.append(key + (result['files_per_s'], reference[key]))
+    return regressions
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description="Benchmark datedown backends against a local HTTP server.")
+    parser.add_argument("--backends", nargs='+',
+                        default=['wget', 'http', 'async'],
+                        choices=['wget', 'http', 'async'],
+                        help='Backends to benchmark.')
+    parser.add_argument("--concurrency", nargs='+', type=int,
+                        default=[1, 4, 16],
+                        help='Number of workers or concurrent transfers.')
+    parser.add_argument("--files", type=int, default=200,
+                        help='Number of files per run.')
+    parser.add_argument("--sizes", default='fixed:64K',
+                        help=('Distribution of the file sizes: fixed:SIZE, '
+                              'uniform:MIN:MAX or lognormal:MEDIAN:SIGMA.'))
+    parser.add_argument("--latency", type=float, default=0.,
+                        help='Seconds the server waits before every response.')
+    parser.add_argument("--bandwidth", type=parse_size,
+                        help='Bytes per second and connection, e.g. 10M.')
+    parser.add_argument("--seed", type=int, default=0,
+                        help='Seed of the file sizes.')
+    parser.add_argument("--output",
+                        help='Write the results to this JSON file.')
+    parser.add_argument("--compare",
+                        help='JSON file of an earlier run to compare with.')
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help='Allowed relative slowdown compared to the baseline.')
+    return parser.parse_args(args)
+
+
+def main(args):
+    args = parse_args(args)
+    sizes = file_sizes(args.sizes, args.files, seed=args.seed)
+    server, url = start_server(latency=args.latency,
+                               bandwidth=args.bandwidth)
+    results = []
+    print('{:>6} {:>11} {:>9} {:>8} {:>8} {:>8} {:>6}'.format(
+        'engine', 'concurrency', 'files/s', 'MB/s', 'p50', 'p99', 'failed'))
+    try:
+        for backend in args.backends:
+            for concurrency in args.concurrency:
+                result = run(url, sizes, backend, concurrency)
+                results.append(result)
+                print('{backend:>6} {concurrency:>11} {files_per_s:>9.1f} '
+                      '{mb_per_s:>8.2f} {p50:>8.4f} {p99:>8.4f} '
+                      '{failed:>6}'.format(**result))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if args.output is not None:
+        with open(args.output, 'w') as fid:
+            json.dump({'settings': {'files': args.files,
+                                    'sizes': args.sizes,
+                                    'latency': args.latency,
+                                    'bandwidth': args.bandwidth,
+                                    'seed': args.seed},
+                       'results': results}, fid, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as fid:
+            baseline = json.load(fid)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for backend, concurrency, value, reference in regressions:
+            print('regression: {} with concurrency {}: {:.1f} files/s, '
+                  'baseline {:.1f} files/s'.format(backend, concurrency,
+                                                   value, reference))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
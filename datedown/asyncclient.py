@@ -0,0 +1,549 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Download engine that runs many transfers concurrently on one asyncio
+event loop.
+
+Implements the small subset of HTTP/1.1 that is needed for downloading
+files on top of asyncio streams: keep-alive connections, chunked and
+fixed length bodies, redirects, basic authentication and cookies.
+This module needs Python 3.5 or newer.
+'''
+
+import asyncio
+import email.parser
+import os
+import ssl
+import time
+from http.cookiejar import CookieJar
+from urllib.parse import urlsplit, urljoin
+from urllib.request import Request
+
+from datedown.fname_creator import part_fname, replace
+from datedown.httpclient import write_mode, is_complete, announced_size
+from datedown.httpclient import basic_auth, same_origin, basic_challenge
+from datedown.scheduler import TokenBucket
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class Response(object):
+    """
+    Status and headers of a HTTP response.
+    Provides the info method so that it can be used with a CookieJar.
+    """
+
+    def __init__(self, version, status, headers):
+        self.version = version
+        self.status = status
+        self.headers = headers
+
+    def info(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class ConnectionPool(object):
+    """
+    Pool of idle keep-alive connections per scheme and host.
+    Only to be used from within one event loop.
+
+    Parameters
+    ----------
+    maxsize: int, optional
+        Maximum number of idle connections to keep per host.
+    timeout: float, optional
+        Timeout in seconds for connecting and for every read.
+    """
+
+    def __init__(self, maxsize=100, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = {}
+        self._ssl_context = None
+
+    async def get(self, scheme, netloc):
+        """
+        Get a connection to a host. Idle connections are reused if possible.
+
+        Returns
+        -------
+        reader: asyncio.StreamReader
+        writer: asyncio.StreamWriter
+        reused: boolean
+            True if the connection was used before
+        """
+        idle = self._idle.get((scheme, netloc))
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        if scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL scheme {}".format(scheme))
+        parts = urlsplit('//' + netloc)
+        context = None
+        port = parts.port or 80
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            context = self._ssl_context
+            port = parts.port or 443
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port, ssl=context),
+            self.timeout)
+        return reader, writer, False
+
+    def put(self, scheme, netloc, reader, writer):
+        """
+        Give a connection back after the response was read completely.
+        """
+        idle = self._idle.setdefault((scheme, netloc), [])
+        if len(idle) < self.maxsize:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for reader, writer in conns:
+                writer.close()
+
+
+async def _read_head(reader, timeout):
+    """
+    Read status line and headers of a response.
+    """
+    status_line = await asyncio.wait_for(reader.readline(), timeout)
+    if not status_line:
+        raise ConnectionResetError("Connection closed by server")
+    version, status = status_line.decode('latin-1').split(None, 2)[:2]
+    lines = []
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        lines.append(line.decode('latin-1'))
+    headers = email.parser.Parser().parsestr(''.join(lines), headersonly=True)
+    return Response(version, int(status), headers)
+
+
+async def _read_body(reader, response, fid, timeout, blocksize=65536,
+                     limiter=None):
+    """
+    Read the body of a response and write it to fid if fid is not None.
+    If a datedown.scheduler.BandwidthLimiter is given the reading waits
+    after every block until the limit allows the next one.
+
+    Returns
+    -------
+    reusable: boolean
+        True if the connection can be used for another request.
+    """
+    async def write(block):
+        if fid is not None:
+            fid.write(block)
+        if limiter is not None:
+            wait = limiter.reserve(len(block))
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    if response.status in (204, 304) or 100 <= response.status < 200:
+        return True
+    if response.getheader('Transfer-Encoding', '').lower() == 'chunked':
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), timeout)
+            size = int(size_line.split(b';')[0].strip(), 16)
+            if size == 0:
+                # skip trailers
+                while await asyncio.wait_for(reader.readline(), timeout) \
+                        not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            await write(await asyncio.wait_for(reader.readexactly(size),
+                                               timeout))
+            await asyncio.wait_for(reader.readline(), timeout)
+    elif response.getheader('Content-Length') is not None:
+        remaining = int(response.getheader('Content-Length'))
+        while remaining > 0:
+            block = await asyncio.wait_for(
+                reader.read(min(blocksize, remaining)), timeout)
+            if not block:
+                raise ConnectionResetError("Connection closed during transfer")
+            await write(block)
+            remaining -= len(block)
+    else:
+        while True:
+            block = await asyncio.wait_for(reader.read(blocksize), timeout)
+            if not block:
+                break
+            await write(block)
+        return False
+
+    connection = response.getheader('Connection', '').lower()
+    if connection == 'close':
+        return False
+    if response.version == 'HTTP/1.0' and connection != 'keep-alive':
+        return False
+    return True
+
+
+async def fetch(url, target, pool, username=None, password=None,
+                cookiejar=None, max_redirects=10, resume=False,
+                manifest=None, makedirs=True, limiter=None, sizes=None):
+    """
+    Download one url and stream the body to the target file.
+
+    Parameters
+    ----------
+    url: string
+        URL to download
+    target: string
+        path on local filesystem where to store the downloaded file
+    pool: ConnectionPool
+        pool of connections to use
+    username: string, optional
+        username for HTTP basic authentication. Like in
+        datedown.httpclient.download other hosts only get the credentials
+        if they ask for them.
+    password: string, optional
+        password for HTTP basic authentication
+    cookiejar: http.cookiejar.CookieJar, optional
+        cookie jar that is sent with and updated from every request
+    max_redirects: int, optional
+        maximum number of redirects to follow
+    resume: boolean, optional
+        If set the file is downloaded to target.part and renamed to target
+        once it is complete. An existing target.part is continued with a
+        HTTP Range request.
+    manifest: datedown.manifest.Manifest, optional
+        If given a conditional request is sent for targets that are in the
+        manifest and the manifest is updated after successful downloads.
+    makedirs: boolean, optional
+        Create the directory of the target if it does not exist.
+    limiter: datedown.scheduler.BandwidthLimiter, optional
+        bandwidth limit that is shared with other transfers
+    sizes: dict, optional
+        If given the size of the file that the server announced is
+        stored in it by target, see datedown.validate.expected_size.
+
+    Returns
+    -------
+    status: int
+        HTTP status code of the final response or None if
+        no response could be received. 200 if a resumed download
+        was completed, 304 if the target is unchanged.
+    """
+    if makedirs:
+        os.makedirs(os.path.split(target)[0] or os.curdir, exist_ok=True)
+
+    part = part_fname(target) if resume else target
+    offset = 0
+    if resume and os.path.exists(part):
+        offset = os.path.getsize(part)
+    conditional = {}
+    if manifest is not None:
+        conditional = manifest.conditional_headers(target)
+    auth = None
+    if username is not None:
+        auth = basic_auth(username, password)
+    # credentials are only sent to other hosts if they ask for them
+    origin = url
+    challenged = None
+
+    for redirect in range(max_redirects + 1):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        headers = ['GET {} HTTP/1.1'.format(path),
+                   'Host: {}'.format(parts.netloc),
+                   'User-Agent: datedown',
+                   'Accept-Encoding: identity']
+        send_auth = auth is not None and (same_origin(origin, url) or
+                                          url == challenged)
+        if send_auth:
+            headers.append('Authorization: ' + auth)
+        if cookiejar is not None:
+            req = Request(url)
+            cookiejar.add_cookie_header(req)
+            for name, value in req.unredirected_hdrs.items():
+                headers.append('{}: {}'.format(name, value))
+        if offset > 0:
+            headers.append('Range: bytes={}-'.format(offset))
+        for name, value in conditional.items():
+            headers.append('{}: {}'.format(name, value))
+        head = ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1')
+
+        for attempt in range(2):
+            try:
+                reader, writer, reused = await pool.get(parts.scheme,
+                                                        parts.netloc)
+            except (OSError, asyncio.TimeoutError):
+                return None
+            try:
+                writer.write(head)
+                response = await _read_head(reader, pool.timeout)
+                break
+            except (OSError, ValueError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError):
+                writer.close()
+                if not reused or attempt == 1:
+                    return None
+
+        if cookiejar is not None:
+            cookiejar.extract_cookies(response, Request(url))
+
+        location = None
+        if response.status in REDIRECT_CODES:
+            location = response.getheader('Location')
+        content_range = response.getheader('Content-Range')
+        mode = write_mode(response.status, offset, content_range)
+        try:
+            if location is None and mode is not None:
+                with open(part, mode) as fid:
+                    reusable = await _read_body(reader, response, fid,
+                                                pool.timeout,
+                                                limiter=limiter)
+            else:
+                reusable = await _read_body(reader, response, None,
+                                            pool.timeout, limiter=limiter)
+        except (OSError, ValueError, asyncio.TimeoutError,
+                asyncio.IncompleteReadError):
+            writer.close()
+            # partial files are kept to resume from them later
+            if not resume and mode is not None and os.path.exists(part):
+                os.remove(part)
+            return None
+
+        if reusable:
+            pool.put(parts.scheme, parts.netloc, reader, writer)
+        else:
+            writer.close()
+
+        if response.status == 401 and auth is not None and not send_auth \
+                and basic_challenge(response.getheader('WWW-Authenticate')):
+            # a host we were redirected to asks for the credentials
+            challenged = url
+            continue
+        if location is None:
+            status = response.status
+            if sizes is not None and mode is not None:
+                size = announced_size(status,
+                                      response.getheader('Content-Length'),
+                                      content_range)
+                if size is not None:
+                    sizes[target] = size
+            if resume and is_complete(status, offset, content_range):
+                replace(part, target)
+                status = 200
+            elif resume and status == 206 and mode is None:
+                # unexpected range, start from scratch next time
+                os.remove(part)
+            if manifest is not None and status == 200:
+                manifest.update(target,
+                                etag=response.getheader('ETag'),
+                                last_modified=response.getheader('Last-Modified'))
+            return status
+        url = urljoin(url, location)
+
+    return response.status
+
+
+async def download_all(url_targets, concurrency=100, username=None,
+                       password=None, max_per_host=None, rate_per_host=None,
+                       resume=False, manifest=None, retry=None,
+                       callback=None, makedirs=True, cookiejar=None,
+                       on_retry=None, limiter=None, sizes=None, pool=None,
+                       buckets=None):
+    """
+    Download (url, target) pairs with at most concurrency
+    transfers in flight at the same time.
+
+    A pool and the token buckets of rate_per_host can be passed to keep
+    the connections and request rates for later calls in the same loop.
+    A pool that is passed is not closed.
+
+    Returns
+    -------
+    statuses: list
+        HTTP status of every download in the order of url_targets
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(maxsize=concurrency)
+    if cookiejar is None:
+        cookiejar = CookieJar()
+    semaphore = asyncio.Semaphore(concurrency)
+    host_semaphores = {}
+    if buckets is None:
+        buckets = {}
+
+    async def host_slot(host):
+        if rate_per_host is not None:
+            if host not in buckets:
+                buckets[host] = TokenBucket(rate_per_host)
+            while True:
+                wait = buckets[host].consume()
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        if max_per_host is None:
+            return None
+        if host not in host_semaphores:
+            host_semaphores[host] = asyncio.Semaphore(max_per_host)
+        await host_semaphores[host].acquire()
+        return host_semaphores[host]
+
+    async def bounded_fetch(url, target):
+        # wait for the host first so that throttled hosts
+        # do not block the global slots
+        host_semaphore = await host_slot(urlsplit(url).netloc)
+        try:
+            async with semaphore:
+                # only the transfer is timed, not the wait for a slot
+                start = time.time()
+                status = await fetch(url, target, pool,
+                                     username=username,
+                                     password=password,
+                                     cookiejar=cookiejar,
+                                     resume=resume,
+                                     manifest=manifest,
+                                     makedirs=makedirs,
+                                     limiter=limiter,
+                                     sizes=sizes)
+                return status, time.time() - start
+        finally:
+            if host_semaphore is not None:
+                host_semaphore.release()
+
+    async def retried_fetch(url, target):
+        attempt = 1
+        while True:
+            status, duration = await bounded_fetch(url, target)
+            if retry is None or not retry.should_retry(status, attempt):
+                if callback is not None:
+                    callback(url, target, status, duration)
+                return status
+            if on_retry is not None:
+                on_retry((url, target), status)
+            # the slots are free while waiting for the next attempt
+            await asyncio.sleep(retry.delay(attempt))
+            attempt += 1
+
+    try:
+        return await asyncio.gather(*[retried_fetch(url, target)
+                                      for url, target in url_targets])
+    finally:
+        if own_pool:
+            pool.close()
+
+
+def download(urls, targets, concurrency=100, username=None, password=None,
+             max_per_host=None, rate_per_host=None, resume=False,
+             manifest=None, retry=None, callback=None, makedirs=True,
+             cookiejar=None, on_retry=None, limiter=None, sizes=None,
+             loop=None, pool=None, buckets=None):
+    """
+    Download the urls and store them at the target filenames
+    using one asyncio event loop.
+
+    Parameters
+    ----------
+    urls: iterable
+        iterable over url strings
+    targets: iterable
+        paths where to store the files
+    concurrency: int, optional
+        maximum number of transfers in flight at the same time
+    username: string, optional
+        Username to use for login
+    password: string, optional
+        Password to use for login
+    max_per_host: int, optional
+        maximum number of transfers in flight per host
+    rate_per_host: float, optional
+        maximum number of transfers started per second and host
+    resume: boolean, optional
+        download to .part files and resume them if they exist
+    manifest: datedown.manifest.Manifest, optional
+        manifest for conditional requests
+    retry: datedown.retry.RetryPolicy, optional
+        policy for trying failed downloads again
+    callback: function, optional
+        called as callback(url, target, status, duration)
+        after every finished download
+    makedirs: boolean, optional
+        create the directories of the targets if they do not exist
+    cookiejar: http.cookiejar.CookieJar, optional
+        cookies to start with, e.g. of a datedown.auth.AuthSession
+    on_retry: function, optional
+        called as on_retry((url, target), status) before a failed
+        download is tried again
+    limiter: datedown.scheduler.BandwidthLimiter, optional
+        bandwidth limit of all transfers together
+    sizes: dict, optional
+        announced file sizes by target
+    loop: asyncio.AbstractEventLoop, optional
+        loop that runs the downloads and is kept open for later calls.
+        By default a new loop is created and closed.
+    pool: ConnectionPool, optional
+        connections of loop that are kept open for later calls
+    buckets: dict, optional
+        token buckets of rate_per_host by host that are kept
+        for later calls
+
+    Returns
+    -------
+    statuses: list
+        HTTP status of every download
+    """
+    own_loop = loop is None
+    if own_loop:
+        loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            download_all(zip(urls, targets), concurrency=concurrency,
+                         username=username, password=password,
+                         max_per_host=max_per_host,
+                         rate_per_host=rate_per_host,
+                         resume=resume,
+                         manifest=manifest,
+                         retry=retry,
+                         callback=callback,
+                         makedirs=makedirs,
+                         cookiejar=cookiejar,
+                         on_retry=on_retry,
+                         limiter=limiter,
+                         sizes=sizes,
+                         pool=pool,
+                         buckets=buckets))
+    finally:
+        if own_loop:
+            loop.close()
@@ -0,0 +1,189 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Authenticated sessions that are shared by all download workers.
+
+The login, e.g. the redirect chain of NASA Earthdata Login, is done once
+in the main process. The resulting cookies are handed to the workers
+read-only: as a cookie jar for the http and async backends and as a
+cookie file that wget only loads. The session logs in again centrally
+when it is older than max_age or when the server rejects it.
+'''
+
+import os
+import tempfile
+import threading
+import time
+
+try:
+    # Python 3
+    from http.cookiejar import MozillaCookieJar
+    from urllib.request import build_opener, HTTPCookieProcessor
+    from urllib.request import HTTPBasicAuthHandler, HTTPPasswordMgr
+    from urllib.request import Request
+except ImportError:
+    # Python 2
+    from cookielib import MozillaCookieJar
+    from urllib2 import build_opener, HTTPCookieProcessor
+    from urllib2 import HTTPBasicAuthHandler, HTTPPasswordMgr
+    from urllib2 import Request
+
+from datedown.fname_creator import replace
+from datedown.retry import WGET_AUTH_FAILURE
+
+#: statuses after which the session is renewed
+AUTH_FAILURE_CODES = (401, 403, WGET_AUTH_FAILURE)
+
+
+class AnyPasswordMgr(HTTPPasswordMgr):
+    """
+    Password manager that answers every authentication challenge with the
+    same credentials since the login server is only known after the
+    redirects.
+    """
+
+    def __init__(self, username, password):
+        HTTPPasswordMgr.__init__(self)
+        self.username = username
+        self.password = password
+
+    def find_user_password(self, realm, authuri):
+        return self.username, self.password
+
+
+class AuthSession(object):
+    """
+    Login that is done once and shared with all workers.
+
+    Parameters
+    ----------
+    username: string
+        username for the login
+    password: string
+        password for the login
+    login_url: string, optional
+        URL whose request starts the login. By default the first URL
+        that is downloaded.
+    max_age: float, optional
+        seconds after which the session is renewed
+    timeout: float, optional
+        timeout of the login requests in seconds
+    """
+
+    def __init__(self, username, password, login_url=None, max_age=3600,
+                 timeout=60):
+        self.username = username
+        self.password = password
+        self.login_url = login_url
+        self.max_age = max_age
+        self.timeout = timeout
+        self.cookiejar = MozillaCookieJar()
+        self.logged_in = None
+        self._lock = threading.Lock()
+        fd, self.cookie_file = tempfile.mkstemp(prefix='.datedown',
+                                                suffix='.cookies')
+        os.close(fd)
+        self.cookiejar.save(self.cookie_file)
+
+    def login(self, url=None):
+        """
+        Request the login URL, or url if no login URL was given, following
+        all redirects and answering authentication challenges. Only the
+        first byte of the response is requested.
+
+        Parameters
+        ----------
+        url: string, optional
+            URL that starts the login if the session has no login_url
+        """
+        with self._lock:
+            url = self.login_url or url
+            self.login_url = url
+            opener = build_opener(
+                HTTPCookieProcessor(self.cookiejar),
+                HTTPBasicAuthHandler(AnyPasswordMgr(self.username,
+                                                    self.password)))
+            # start a new session instead of sending the expired one
+            self.cookiejar.clear()
+            request = Request(url, headers={'Range': 'bytes=0-0',
+                                            'User-Agent': 'datedown'})
+            try:
+                response = opener.open(request, timeout=self.timeout)
+                response.close()
+            except (IOError, OSError):
+                # the workers report the failure for every file
+                pass
+            self.save()
+            self.logged_in = time.time()
+
+    def save(self):
+        """
+        Write the cookies to the cookie file for wget. The file is replaced
+        atomically so that workers always read a complete file.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.datedown', dir=os.path.dirname(self.cookie_file))
+        os.close(fd)
+        self.cookiejar.save(tmp_path, ignore_discard=True,
+                            ignore_expires=True)
+        replace(tmp_path, self.cookie_file)
+
+    def ensure(self, url=None):
+        """
+        Log in if the session is new or older than max_age.
+        """
+        if (self.logged_in is None or
+                time.time() - self.logged_in > self.max_age):
+            self.login(url)
+
+    def check(self, status, min_interval=10):
+        """
+        Renew the session after a download failed with an authentication
+        error. Many failures in a row only lead to one new login
+        every min_interval seconds.
+
+        Parameters
+        ----------
+        status: int
+            result of a download
+        min_interval: float, optional
+            minimum number of seconds between two logins
+
+        Returns
+        -------
+        renewed: boolean
+            True if the session was renewed
+        """
+        if status not in AUTH_FAILURE_CODES or self.login_url is None:
+            return False
+        if time.time() - self.logged_in < min_interval:
+            return False
+        self.login()
+        return True
+
+    def close(self):
+        """
+        Remove the cookie file.
+        """
+        if os.path.exists(self.cookie_file):
+            os.remove(self.cookie_file)
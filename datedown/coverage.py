@@ -0,0 +1,308 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Coverage of a local archive by the datetimes of its filepaths.
+
+The filepath template of datedown.fname_creator.create_dt_fpath is
+inverted into regular expressions so that the datetimes of the files
+that already exist can be read from the local tree. Only directories that
+match the subdirectory templates are listed.
+'''
+
+import os
+import re
+
+import numpy as np
+
+from datedown.dates import template_resolution
+
+DIRECTIVE = re.compile(r'%(.)')
+
+#: regular expressions of the directives that can be parsed from paths
+FIELD_PATTERNS = {'Y': r'\d{4}', 'y': r'\d{2}', 'm': r'\d{2}', 'd': r'\d{2}',
+                  'j': r'\d{3}', 'H': r'\d{2}', 'M': r'\d{2}', 'S': r'\d{2}'}
+
+#: numpy units of the resolutions of datedown.dates.RESOLUTIONS
+RESOLUTION_UNITS = {'microsecond': 'us', 'second': 's', 'minute': 'm',
+                    'hour': 'h', 'day': 'D', 'month': 'M', 'year': 'Y'}
+
+
+def template_regex(template):
+    """
+    Compile a strftime template of one path component to a regular
+    expression with one named group per directive.
+
+    Parameters
+    ----------
+    template: string
+        strftime template with directives from FIELD_PATTERNS
+
+    Returns
+    -------
+    regex: re.Pattern
+        expression that matches the whole rendered string
+
+    Raises
+    ------
+    ValueError
+        if the template contains a directive that can not be parsed
+    """
+    parts = []
+    seen = set()
+    pos = 0
+    for match in DIRECTIVE.finditer(template):
+        parts.append(re.escape(template[pos:match.start()]))
+        directive = match.group(1)
+        if directive == '%':
+            parts.append('%')
+        elif directive not in FIELD_PATTERNS:
+            raise ValueError("The directive %{} in {} can not be parsed "
+                             "from paths.".format(directive, template))
+        elif directive in seen:
+            # the same field has to have the same value
+            parts.append('(?P={})'.format(directive))
+        else:
+            parts.append('(?P<{}>{})'.format(directive,
+                                             FIELD_PATTERNS[directive]))
+            seen.add(directive)
+        pos = match.end()
+    parts.append(re.escape(template[pos:]))
+    return re.compile(''.join(parts) + '$')
+
+
+def merge_fields(fields, new):
+    """
+    Merge the fields of a path component into the fields of its parents.
+    Returns None if a field has different values.
+    """
+    merged = dict(fields)
+    for key, value in new.items():
+        if merged.setdefault(key, value) != value:
+            return None
+    return merged
+
+
+def scan_dt_fpaths(root, fname, subdirs=[]):
+    """
+    Find the existing files of a create_dt_fpath template and
+    parse their datetimes.
+
+    Parameters
+    ----------
+    root: string
+        root of the filepath
+    fname: string
+        filename template
+    subdirs: list, optional
+        subdirectory templates
+
+    Returns
+    -------
+    dts: numpy.ndarray
+        sorted datetime64[us] array of the datetimes of the existing files.
+        Fields that are not in the templates are set to their minimum.
+    """
+    templates = list(subdirs or []) + [fname]
+    regexes = [template_regex(template) for template in templates]
+    if not any(regex.groupindex for regex in regexes):
+        raise ValueError("The filepath template contains no date.")
+    # (directory, fields) of the directories that match so far
+    current = [(root, {})]
+    for level, (template, regex) in enumerate(zip(templates, regexes)):
+        last = level == len(regexes) - 1
+        found = []
+        for directory, fields in current:
+            if not regex.groupindex:
+                # literal path component
+                name = template.replace('%%', '%')
+                found.append((os.path.join(directory, name), fields))
+                continue
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                match = regex.match(name)
+                if match is None:
+                    continue
+                merged = merge_fields(fields, match.groupdict())
+                if merged is None:
+                    continue
+                path = os.path.join(directory, name)
+                if not last and not os.path.isdir(path):
+                    continue
+                found.append((path, merged))
+        current = found
+    if regexes[-1].groupindex:
+        fields = [fields for path, fields in current]
+    else:
+        fields = [fields for path, fields in current
+                  if os.path.exists(path)]
+    return np.unique(fields_to_datetime64(fields))
+
+
+def fields_to_datetime64(fields):
+    """
+    Convert parsed fields to datetimes.
+
+    Parameters
+    ----------
+    fields: list
+        dictionaries of directive strings as returned by template_regex
+
+    Returns
+    -------
+    dts: numpy.ndarray
+        datetime64[us] array
+    """
+    def column(directive, default):
+        return np.array([int(f.get(directive, default)) for f in fields],
+                        dtype=np.int64)
+
+    if len(fields) == 0:
+        return np.array([], dtype='M8[us]')
+    years = column('Y', -1)
+    short = column('y', 70)
+    # like strptime: 69-99 are 1969-1999, 00-68 are 2000-2068
+    short = np.where(short < 69, short + 2000, short + 1900)
+    years = np.where(years < 0, short, years)
+    dts = (years - 1970).astype('M8[Y]')
+    if any('j' in f for f in fields):
+        days = dts.astype('M8[D]') + (column('j', 1) - 1)
+    else:
+        months = dts.astype('M8[M]') + (column('m', 1) - 1)
+        days = months.astype('M8[D]') + (column('d', 1) - 1)
+    seconds = (column('H', 0) * 3600 + column('M', 0) * 60 +
+               column('S', 0))
+    return (days.astype('M8[s]') + seconds).astype('M8[us]')
+
+
+def truncate_many(dts, resolution):
+    """
+    Truncate a datetime64 array to a resolution of
+    datedown.dates.RESOLUTIONS.
+    """
+    unit = RESOLUTION_UNITS[resolution]
+    return np.asarray(dts, dtype='M8[us]').astype(
+        'M8[{}]'.format(unit)).astype('M8[us]')
+
+
+class Coverage(object):
+    """
+    Index of the periods that are present in a local archive.
+
+    The periods are stored as a sorted datetime64 array at the resolution
+    of the filepath template. Planned datetimes are looked up with one
+    binary search for all of them.
+
+    Parameters
+    ----------
+    dts: numpy.ndarray
+        datetimes of the existing files
+    resolution: string
+        resolution of the filepath template, one of
+        datedown.dates.RESOLUTIONS
+    """
+
+    def __init__(self, dts, resolution):
+        self.resolution = resolution
+        self.periods = np.unique(truncate_many(dts, resolution))
+
+    @classmethod
+    def scan(cls, root, fname, subdirs=[]):
+        """
+        Build the coverage of the files of a create_dt_fpath template
+        that exist below root.
+        """
+        resolution = template_resolution(list(subdirs or []) + [fname])
+        return cls(scan_dt_fpaths(root, fname, subdirs), resolution)
+
+    def __len__(self):
+        return len(self.periods)
+
+    @property
+    def last(self):
+        """
+        Start of the latest period that is present or None.
+        """
+        if len(self.periods) == 0:
+            return None
+        return self.periods[-1]
+
+    def covered(self, dts):
+        """
+        Bitmap of the datetimes whose period is present.
+
+        Parameters
+        ----------
+        dts: numpy.ndarray
+            datetime64 array
+
+        Returns
+        -------
+        covered: numpy.ndarray
+            boolean array
+        """
+        periods = truncate_many(dts, self.resolution)
+        if len(self.periods) == 0:
+            return np.zeros(len(periods), dtype=bool)
+        index = np.searchsorted(self.periods, periods)
+        index = np.minimum(index, len(self.periods) - 1)
+        return self.periods[index] == periods
+
+    def missing(self, dts):
+        """
+        Datetimes whose period is not present.
+        """
+        dts = np.asarray(dts, dtype='M8[us]')
+        return dts[~self.covered(dts)]
+
+    def since_last(self, dts):
+        """
+        Datetimes after the period of the latest present file.
+        """
+        dts = np.asarray(dts, dtype='M8[us]')
+        if self.last is None:
+            return dts
+        return dts[truncate_many(dts, self.resolution) > self.last]
+
+    def gaps(self, dts):
+        """
+        Consecutive runs of missing datetimes.
+
+        Parameters
+        ----------
+        dts: numpy.ndarray
+            sorted datetime64 array of the planned datetimes
+
+        Returns
+        -------
+        gaps: list
+            (first, last) datetime64 of every run of datetimes
+            that are not covered
+        """
+        dts = np.asarray(dts, dtype='M8[us]')
+        missing = np.concatenate([[False], ~self.covered(dts), [False]])
+        edges = np.flatnonzero(np.diff(missing.astype(np.int8)))
+        return [(dts[start], dts[stop - 1])
+                for start, stop in zip(edges[::2], edges[1::2])]
@@ -22,11 +22,53 @@
 
 '''
 Module for getting date lists in different intervals.
-This only covers the basics like n-hourly, n-daily and dekadal.
+Besides the basic n-hourly and n-daily generators the date_range function
+creates minutely, hourly, daily, monthly, yearly, dekadal, pentadal and
+day of year steps as numpy datetime64 arrays without a loop per step.
 For the generation of more complex datetime lists a package like pandas can be used.
 '''
 
 from datetime import timedelta
+import re
+
+import numpy as np
+
+#: resolutions of datetime templates from the finest to the coarsest
+RESOLUTIONS = ['microsecond', 'second', 'minute', 'hour', 'day', 'month',
+               'year']
+
+#: resolution of strftime directives, unknown directives are
+#: treated as microsecond
+DIRECTIVES = {'f': 'microsecond',
+              'S': 'second', 'c': 'second', 'X': 'second', 'T': 'second',
+              's': 'second',
+              'M': 'minute', 'R': 'minute',
+              'H': 'hour', 'I': 'hour', 'k': 'hour', 'l': 'hour',
+              'p': 'hour',
+              'd': 'day', 'e': 'day', 'j': 'day', 'a': 'day', 'A': 'day',
+              'w': 'day', 'u': 'day', 'U': 'day', 'W': 'day', 'V': 'day',
+              'G': 'day', 'g': 'day', 'x': 'day', 'D': 'day', 'F': 'day',
+              'm': 'month', 'b': 'month', 'B': 'month', 'h': 'month',
+              'Y': 'year', 'y': 'year', 'C': 'year',
+              'z': None, 'Z': None, 'n': None, 't': None, '%': None}
+
+DIRECTIVE = re.compile(r'%[-_0^#]?(.)')
+
+#: units of intervals and their spellings
+INTERVAL_UNITS = {'min': 'm', 'T': 'm',
+                  'h': 'h', 'H': 'h',
+                  'd': 'D', 'D': 'D',
+                  'M': 'M', 'mon': 'M', 'month': 'M',
+                  'y': 'Y', 'Y': 'Y', 'year': 'Y',
+                  'dekad': 'dekad', 'pentad': 'pentad', 'doy': 'doy'}
+
+INTERVAL = re.compile(r'^\s*(\d*)\s*([a-zA-Z]+?)s?\s*$')
+
+#: first days of dekads and pentads within a month
+MONTH_DAYS = {'dekad': [0, 10, 20],
+              'pentad': [0, 5, 10, 15, 20, 25]}
+
+ONE_US = np.timedelta64(1, 'us')
 
 
 def daily(start, end):
@@ -117,3 +159,253 @@ def n_hourly(start, end, n):
         if dt > end:
             break
         yield dt
+
+
+def template_resolution(templates):
+    """
+    Find the finest time unit that is used in a list of strftime
+    templates. Datetimes that only differ below this unit result in the
+    same strings for all templates.
+
+    Parameters
+    ----------
+    templates: list
+        strftime templates, None entries are ignored
+
+    Returns
+    -------
+    resolution: string or None
+        one of RESOLUTIONS or None if the templates do not use
+        any datetime directive
+    """
+    resolution = None
+    for template in templates:
+        if template is None:
+            continue
+        for directive in DIRECTIVE.findall(template):
+            unit = DIRECTIVES.get(directive, 'microsecond')
+            if unit is None:
+                continue
+            if (resolution is None or
+                    RESOLUTIONS.index(unit) < RESOLUTIONS.index(resolution)):
+                resolution = unit
+    return resolution
+
+
+def truncate(dt, resolution):
+    """
+    Truncate a datetime to a resolution.
+
+    Parameters
+    ----------
+    dt: datetime.datetime
+        datetime to truncate
+    resolution: string or None
+        one of RESOLUTIONS, None truncates every datetime to None
+
+    Returns
+    -------
+    dt: datetime.datetime
+        datetime with all fields below the resolution set to their minimum
+    """
+    if resolution is None:
+        return None
+    fields = [('microsecond', 0), ('second', 0), ('minute', 0), ('hour', 0),
+              ('day', 1), ('month', 1)]
+    stop = RESOLUTIONS.index(resolution)
+    return dt.replace(**dict(fields[:stop]))
+
+
+def collapse(dts, resolution):
+    """
+    Iterate over the first datetime of every period of the given
+    resolution. Consecutive datetimes that fall into the same period
+    are skipped.
+
+    Parameters
+    ----------
+    dts: iterable
+        iterable over sorted datetime.datetime objects
+    resolution: string or None
+        one of RESOLUTIONS or None
+
+    Yields
+    ------
+    dt: datetime.datetime
+        first datetime of every period
+    """
+    last = object()
+    for dt in dts:
+        period = truncate(dt, resolution)
+        if period == last:
+            continue
+        last = period
+        yield dt
+
+
+def parse_interval(intervalstring):
+    """
+    Parse an interval string like 10min, 6H, 1D, 1M, 1Y, dekad, pentad
+    or 8doy.
+
+    Parameters
+    ----------
+    intervalstring: string
+        number of steps followed by the unit. The number defaults to 1.
+        Units are min, H, D, M (calendar months), Y (calendar years),
+        dekad (1st, 11th and 21st of every month), pentad (1st, 6th, 11th,
+        16th, 21st and 26th of every month) and doy (every n-th day of
+        the year starting on January 1st of every year).
+
+    Returns
+    -------
+    interval: tuple
+        (number, unit) with the unit being one of m, h, D, M, Y,
+        dekad, pentad or doy
+
+    Raises
+    ------
+    ValueError
+        if the string is not a valid interval
+    """
+    match = INTERVAL.match(intervalstring)
+    if match is None:
+        raise ValueError("Invalid interval {}".format(intervalstring))
+    number, unit = match.groups()
+    if unit not in INTERVAL_UNITS:
+        unit = unit.lower()
+    if unit not in INTERVAL_UNITS:
+        raise ValueError("Invalid interval {}".format(intervalstring))
+    number = int(number) if number else 1
+    if number < 1:
+        raise ValueError("Invalid interval {}".format(intervalstring))
+    return number, INTERVAL_UNITS[unit]
+
+
+def _months(start, end, n, day, time):
+    """
+    Every n-th month between start and end at the given day of the month,
+    clipped to the length of the month, and time of day.
+    """
+    months = np.arange(start.astype('M8[M]'), end.astype('M8[M]') + 1, n)
+    first = months.astype('M8[D]')
+    last = (months + 1).astype('M8[D]') - 1
+    days = np.minimum(first + day, last)
+    return days.astype('M8[us]') + time
+
+
+def _month_days(start, end, offsets):
+    """
+    Days with the given offsets in every month between start and end.
+    """
+    months = np.arange(start.astype('M8[M]'), end.astype('M8[M]') + 1)
+    first = months.astype('M8[D]')
+    return (first[:, np.newaxis] + np.array(offsets)).ravel()
+
+
+def _year_days(start, end, n):
+    """
+    Every n-th day of every year between start and end.
+    """
+    years = np.arange(start.astype('M8[Y]'), end.astype('M8[Y]') + 1)
+    first = years.astype('M8[D]')
+    days = first[:, np.newaxis] + np.arange(0, 366, n)
+    return days[days < (years + 1).astype('M8[D]')[:, np.newaxis]]
+
+
+def date_range(start, end, interval):
+    """
+    Create all datetimes between start and end in the given interval
+    as one numpy array.
+
+    Minutes, hours and days are counted from start, months and years keep
+    the day and time of start. Dekads, pentads and days of the year are
+    aligned to the calendar and start with the first step that is not
+    before the day of start.
+
+    Parameters
+    ----------
+    start: datetime.datetime
+        first date
+    end: datetime.datetime
+        last possible date
+    interval: tuple or string
+        (number, unit) as returned by parse_interval or an interval string
+
+    Returns
+    -------
+    dts: numpy.ndarray
+        datetime64[us] array of the datetimes between start and end
+    """
+    if not isinstance(interval, tuple):
+        interval = parse_interval(interval)
+    n, unit = interval
+    start = np.datetime64(start, 'us')
+    end = np.datetime64(end, 'us')
+    if unit in ('m', 'h', 'D'):
+        step = np.timedelta64(n, unit).astype('m8[us]')
+        return np.arange(start, end + ONE_US, step)
+    if unit in ('M', 'Y'):
+        if unit == 'Y':
+            n = n * 12
+        day = start.astype('M8[D]')
+        day_offset = day - start.astype('M8[M]').astype('M8[D]')
+        dts = _months(start, end, n, day_offset, start - day.astype('M8[us]'))
+        return dts[dts <= end]
+    first_day = start.astype('M8[D]')
+    if unit == 'doy':
+        days = _year_days(start, end, n)
+        days = days[days >= first_day]
+    else:
+        days = _month_days(start, end, MONTH_DAYS[unit])
+        days = days[days >= first_day][::n]
+    dts = days.astype('M8[us]')
+    return dts[dts <= end]
+
+
+def datetimes(start, end, interval, chunk_size=100000):
+    """
+    Iterate over the datetimes of date_range as datetime.datetime objects.
+    The datetime64 array is converted in chunks.
+
+    Parameters
+    ----------
+    start: datetime.datetime
+        first date
+    end: datetime.datetime
+        last possible date
+    interval: tuple or string
+        (number, unit) as returned by parse_interval or an interval string
+    chunk_size: int, optional
+        number of datetimes that are converted at once
+
+    Yields
+    ------
+    dt: datetime.datetime
+        datetime object between start and end
+    """
+    for dt in to_datetimes(date_range(start, end, interval), chunk_size):
+        yield dt
+
+
+def to_datetimes(dts, chunk_size=100000):
+    """
+    Iterate over a datetime64 array as datetime.datetime objects.
+    The array is converted in chunks.
+
+    Parameters
+    ----------
+    dts: numpy.ndarray
+        datetime64 array, e.g. from date_range
+    chunk_size: int, optional
+        number of datetimes that are converted at once
+
+    Yields
+    ------
+    dt: datetime.datetime
+        datetime object of every element
+    """
+    dts = np.asarray(dts, dtype='M8[us]')
+    for i in range(0, len(dts), chunk_size):
+        for dt in dts[i:i + chunk_size].tolist():
+            yield dt
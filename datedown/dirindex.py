@@ -0,0 +1,152 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Index of local directories for checking the existence of many files.
+
+Instead of one stat call per file every directory is listed once and
+the names in it are cached. On network filesystems this replaces many
+metadata round-trips by a few directory listings.
+'''
+
+import os
+from multiprocessing.pool import ThreadPool
+
+
+def _list_dir(path):
+    """
+    List the names in a directory.
+
+    Returns
+    -------
+    names: set
+        names of the entries, empty if the directory does not exist.
+    """
+    try:
+        return set(os.listdir(path or os.curdir))
+    except OSError:
+        return set()
+
+
+class DirectoryIndex(object):
+    """
+    Cache of directory listings.
+
+    Only the names are listed. The size of a file is read with one stat
+    call when it is asked for, so that large directories that hold only
+    a few of the checked files are not read file by file.
+
+    Parameters
+    ----------
+    num_threads: int, optional
+        number of directories that are listed at the same time
+    """
+
+    def __init__(self, num_threads=8):
+        self.num_threads = num_threads
+        self.listings = {}
+        self.sizes = {}
+
+    def scan(self, directories, refresh=False):
+        """
+        List directories in parallel threads and cache their content.
+
+        Parameters
+        ----------
+        directories: iterable
+            paths of directories
+        refresh: boolean, optional
+            If set then already cached directories are listed again.
+        """
+        directories = set(directories)
+        if not refresh:
+            directories = directories.difference(self.listings)
+        directories = sorted(directories)
+        if len(directories) == 0:
+            return
+        if len(directories) == 1 or self.num_threads <= 1:
+            listings = [_list_dir(path) for path in directories]
+        else:
+            pool = ThreadPool(min(self.num_threads, len(directories)))
+            try:
+                listings = pool.map(_list_dir, directories)
+            finally:
+                pool.close()
+                pool.join()
+        self.listings.update(zip(directories, listings))
+        # sizes of listed directories are read again
+        listed = set(directories)
+        for path in list(self.sizes):
+            if os.path.dirname(path) in listed:
+                del self.sizes[path]
+
+    def _entries(self, path):
+        directory, name = os.path.split(path)
+        if directory not in self.listings:
+            self.scan([directory])
+        return self.listings[directory], name
+
+    def exists(self, path):
+        """
+        Check if a file exists according to the cached listing
+        of its directory.
+        """
+        entries, name = self._entries(path)
+        return name in entries
+
+    def size(self, path):
+        """
+        Size of a file or None if it does not exist according to the
+        cached listing of its directory. The size is read once.
+        """
+        entries, name = self._entries(path)
+        if name not in entries:
+            return None
+        if path not in self.sizes:
+            try:
+                self.sizes[path] = os.stat(path).st_size
+            except OSError:
+                # removed in the meantime
+                self.sizes[path] = None
+        return self.sizes[path]
+
+    def missing(self, paths, refresh=True):
+        """
+        Find the paths that do not exist.
+        Only the directories of the paths are listed, each one once.
+
+        Parameters
+        ----------
+        paths: list
+            file paths
+        refresh: boolean, optional
+            If set then directories that are already cached
+            are listed again.
+
+        Returns
+        -------
+        missing: list
+            one boolean per path, True if the file does not exist
+        """
+        self.scan(set(os.path.dirname(path) for path in paths),
+                  refresh=refresh)
+        return [not self.exists(path) for path in paths]
@@ -25,21 +25,57 @@ Module that puts the things toghether.
 '''
 
 from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 import tempfile
 import os
+import time
 from functools import partial
+from operator import itemgetter
 
 import datedown.wget as wget
+import datedown.httpclient as httpclient
+import datedown.ftpclient as ftpclient
+from datedown.scheduler import Scheduler, BandwidthLimiter
+from datedown.manifest import Manifest
+from datedown.validate import validate
+from datedown.dirindex import DirectoryIndex
+from datedown.auth import AuthSession
+try:
+    # Python 2
+    from cookielib import CookieJar
+    from urlparse import urlsplit
+except ImportError:
+    # Python 3
+    from http.cookiejar import CookieJar
+    from urllib.parse import urlsplit
 try:
     # Python 2
     from itertools import izip as zip
 except ImportError:
     # Python 3
     pass
+from itertools import chain
+
+
+EXECUTORS = ('thread', 'process', 'inline')
+
+# keyword arguments of download that can be changed for every call
+# of Downloader.download
+DOWNLOAD_DEFAULTS = dict(recursive=False, filetypes=None, concurrency=100,
+                         batch_size=None, max_per_host=None,
+                         rate_per_host=None, resume=False, manifest=None,
+                         chunksize=1, retry=None, segment_threshold=None,
+                         segments=4, callback=None, makedirs=True,
+                         metrics=None, sizes=None)
 
 
 def download(urls, targets, num_proc=1, username=None, password=None,
-             recursive=False, filetypes=None):
+             recursive=False, filetypes=None, backend='wget',
+             concurrency=100, batch_size=None, max_per_host=None,
+             rate_per_host=None, resume=False, manifest=None,
+             chunksize=1, retry=None, segment_threshold=None, segments=4,
+             callback=None, makedirs=True, session=None, metrics=None,
+             max_bandwidth=None, executor='thread', sizes=None):
     """
     Download the urls and store them at the target filenames.
 
@@ -60,22 +96,618 @@ def download(urls, targets, num_proc=1, username=None, password=None,
         The data will then be downloaded recursively and stored in the target folder.
     filetypes: list, optional
         list of file extension to download, any others will no be downloaded
+    backend: string, optional
+        'wget' starts one wget process per file.
+        'http' downloads in num_proc threads of this process that share
+        a pool of persistent connections. Does not support recursive downloads
+        or filetypes.
+        'async' runs up to concurrency transfers on one asyncio event loop.
+        Needs Python 3.5 or newer and does not support recursive downloads
+        or filetypes.
+        'ftp' downloads from FTP servers in num_proc threads that keep
+        one logged in connection per host. The files of every remote
+        directory are downloaded in batches, see batch_size. Does not
+        support recursive downloads, filetypes, manifests or retry.
+    concurrency: int, optional
+        Number of concurrent transfers of the async backend.
+    batch_size: int, optional
+        If given the wget backend downloads up to batch_size files
+        from the same host into the same directory with one wget process.
+        Not possible for recursive downloads.
+        For the ftp backend the maximum number of files of one remote
+        directory per batch. By default the files of every directory are
+        split into num_proc batches.
+    max_per_host: int, optional
+        Maximum number of concurrent downloads from one host.
+        In batch mode this limits the number of wget processes per host.
+    rate_per_host: float, optional
+        Maximum number of downloads started per second and host.
+        In batch mode this limits the number of wget processes started.
+    resume: boolean, optional
+        Download to target.part files and rename them to the target
+        once they are complete. Existing .part files from an earlier
+        attempt are continued with HTTP Range requests instead of being
+        downloaded again. Not used in batch mode and for recursive downloads.
+    manifest: string or datedown.manifest.Manifest, optional
+        Manifest or path of the manifest file in which ETag and
+        Last-Modified of every download are stored. Files that are
+        in the manifest are requested conditionally and not transferred
+        again if they did not change. Only for the http and async backends.
+    chunksize: int, optional
+        Number of downloads that are sent to a worker at once.
+        Larger chunks reduce the overhead of dispatching many small
+        downloads to the worker processes.
+    retry: datedown.retry.RetryPolicy, optional
+        If given, downloads that fail with a transient error like a timeout
+        or a 5xx response are tried again after an exponential backoff
+        while the other downloads continue. Permanent errors like 404 are
+        not retried. Not used in batch mode since wget does not report
+        which file of a batch failed.
+    segment_threshold: int, optional
+        Files of at least this many bytes are split into segments that are
+        downloaded over several connections at the same time and written
+        into the preallocated target. Only for the http backend.
+    segments: int, optional
+        Number of segments per large file.
+    callback: function, optional
+        Called in this process after every finished download as
+        callback(url, target, status, duration) with the status returned by
+        the backend (HTTP status or wget exit status) and the duration
+        of the last attempt in seconds. In batch mode it is called for every
+        file of a batch with the status of the file and the duration of the
+        whole batch.
+    makedirs: boolean, optional
+        If set every worker creates the directory of its target if it does
+        not exist. Can be switched off if the directories were created
+        beforehand, see datedown.fname_creator.create_dirs.
+    session: datedown.auth.AuthSession, optional
+        Login that is shared by all workers. Its cookies are used by the
+        http and async backends and loaded read-only by every wget process.
+        The session logs in before the first download and again if it
+        expired or a download failed with an authentication error.
+        If not given but a username is, the wget backend uses a new
+        session for this call. Not used by the ftp backend.
+    metrics: datedown.metrics.Metrics, optional
+        If given every download and every retry is recorded in it.
+    max_bandwidth: float or datedown.scheduler.BandwidthLimiter, optional
+        Maximum bytes per second of all downloads together. The http, async
+        and ftp backends share one limit so that active transfers use the
+        capacity of idle ones. Pass a BandwidthLimiter to share the limit
+        between several calls. Every wget process is limited to an equal
+        share of max_bandwidth since its rate is fixed when it starts.
+    executor: string, optional
+        How the num_proc parallel downloads are run, see Downloader.
+        The workers are stopped when all downloads are done. Use a
+        Downloader to keep them for several calls.
+    sizes: dict, optional
+        If given the http, async and ftp backends store the size in bytes
+        that the server announced for every downloaded target in it,
+        see datedown.validate.expected_size. The wget backend does not
+        record sizes.
+    """
+    with Downloader(num_proc=num_proc,
+                    executor=executor,
+                    username=username,
+                    password=password,
+                    backend=backend,
+                    session=session,
+                    max_bandwidth=max_bandwidth,
+                    recursive=recursive,
+                    filetypes=filetypes,
+                    concurrency=concurrency,
+                    batch_size=batch_size,
+                    max_per_host=max_per_host,
+                    rate_per_host=rate_per_host,
+                    resume=resume,
+                    manifest=manifest,
+                    chunksize=chunksize,
+                    retry=retry,
+                    segment_threshold=segment_threshold,
+                    segments=segments,
+                    callback=callback,
+                    makedirs=makedirs,
+                    metrics=metrics,
+                    sizes=sizes) as downloader:
+        downloader.download(urls, targets)
+
+
+class InlinePool(object):
+    """
+    Pool that runs every task immediately in the calling thread.
+
+    Implements the part of the multiprocessing.pool.Pool interface
+    that is used by Downloader and datedown.scheduler.Scheduler.
+    """
+
+    def apply_async(self, func, args=(), kwds=None, callback=None,
+                    error_callback=None):
+        try:
+            result = func(*args, **(kwds or {}))
+        except Exception as e:
+            if error_callback is None:
+                raise
+            error_callback(e)
+        else:
+            if callback is not None:
+                callback(result)
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        for task in iterable:
+            yield func(task)
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def make_pool(executor='thread', num_proc=1):
+    """
+    Start the workers of an executor.
+
+    Parameters
+    ----------
+    executor: string, optional
+        'thread', 'process' or 'inline', see Downloader
+    num_proc: int, optional
+        Number of workers
+
+    Returns
+    -------
+    pool: multiprocessing.pool.Pool or InlinePool
+        Pool that has to be closed and joined when it is not needed anymore.
+    """
+    if executor == 'process':
+        return Pool(num_proc)
+    if executor == 'thread':
+        return ThreadPool(num_proc)
+    if executor == 'inline':
+        return InlinePool()
+    raise ValueError("Unknown executor {}.".format(executor))
+
+
+class Downloader(object):
+    """
+    Download context that keeps its workers, connections and login
+    for all downloads until it is closed.
+
+    Every call of datedown.down.download starts and stops its own
+    workers. A Downloader starts them with the first download and reuses
+    them for every later call, e.g. for all chunks and passes of
+    datedown.interface.download_by_dt and for several datasets.
+    The async backend keeps its event loop, its connections and the
+    request rates per host in the same way.
+    It can be passed as download_fn directly. Close it or use it as
+    a context manager when all downloads are done.
+
+    Parameters
+    ----------
+    num_proc: int, optional
+        Number of parallel downloads.
+    executor: string, optional
+        'thread' runs the downloads in num_proc threads of this process.
+        This is enough for all backends since the work is done by wget
+        processes or waits for the network.
+        'process' runs them in num_proc worker processes.
+        Only for the wget backend.
+        'inline' runs them one after another in the calling thread,
+        e.g. for debugging.
+        Not used by the async backend.
+    username: string, optional
+        Username to use for login
+    password: string, optional
+        Password to use for login
+    backend: string, optional
+        see datedown.down.download
+    session: datedown.auth.AuthSession, optional
+        see datedown.down.download. A session that is created because
+        only a username is given is closed with the Downloader.
+    max_bandwidth: float or datedown.scheduler.BandwidthLimiter, optional
+        see datedown.down.download. The limit is shared by all calls.
+    pool: multiprocessing.pool.Pool, optional
+        Workers that are shared with other Downloaders, e.g. one for
+        every dataset of a job, so that their downloads are spread over
+        the same num_proc workers. Created by make_pool with the same
+        executor and not closed by the Downloader.
+    scheduler: datedown.scheduler.Scheduler, optional
+        Scheduler that is shared with other Downloaders so that its
+        limits of the parallel downloads, of the downloads per host and
+        of the requests per second and host hold for all of them together.
+        Every download is dispatched by it and the max_per_host and
+        rate_per_host options are not used. Not used by the async backend.
+    **options:
+        Defaults for the other keyword arguments of datedown.down.download.
+        Every one of them can be changed for a single call of download.
+    """
+
+    def __init__(self, num_proc=1, executor='thread', username=None,
+                 password=None, backend='wget', session=None,
+                 max_bandwidth=None, pool=None, scheduler=None, **options):
+        check_backend(backend, executor,
+                      manifest=options.get('manifest') is not None)
+        check_options(options)
+        manifest = options.get('manifest')
+        if manifest is not None and not isinstance(manifest, Manifest):
+            # loaded once for all calls
+            options['manifest'] = Manifest(manifest)
+        self.num_proc = num_proc
+        self.executor = executor
+        self.username = username
+        self.password = password
+        self.backend = backend
+        self.options = options
+        self.limiter = max_bandwidth
+        if max_bandwidth is not None and \
+                not isinstance(max_bandwidth, BandwidthLimiter):
+            self.limiter = BandwidthLimiter(max_bandwidth)
+        if backend == 'ftp':
+            session = None
+        self.own_session = (session is None and username is not None and
+                            backend == 'wget')
+        if self.own_session:
+            session = AuthSession(username, password)
+        self.session = session
+        self.shared_pool = pool
+        self.scheduler = scheduler
+        self.pool = None
+        self.cookie_file = None
+        self.connections = None
+        self.cookiejar = None
+        self.sessions = None
+        self.loop = None
+        self.buckets = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """
+        Start the workers and open the resources that are shared by all
+        downloads. Called by the first download.
+        """
+        if self.closed:
+            raise ValueError("The Downloader is closed.")
+        if self.pool is not None or self.loop is not None:
+            return
+        if self.backend == 'async':
+            # imported here since the module needs Python 3.5
+            import asyncio
+            import datedown.asyncclient as asyncclient
+            self.loop = asyncio.new_event_loop()
+            concurrency = self.options.get('concurrency',
+                                           DOWNLOAD_DEFAULTS['concurrency'])
+            self.connections = asyncclient.ConnectionPool(maxsize=concurrency)
+            self.cookiejar = CookieJar() if self.session is None \
+                else self.session.cookiejar
+            # request rates per host hold across calls
+            self.buckets = {}
+            return
+        self.pool = self.shared_pool
+        if self.pool is None:
+            self.pool = make_pool(self.executor, self.num_proc)
+        if self.backend == 'http':
+            self.connections = httpclient.ConnectionPool(maxsize=self.num_proc)
+            self.cookiejar = CookieJar() if self.session is None \
+                else self.session.cookiejar
+        elif self.backend == 'ftp':
+            self.sessions = ftpclient.Sessions()
+        elif self.session is None:
+            self.cookie_file = tempfile.NamedTemporaryFile()
+
+    def close(self):
+        """
+        Wait for the workers to stop and close all shared resources.
+        Calling close again does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.pool is not None and self.pool is not self.shared_pool:
+            self.pool.close()
+            self.pool.join()
+        if self.cookie_file is not None:
+            self.cookie_file.close()
+        if self.connections is not None:
+            self.connections.close()
+        if self.loop is not None:
+            import asyncio
+            # let the closed connections shut down their sockets
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+        if self.sessions is not None:
+            self.sessions.close()
+        if self.own_session:
+            self.session.close()
+
+    def download(self, urls, targets, **options):
+        """
+        Download the urls and store them at the target filenames.
+
+        Parameters
+        ----------
+        urls: iterable
+            iterable over url strings
+        targets: iterable
+            paths where to store the files
+        **options:
+            keyword arguments of datedown.down.download that replace
+            the defaults of the Downloader for this call
+        """
+        check_options(options)
+        kwargs = dict(DOWNLOAD_DEFAULTS)
+        kwargs.update(self.options)
+        kwargs.update(options)
+        recursive = kwargs['recursive']
+        manifest = kwargs['manifest']
+        retry = kwargs['retry']
+        callback = kwargs['callback']
+        metrics = kwargs['metrics']
+        makedirs = kwargs['makedirs']
+        backend = self.backend
+        num_proc = self.num_proc
+        limiter = self.limiter
+        session = self.session
+
+        if backend != 'wget' and recursive:
+            raise ValueError("Recursive downloads are only possible "
+                             "with the wget backend.")
+        if manifest is not None:
+            check_backend(backend, manifest=True)
+            if not isinstance(manifest, Manifest):
+                manifest = Manifest(manifest)
+        self.start()
+
+        on_retry = None
+        if metrics is not None:
+            callback = metrics.callback(callback)
+            on_retry = partial(retried, metrics)
+        if session is not None:
+            urls = iter(urls)
+            first = next(urls, None)
+            if first is None:
+                return
+            urls = chain([first], urls)
+            session.ensure(first)
+
+        if backend == 'async':
+            # imported here since the module needs Python 3.5
+            import datedown.asyncclient as asyncclient
+            asyncclient.download(urls, targets,
+                                 concurrency=kwargs['concurrency'],
+                                 username=self.username,
+                                 password=self.password,
+                                 max_per_host=kwargs['max_per_host'],
+                                 rate_per_host=kwargs['rate_per_host'],
+                                 resume=kwargs['resume'],
+                                 manifest=manifest,
+                                 retry=retry,
+                                 callback=callback,
+                                 makedirs=makedirs,
+                                 cookiejar=self.cookiejar,
+                                 on_retry=on_retry,
+                                 limiter=limiter,
+                                 sizes=kwargs['sizes'],
+                                 loop=self.loop,
+                                 pool=self.connections,
+                                 buckets=self.buckets)
+            if manifest is not None:
+                manifest.save()
+            return
+
+        tasks = zip(urls, targets)
+        if backend == 'http':
+            dlfunc = partial(httpclient.map_download,
+                             username=self.username,
+                             password=self.password,
+                             pool=self.connections,
+                             cookiejar=self.cookiejar,
+                             resume=kwargs['resume'],
+                             manifest=manifest,
+                             segment_threshold=kwargs['segment_threshold'],
+                             segments=kwargs['segments'],
+                             makedirs=makedirs,
+                             limiter=limiter,
+                             sizes=kwargs['sizes'])
+        elif backend == 'ftp':
+            dlfunc = partial(ftpclient.download_batch,
+                             username=self.username,
+                             password=self.password,
+                             sessions=self.sessions,
+                             resume=kwargs['resume'],
+                             makedirs=makedirs,
+                             limiter=limiter,
+                             sizes=kwargs['sizes'])
+            tasks = ftpclient.group_dirs(urls, targets,
+                                         batch_size=kwargs['batch_size'],
+                                         num_batches=num_proc)
+            # batches return one status per file
+            retry = None
+        else:
+            # partial function for Pool.map
+            if session is None:
+                wget_args = dict(cookie_file=self.cookie_file.name)
+            else:
+                wget_args = dict(cookie_file=session.cookie_file,
+                                 save_cookies=False)
+            if limiter is not None:
+                wget_args['limit_rate'] = max(1, int(limiter.rate / num_proc))
+            if kwargs['batch_size'] is not None and not recursive:
+                dlfunc = partial(wget.batch_download,
+                                 username=self.username,
+                                 password=self.password,
+                                 makedirs=makedirs,
+                                 **wget_args)
+                tasks = group_batches(urls, targets, kwargs['batch_size'])
+                retry = None
+            else:
+                dlfunc = partial(wget.map_download,
+                                 username=self.username,
+                                 password=self.password,
+                                 recursive=recursive,
+                                 filetypes=kwargs['filetypes'],
+                                 resume=kwargs['resume'],
+                                 makedirs=makedirs,
+                                 **wget_args)
+
+        dlfunc = partial(timed, dlfunc)
+        if self.scheduler is not None:
+            results = (result for task, result in
+                       self.scheduler.run(self.pool, dlfunc, tasks,
+                                          retry=retry,
+                                          status_fn=itemgetter(1),
+                                          on_retry=on_retry))
+        elif kwargs['max_per_host'] is None and \
+                kwargs['rate_per_host'] is None and retry is None:
+            results = self.pool.imap_unordered(dlfunc, tasks,
+                                               chunksize=kwargs['chunksize'])
+        else:
+            scheduler = Scheduler(num_proc,
+                                  max_per_host=kwargs['max_per_host'],
+                                  rate_per_host=kwargs['rate_per_host'],
+                                  retry=retry,
+                                  status_fn=itemgetter(1),
+                                  on_retry=on_retry)
+            results = (result for task, result in
+                       scheduler.run(self.pool, dlfunc, tasks))
+        for task, status, duration in results:
+            if session is not None:
+                # later downloads use the renewed session
+                for file_status in set(status if isinstance(status, list)
+                                       else [status]):
+                    session.check(file_status)
+                session.ensure()
+            if callback is None:
+                continue
+            if isinstance(task, list):
+                if not isinstance(status, list):
+                    status = [status] * len(task)
+                for (url, target), file_status in zip(task, status):
+                    callback(url, target, file_status, duration)
+            else:
+                callback(task[0], task[1], status, duration)
+
+        if manifest is not None:
+            manifest.save()
+
+    __call__ = download
+
+
+def check_options(options):
+    """
+    Raise a TypeError if options contains keyword arguments that
+    can not be set per call of Downloader.download.
+    """
+    unknown = set(options) - set(DOWNLOAD_DEFAULTS)
+    if unknown:
+        raise TypeError("Unknown download options: {}".format(
+            ', '.join(sorted(unknown))))
+
+
+def check_backend(backend, executor='thread', manifest=False):
+    """
+    Raise a ValueError if a backend can not be used with the executor
+    or with conditional downloads.
+
+    Parameters
+    ----------
+    backend: string
+        see datedown.down.download
+    executor: string, optional
+        see Downloader
+    manifest: boolean, optional
+        True if a manifest is used
+    """
+    if executor not in EXECUTORS:
+        raise ValueError("Unknown executor {}.".format(executor))
+    if executor == 'process' and backend != 'wget':
+        raise ValueError("The {} backend needs the thread or inline "
+                         "executor.".format(backend))
+    if manifest and backend in ('wget', 'ftp'):
+        raise ValueError("Conditional downloads with a manifest are "
+                         "not possible with the {} backend.".format(backend))
+
+
+def retried(metrics, task, status):
+    """
+    Record a retry of a (url, target) task in metrics.
+    """
+    metrics.record_retry(task[0], task[1], status)
+
+
+def timed(func, task):
+    """
+    Run func on a task and measure how long it takes.
+
+    Parameters
+    ----------
+    func: function
+        function that takes the task as only argument
+    task: object
+        task for func
+
+    Returns
+    -------
+    task: object
+        the task
+    result: object
+        return value of func
+    duration: float
+        duration of the call in seconds
+    """
+    start = time.time()
+    result = func(task)
+    return task, result, time.time() - start
+
+
+def group_batches(urls, targets, batch_size):
     """
-    p = Pool(num_proc)
-    # partial function for Pool.map
-    cookie_file = tempfile.NamedTemporaryFile()
-    dlfunc = partial(wget.map_download,
-                     username=username,
-                     password=password,
-                     cookie_file=cookie_file.name,
-                     recursive=recursive,
-                     filetypes=filetypes)
+    Group urls and targets into batches that can be downloaded by
+    one wget process. All urls of a batch are on the same host, all targets
+    are in the same directory and no two urls of a batch have the same filename.
+    Urls with a query or without a filename get a batch of their own since
+    wget does not store them under datedown.wget.url_fname.
+
+    Parameters
+    ----------
+    urls: iterable
+        iterable over url strings
+    targets: iterable
+        paths where to store the files
+    batch_size: int
+        maximum number of files per batch
 
-    p.map_async(dlfunc, zip(urls, targets)).get(9999999)
-    cookie_file.close()
+    Returns
+    -------
+    batches: list
+        list of lists of (url, target) tuples
+    """
+    batches = []
+    open_batches = {}
+    for url, target in zip(urls, targets):
+        if urlsplit(url).query or not wget.url_fname(url):
+            batches.append([(url, target)])
+            continue
+        key = (urlsplit(url).netloc, os.path.dirname(target))
+        batch, fnames = open_batches.get(key, (None, None))
+        fname = wget.url_fname(url)
+        if batch is None or len(batch) >= batch_size or fname in fnames:
+            batch, fnames = [], set()
+            batches.append(batch)
+            open_batches[key] = (batch, fnames)
+        batch.append((url, target))
+        fnames.add(fname)
+    return batches
 
 
-def check_downloaded(urls, targets):
+def check_downloaded(urls, targets, validators=None, index=None):
     """
     Check if files that should be downloaded exist.
     If not then return a list of not downloaded URLs.
@@ -86,6 +718,14 @@ def check_downloaded(urls, targets):
         iterable over url strings
     targets: iterable
         paths where to store the files
+    validators: list, optional
+        If given, existing files are also checked with these validator
+        functions, see datedown.validate. Invalid files are deleted
+        and reported as not downloaded.
+    index: datedown.dirindex.DirectoryIndex, optional
+        Index that is used to check the existence of the targets.
+        Every directory is listed once instead of checking every file.
+        The directories of the targets are listed again on every call.
 
     Returns
     -------
@@ -94,11 +734,26 @@ def check_downloaded(urls, targets):
     not_fnames: list
         list of filenames that do not exist locally
     """
+    if index is None:
+        index = DirectoryIndex()
+    urls = list(urls)
+    targets = list(targets)
     not_urls = []
     not_fnames = []
-    for url, target in zip(urls, targets):
-        if not os.path.exists(target):
+    existing = []
+    for url, target, missing in zip(urls, targets, index.missing(targets)):
+        if missing:
             not_urls.append(url)
             not_fnames.append(target)
+        elif validators is not None:
+            existing.append((url, target))
+
+    if existing:
+        valid = validate([target for url, target in existing], validators)
+        for (url, target), ok in zip(existing, valid):
+            if not ok:
+                os.remove(target)
+                not_urls.append(url)
+                not_fnames.append(target)
 
     return not_urls, not_fnames
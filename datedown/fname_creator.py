@@ -25,6 +25,9 @@ Module for creating the filenames from the datetimes.
 '''
 
 import os
+from multiprocessing.pool import ThreadPool
+
+from datedown.urlcreator import DtTemplate
 
 
 def create_dt_fpath(dt, root, fname, subdirs=[]):
@@ -59,3 +62,130 @@ def create_dt_fpath(dt, root, fname, subdirs=[]):
     flist = [root] + dt_subdirs + [dt_fname]
     fpath = os.path.join(*flist)
     return fpath
+
+
+def compile_dt_fpath(root, fname, subdirs=[]):
+    """
+    Compile the filepath template of create_dt_fpath.
+
+    Parameters
+    ----------
+    root: string
+        root of the filepath
+    fname: string
+        filename to use
+    subdirs: list, optional
+        list of strings.
+        Each element represents a subdirectory.
+
+    Returns
+    -------
+    template: datedown.urlcreator.DtTemplate
+        callable that creates the same filepaths as create_dt_fpath and
+        renders many datetimes at once with render_many
+    """
+    template = os.path.join(*(list(subdirs or []) + [fname]))
+    if os.path.isabs(template):
+        prefix = ''
+    else:
+        # os.path.join adds a separator to root only if needed
+        prefix = os.path.join(root, 'x')[:-1]
+    return DtTemplate(prefix, template, sep=os.sep)
+
+
+def makedirs(path):
+    """
+    Create a directory and its parents. Does not fail if the directory
+    exists or is created by another process at the same time.
+
+    Parameters
+    ----------
+    path: string
+        directory to create
+    """
+    if path == '':
+        return
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+
+def create_dirs(fpaths, num_threads=8, exclude=None):
+    """
+    Create the directories of many filepaths once. Only the deepest
+    directories are created explicitly, their parents are created
+    along the way. Independent directories are created in parallel threads.
+
+    Parameters
+    ----------
+    fpaths: iterable
+        filepaths whose directories should exist
+    num_threads: int, optional
+        number of directories that are created at the same time
+    exclude: set, optional
+        directories that are known to exist already
+
+    Returns
+    -------
+    dirs: set
+        directories of the filepaths
+    """
+    dirs = set(os.path.dirname(fpath) for fpath in fpaths)
+    dirs.discard('')
+    new = dirs.difference(exclude or ())
+    parents = set()
+    for path in new:
+        parent = os.path.dirname(path)
+        while parent and parent != path and parent not in parents:
+            parents.add(parent)
+            path, parent = parent, os.path.dirname(parent)
+    leaves = sorted(new.difference(parents))
+    if len(leaves) > 1 and num_threads > 1:
+        pool = ThreadPool(min(num_threads, len(leaves)))
+        try:
+            pool.map(makedirs, leaves)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for path in leaves:
+            makedirs(path)
+    return dirs
+
+
+def part_fname(target):
+    """
+    Filename under which an unfinished download of target is stored.
+
+    Parameters
+    ----------
+    target: string
+        path of the finished download
+
+    Returns
+    -------
+    fpath: string
+        path of the unfinished download
+    """
+    return target + '.part'
+
+
+def replace(src, dst):
+    """
+    Rename src to dst, replacing dst if it exists.
+
+    Parameters
+    ----------
+    src: string
+        existing path
+    dst: string
+        new path
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
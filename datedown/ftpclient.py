@@ -0,0 +1,338 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Download backend for FTP servers that uses ftplib of the Python standard
+library.
+
+Every thread keeps one logged in control connection per host and reuses
+it for all files. Files are downloaded in batches of one remote directory
+so that the working directory is only changed once per batch.
+
+FTP replies are translated to the HTTP status codes used by the other
+backends so that datedown.retry can classify them: 200 for a complete
+file, 404 for a missing file, 401 for failed logins, 503 for transient
+errors (4xx replies) and 403 for other permanent errors.
+'''
+
+import ftplib
+import os
+import posixpath
+import threading
+
+try:
+    # Python 3
+    from urllib.parse import urlsplit, unquote
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit
+    from urllib import unquote
+
+from datedown.fname_creator import part_fname, replace
+import datedown.fname_creator as fname_creator
+
+
+def ftp_status(reply):
+    """
+    HTTP status code for an FTP error reply.
+
+    Parameters
+    ----------
+    reply: string
+        reply of the server starting with the three digit code
+
+    Returns
+    -------
+    status: int
+        HTTP status code
+    """
+    code = str(reply)[:3]
+    if code == '550':
+        return 404
+    if code == '530':
+        return 401
+    if code.startswith('4'):
+        return 503
+    return 403
+
+
+def split_url(url):
+    """
+    Split an FTP url into its parts.
+
+    Returns
+    -------
+    host: tuple
+        (hostname, port, username, password) of the url
+    directory: string
+        remote directory
+    fname: string
+        remote filename
+    """
+    parts = urlsplit(url)
+    path = unquote(parts.path)
+    host = (parts.hostname, parts.port or 21,
+            unquote(parts.username) if parts.username else None,
+            unquote(parts.password) if parts.password else None)
+    return host, posixpath.dirname(path) or '/', posixpath.basename(path)
+
+
+class Sessions(object):
+    """
+    Logged in FTP control connections of every thread.
+
+    Every thread gets its own connection per host which it reuses
+    for all downloads from that host.
+
+    Parameters
+    ----------
+    timeout: float, optional
+        timeout of the connections in seconds
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def get(self, host, username=None, password=None):
+        """
+        Logged in connection of this thread to host.
+
+        Parameters
+        ----------
+        host: tuple
+            (hostname, port, username, password) as returned by split_url.
+            Username and password of the url take precedence.
+        username: string, optional
+            username, anonymous by default
+        password: string, optional
+            password
+        """
+        sessions = getattr(self.local, 'sessions', None)
+        if sessions is None:
+            sessions = self.local.sessions = {}
+        if host not in sessions:
+            hostname, port, url_username, url_password = host
+            ftp = ftplib.FTP()
+            ftp.connect(hostname, port, timeout=self.timeout)
+            ftp.login(url_username or username or 'anonymous',
+                      url_password or password or '')
+            ftp.voidcmd('TYPE I')
+            ftp.current_dir = None
+            sessions[host] = ftp
+            with self.lock:
+                self.connections.append(ftp)
+        return sessions[host]
+
+    def discard(self, host):
+        """
+        Close the connection of this thread to host, e.g. after an error.
+        """
+        ftp = getattr(self.local, 'sessions', {}).pop(host, None)
+        if ftp is not None:
+            ftp.close()
+            with self.lock:
+                self.connections.remove(ftp)
+
+    def close(self):
+        """
+        Log out of all connections of all threads.
+        """
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for ftp in connections:
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+
+
+def remote_size(ftp, fname):
+    """
+    Size of a file in the current remote directory in bytes or None
+    if the server does not tell.
+    """
+    try:
+        # some servers only report sizes in binary mode
+        ftp.voidcmd('TYPE I')
+        return ftp.size(fname)
+    except ftplib.error_perm:
+        return None
+
+
+def retrieve(ftp, directory, fname, target, resume=False, makedirs=True,
+             limiter=None, sizes=None):
+    """
+    Download one file over a logged in connection. If a
+    datedown.scheduler.BandwidthLimiter is given the transfer waits after
+    every block until the limit allows the next one. If a sizes dict is
+    given the size that the server reports is stored in it by target.
+
+    Returns
+    -------
+    status: int
+        HTTP status code
+    """
+    if ftp.current_dir != directory:
+        ftp.cwd(directory)
+        ftp.current_dir = directory
+    if makedirs:
+        fname_creator.makedirs(os.path.split(target)[0])
+
+    fpath = part_fname(target) if resume else target
+    offset = 0
+    if resume and os.path.exists(fpath):
+        offset = os.path.getsize(fpath)
+    if sizes is not None:
+        size = remote_size(ftp, fname)
+        if size is not None:
+            sizes[target] = size
+    try:
+        with open(fpath, 'ab' if offset else 'wb') as fid:
+            def write(block):
+                fid.write(block)
+                if limiter is not None:
+                    limiter.throttle(len(block))
+            ftp.retrbinary('RETR ' + fname, write, rest=offset or None)
+    except ftplib.all_errors as e:
+        if offset and str(e).startswith('554'):
+            # the restart position is the end of the file
+            replace(fpath, target)
+            return 200
+        # keep incomplete downloads only if they can be resumed
+        if not resume or os.path.getsize(fpath) == 0:
+            os.remove(fpath)
+        raise
+    if resume:
+        replace(fpath, target)
+    return 200
+
+
+def download_batch(url_targets, username=None, password=None, sessions=None,
+                   resume=False, makedirs=True, limiter=None, sizes=None):
+    """
+    Download files of one remote directory over the connection of
+    this thread to their host.
+
+    Parameters
+    ----------
+    url_targets: list
+        list of (url, target) tuples of one remote directory
+    username: string, optional
+        username, anonymous by default
+    password: string, optional
+        password
+    sessions: Sessions, optional
+        connections to reuse, a new connection is used if not given
+    resume: boolean, optional
+        download to .part files and continue them if they exist
+    makedirs: boolean, optional
+        create the directories of the targets if they do not exist
+    limiter: datedown.scheduler.BandwidthLimiter, optional
+        bandwidth limit that is shared with other transfers
+    sizes: dict, optional
+        If given the size of every file that the server reports is
+        stored in it by target, see datedown.validate.expected_size.
+
+    Returns
+    -------
+    statuses: list
+        HTTP status code of every file or None if the server could
+        not be reached
+    """
+    own_sessions = sessions is None
+    if own_sessions:
+        sessions = Sessions()
+    statuses = []
+    try:
+        for url, target in url_targets:
+            host, directory, fname = split_url(url)
+            for attempt in (1, 2):
+                reused = host in getattr(sessions.local, 'sessions', {})
+                try:
+                    ftp = sessions.get(host, username, password)
+                    status = retrieve(ftp, directory, fname, target,
+                                      resume=resume, makedirs=makedirs,
+                                      limiter=limiter, sizes=sizes)
+                except ftplib.error_perm as e:
+                    status = ftp_status(e)
+                except ftplib.error_temp as e:
+                    sessions.discard(host)
+                    status = ftp_status(e)
+                    if reused and attempt == 1:
+                        # the server closed the idle connection
+                        continue
+                except ftplib.all_errors:
+                    sessions.discard(host)
+                    status = None
+                    if reused and attempt == 1:
+                        continue
+                break
+            statuses.append(status)
+    finally:
+        if own_sessions:
+            sessions.close()
+    return statuses
+
+
+def group_dirs(urls, targets, batch_size=None, num_batches=1):
+    """
+    Group urls and targets into batches of files in the same
+    remote directory.
+
+    Parameters
+    ----------
+    urls: iterable
+        iterable over url strings
+    targets: iterable
+        paths where to store the files
+    batch_size: int, optional
+        maximum number of files per batch
+    num_batches: int, optional
+        If batch_size is not given the files of every directory are split
+        into this many batches so that several workers can download
+        from a large directory.
+
+    Returns
+    -------
+    batches: list
+        list of lists of (url, target) tuples
+    """
+    dirs = {}
+    order = []
+    for url, target in zip(urls, targets):
+        key = url.rsplit('/', 1)[0]
+        if key not in dirs:
+            dirs[key] = []
+            order.append(key)
+        dirs[key].append((url, target))
+    batches = []
+    for key in order:
+        url_targets = dirs[key]
+        size = batch_size
+        if size is None:
+            size = -(-len(url_targets) // num_batches)
+        for i in range(0, len(url_targets), size):
+            batches.append(url_targets[i:i + size])
+    return batches
@@ -0,0 +1,601 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Download backend that uses the HTTP client of the Python standard library.
+
+Connections are kept alive and shared between all threads of a process so
+that many files from the same host can be downloaded over a handful of
+connections.
+'''
+
+import base64
+import os
+import threading
+
+try:
+    # Python 3
+    import http.client as httplib
+    from urllib.parse import urlsplit, urljoin
+    from urllib.request import Request
+except ImportError:
+    # Python 2
+    import httplib
+    from urlparse import urlsplit, urljoin
+    from urllib2 import Request
+
+from datedown.fname_creator import part_fname, replace
+import datedown.fname_creator as fname_creator
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class ConnectionPool(object):
+    """
+    Pool of persistent HTTP connections.
+
+    Idle connections are stored per scheme and host and handed out again
+    for the next request to the same host. The pool can be shared
+    between threads.
+
+    Parameters
+    ----------
+    maxsize: int, optional
+        Maximum number of idle connections to keep per host.
+    timeout: float, optional
+        Socket timeout in seconds for new connections.
+    """
+
+    def __init__(self, maxsize=16, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, netloc):
+        """
+        Get a connection to a host. Idle connections are reused if possible.
+
+        Parameters
+        ----------
+        scheme: string
+            'http' or 'https'
+        netloc: string
+            host and optionally port
+
+        Returns
+        -------
+        conn: httplib.HTTPConnection
+            connection to the host
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        elif scheme == 'http':
+            return httplib.HTTPConnection(netloc, timeout=self.timeout)
+        raise ValueError("Unsupported URL scheme {}".format(scheme))
+
+    def put(self, scheme, netloc, conn):
+        """
+        Give a connection back to the pool after the response was read
+        completely. If the pool is full the connection is closed.
+        """
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+# pool used by all downloads of this process if no other pool is given
+default_pool = ConnectionPool()
+
+
+def basic_auth(username, password):
+    """
+    Value of the Authorization header for HTTP basic authentication.
+    """
+    credentials = '{}:{}'.format(username, password or '')
+    token = base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+    return 'Basic ' + token
+
+
+def same_origin(url, redirect_url):
+    """
+    Check if credentials for url can be sent to redirect_url without
+    being asked for them. Like requests this is only the case for the same
+    host and port, or the upgrade from http to https on the default ports.
+    """
+    old = urlsplit(url)
+    new = urlsplit(redirect_url)
+    if old.hostname != new.hostname:
+        return False
+    if old.scheme == 'http' and old.port in (80, None) and \
+            new.scheme == 'https' and new.port in (443, None):
+        return True
+    default_port = (DEFAULT_PORTS.get(old.scheme), None)
+    if old.scheme == new.scheme and old.port in default_port and \
+            new.port in default_port:
+        return True
+    return old.scheme == new.scheme and old.port == new.port
+
+
+def basic_challenge(www_authenticate):
+    """
+    Check if a WWW-Authenticate header asks for basic authentication.
+    """
+    return www_authenticate is not None and \
+        'basic' in www_authenticate.lower()
+
+
+def _request(pool, url, headers):
+    """
+    Send a GET request over a pooled connection.
+    If a reused connection was closed by the server in the meantime
+    the request is sent again over a fresh connection.
+
+    Returns
+    -------
+    conn: httplib.HTTPConnection
+        connection the response has to be read from
+    response: httplib.HTTPResponse
+        response with headers already read
+    """
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path = path + '?' + parts.query
+    for attempt in range(2):
+        conn = pool.get(parts.scheme, parts.netloc)
+        reused = conn.sock is not None
+        try:
+            conn.request('GET', path, headers=headers)
+            return conn, conn.getresponse()
+        except (httplib.HTTPException, IOError, OSError):
+            conn.close()
+            if not reused or attempt == 1:
+                raise
+
+
+def download(url, target, username=None, password=None, pool=None,
+             cookiejar=None, max_redirects=10, blocksize=65536,
+             resume=False, manifest=None, segment_threshold=None,
+             segments=4, makedirs=True, limiter=None, sizes=None):
+    """
+    Download a url over a pooled keep-alive connection and stream
+    the response body to the target file.
+
+    Parameters
+    ----------
+    url: string
+        URL to download
+    target: string
+        path on local filesystem where to store the downloaded file
+    username: string, optional
+        username for HTTP basic authentication. The credentials are sent
+        to the host of url and its redirects to the same host. Other hosts
+        only get them if they ask for them with a 401 response.
+    password: string, optional
+        password for HTTP basic authentication
+    pool: ConnectionPool, optional
+        pool of connections to use. By default the pool of this module is used.
+    cookiejar: cookielib.CookieJar, optional
+        cookie jar that is sent with and updated from every request
+    max_redirects: int, optional
+        maximum number of redirects to follow
+    blocksize: int, optional
+        size of the blocks that are written to the target
+    resume: boolean, optional
+        If set the file is downloaded to target.part and renamed to target
+        once it is complete. An existing target.part is continued with a
+        HTTP Range request.
+    manifest: datedown.manifest.Manifest, optional
+        If given a conditional request is sent for targets that are in the
+        manifest and the manifest is updated after successful downloads.
+    segment_threshold: int, optional
+        Files of at least this many bytes are downloaded in segments
+        over several connections at the same time if the server
+        supports Range requests.
+    segments: int, optional
+        number of segments for large files
+    makedirs: boolean, optional
+        Create the directory of the target if it does not exist.
+        Can be switched off if the directories were created beforehand,
+        see datedown.fname_creator.create_dirs.
+    limiter: datedown.scheduler.BandwidthLimiter, optional
+        bandwidth limit that is shared with other transfers
+    sizes: dict, optional
+        If given the size of the file that the server announced is
+        stored in it by target, see datedown.validate.expected_size.
+
+    Returns
+    -------
+    status: int
+        HTTP status code of the final response or None if
+        no response could be received. 200 if a resumed download
+        was completed, 304 if the target is unchanged.
+    """
+    if pool is None:
+        pool = default_pool
+    headers = {'User-Agent': 'datedown'}
+    auth = None
+    if username is not None:
+        auth = basic_auth(username, password)
+    # credentials are only sent to other hosts if they ask for them
+    origin = url
+    challenged = None
+
+    if makedirs:
+        fname_creator.makedirs(os.path.split(target)[0])
+
+    if manifest is not None:
+        headers.update(manifest.conditional_headers(target))
+
+    part = part_fname(target) if resume else target
+    offset = 0
+    if resume and os.path.exists(part):
+        offset = os.path.getsize(part)
+        if offset > 0:
+            headers['Range'] = 'bytes={}-'.format(offset)
+
+    for redirect in range(max_redirects + 1):
+        req_headers = dict(headers)
+        if auth is not None and (same_origin(origin, url) or
+                                 url == challenged):
+            req_headers['Authorization'] = auth
+        if cookiejar is not None:
+            req = Request(url)
+            cookiejar.add_cookie_header(req)
+            req_headers.update(req.unredirected_hdrs)
+        try:
+            conn, response = _request(pool, url, req_headers)
+        except (httplib.HTTPException, IOError, OSError):
+            return None
+        if cookiejar is not None:
+            cookiejar.extract_cookies(response, Request(url))
+
+        parts = urlsplit(url)
+        location = None
+        if response.status in REDIRECT_CODES:
+            location = response.getheader('Location')
+        if segment_threshold is not None and \
+                response.status == 200 and \
+                response.getheader('Accept-Ranges') == 'bytes' and \
+                int(response.getheader('Content-Length', 0)) >= segment_threshold:
+            # abort this transfer and fetch the file in parts
+            conn.close()
+            size = int(response.getheader('Content-Length'))
+            status = download_segments(url, target, size, segments, pool,
+                                       req_headers, blocksize=blocksize,
+                                       limiter=limiter)
+            if manifest is not None and status == 200:
+                manifest.update(target,
+                                etag=response.getheader('ETag'),
+                                last_modified=response.getheader('Last-Modified'))
+            if sizes is not None and status == 200:
+                sizes[target] = size
+            return status
+        mode = write_mode(response.status, offset,
+                          response.getheader('Content-Range'))
+        try:
+            if location is None and mode is not None:
+                written = 0
+                with open(part, mode) as fid:
+                    while True:
+                        block = response.read(blocksize)
+                        if not block:
+                            break
+                        fid.write(block)
+                        written += len(block)
+                        if limiter is not None:
+                            limiter.throttle(len(block))
+                length = response.getheader('Content-Length')
+                if length is not None and written < int(length):
+                    # read returns less at the end of a cut off body
+                    raise httplib.IncompleteRead(b'', int(length) - written)
+            else:
+                response.read()
+        except (httplib.HTTPException, IOError, OSError):
+            conn.close()
+            # partial files are kept to resume from them later
+            if not resume and os.path.exists(part):
+                os.remove(part)
+            return None
+
+        if response.will_close:
+            conn.close()
+        else:
+            pool.put(parts.scheme, parts.netloc, conn)
+
+        if response.status == 401 and auth is not None and \
+                'Authorization' not in req_headers and \
+                basic_challenge(response.getheader('WWW-Authenticate')):
+            # a host we were redirected to asks for the credentials
+            challenged = url
+            continue
+        if location is None:
+            status = response.status
+            if sizes is not None and mode is not None:
+                size = announced_size(status,
+                                      response.getheader('Content-Length'),
+                                      response.getheader('Content-Range'))
+                if size is not None:
+                    sizes[target] = size
+            if resume and is_complete(status, offset,
+                                      response.getheader('Content-Range')):
+                replace(part, target)
+                status = 200
+            elif resume and status == 206 and mode is None:
+                # unexpected range, start from scratch next time
+                os.remove(part)
+            if manifest is not None and status == 200:
+                manifest.update(target,
+                                etag=response.getheader('ETag'),
+                                last_modified=response.getheader('Last-Modified'))
+            return status
+        url = urljoin(url, location)
+
+    return response.status
+
+
+def download_segments(url, target, size, segments, pool, headers,
+                      blocksize=65536, limiter=None):
+    """
+    Download a file in byte ranges over several connections at the same
+    time. The ranges are written into a preallocated target.part file
+    that is renamed to target once all ranges are complete.
+
+    Parameters
+    ----------
+    url: string
+        URL to download, must support Range requests
+    target: string
+        path on local filesystem where to store the downloaded file
+    size: int
+        size of the file in bytes
+    segments: int
+        number of ranges that are downloaded at the same time
+    pool: ConnectionPool
+        pool of connections to use
+    headers: dict
+        headers to send with every request
+    blocksize: int, optional
+        size of the blocks that are written to the target
+    limiter: datedown.scheduler.BandwidthLimiter, optional
+        bandwidth limit that is shared with other transfers
+
+    Returns
+    -------
+    status: int
+        200 if all ranges were downloaded completely, otherwise the
+        status of a failed range or None if no or not the requested
+        range was received.
+    """
+    part = part_fname(target)
+    with open(part, 'wb') as fid:
+        fid.truncate(size)
+
+    headers = dict((name, value) for name, value in headers.items()
+                   if name not in ('Range', 'If-None-Match',
+                                   'If-Modified-Since'))
+    parts = urlsplit(url)
+    bounds = [(i * size // segments, (i + 1) * size // segments - 1)
+              for i in range(segments)]
+    bounds = [(start, end) for start, end in bounds if start <= end]
+    statuses = [None] * len(bounds)
+
+    def fetch(i, start, end):
+        range_headers = dict(headers)
+        range_headers['Range'] = 'bytes={}-{}'.format(start, end)
+        try:
+            conn, response = _request(pool, url, range_headers)
+        except (httplib.HTTPException, IOError, OSError):
+            return
+        try:
+            if response.status != 206 or parse_content_range(
+                    response.getheader('Content-Range'))[0] != start:
+                response.read()
+                # a whole file or another range is not this segment
+                statuses[i] = response.status \
+                    if response.status not in (200, 206) else None
+            else:
+                written = 0
+                # every thread writes through its own file object
+                with open(part, 'r+b') as fid:
+                    fid.seek(start)
+                    while written <= end - start:
+                        block = response.read(blocksize)
+                        if not block:
+                            break
+                        fid.write(block)
+                        written += len(block)
+                        if limiter is not None:
+                            limiter.throttle(len(block))
+                # read returns less at the end of a cut off body
+                statuses[i] = 200 if written == end - start + 1 else None
+        except (httplib.HTTPException, IOError, OSError):
+            conn.close()
+            statuses[i] = None
+            return
+        if response.will_close or statuses[i] != 200:
+            # the rest of a failed body must not be read by the next request
+            conn.close()
+        else:
+            pool.put(parts.scheme, parts.netloc, conn)
+
+    threads = [threading.Thread(target=fetch, args=(i, start, end))
+               for i, (start, end) in enumerate(bounds)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for status in statuses:
+        if status != 200:
+            os.remove(part)
+            return status
+    replace(part, target)
+    return 200
+
+
+def parse_content_range(content_range):
+    """
+    Parse a Content-Range header like ``bytes 100-199/200``
+    or ``bytes */200``.
+
+    Returns
+    -------
+    start: int
+        first byte of the range or None
+    total: int
+        size of the complete file or None if unknown
+    """
+    if content_range is None:
+        return None, None
+    unit, _, spec = content_range.strip().partition(' ')
+    byte_range, _, total = spec.partition('/')
+    start = None
+    if byte_range != '*':
+        start = int(byte_range.split('-')[0])
+    if total in ('*', ''):
+        total = None
+    else:
+        total = int(total)
+    return start, total
+
+
+def announced_size(status, content_length, content_range):
+    """
+    Size of the complete file that a response announces.
+
+    Parameters
+    ----------
+    status: int
+        HTTP status code
+    content_length: string or None
+        Content-Length header
+    content_range: string or None
+        Content-Range header
+
+    Returns
+    -------
+    size: int or None
+        size in bytes or None if the response does not tell
+    """
+    if status == 200 and content_length is not None:
+        return int(content_length)
+    if status == 206:
+        return parse_content_range(content_range)[1]
+    return None
+
+
+def write_mode(status, offset, content_range):
+    """
+    File mode in which the body of a response has to be written
+    when resuming from offset. None if the body is not file content.
+    """
+    if status == 200:
+        return 'wb'
+    if status == 206:
+        start, total = parse_content_range(content_range)
+        if start == offset:
+            return 'ab'
+    return None
+
+
+def is_complete(status, offset, content_range):
+    """
+    Check if a resumed download is complete after a response
+    with status was read completely.
+    """
+    if status in (200, 206):
+        return write_mode(status, offset, content_range) is not None
+    if status == 416:
+        # requested range starts at the end of the file
+        start, total = parse_content_range(content_range)
+        return total is not None and total == offset
+    return False
+
+
+def map_download(url_target, username=None, password=None, pool=None,
+                 cookiejar=None, resume=False, manifest=None,
+                 segment_threshold=None, segments=4, makedirs=True,
+                 limiter=None, sizes=None):
+    """
+    variant of the function that only takes one argument.
+    Otherwise map_async of the multiprocessing module can not work with the function.
+
+    Parameters
+    ----------
+    url_target: list
+        first element the url, second the target string
+    username: string, optional
+        username
+    password: string, optional
+        password
+    pool: ConnectionPool, optional
+        pool of connections to use
+    cookiejar: cookielib.CookieJar, optional
+        cookie jar shared by all downloads
+    resume: boolean, optional
+        download to a .part file and resume it if it exists
+    manifest: datedown.manifest.Manifest, optional
+        manifest for conditional requests
+    segment_threshold: int, optional
+        minimum size of files that are downloaded in segments
+    segments: int, optional
+        number of segments for large files
+    makedirs: boolean, optional
+        create the directory of the target if it does not exist
+    limiter: datedown.scheduler.BandwidthLimiter, optional
+        bandwidth limit that is shared with other transfers
+    sizes: dict, optional
+        announced file sizes by target
+    """
+    return download(url_target[0], url_target[1],
+                    username=username,
+                    password=password,
+                    pool=pool,
+                    cookiejar=cookiejar,
+                    resume=resume,
+                    manifest=manifest,
+                    segment_threshold=segment_threshold,
+                    segments=segments,
+                    makedirs=makedirs,
+                    limiter=limiter,
+                    sizes=sizes)
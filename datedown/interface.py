@@ -26,29 +26,55 @@ Interface for the package.
 
 from datetime import datetime
 from datedown.down import check_downloaded
-from datedown.dates import n_hourly
-from datedown.urlcreator import create_dt_url
-from datedown.fname_creator import create_dt_fpath
-from datedown.down import download
+from datedown.dates import datetimes, parse_interval
+from datedown.dates import date_range, to_datetimes
+from datedown.dates import collapse, template_resolution
+from datedown.urlcreator import compile_dt_url
+from datedown.fname_creator import compile_dt_fpath, create_dirs
+from datedown.down import Downloader, EXECUTORS
+from datedown.manifest import Manifest
+from datedown.manifest import MANIFEST_FNAME
+from datedown.retry import RetryPolicy
+import datedown.validate as validate
+from datedown.dirindex import DirectoryIndex
+from datedown.state import StateStore, DONE, FAILED
+from datedown.listing import ListingCache
+from datedown.auth import AuthSession
+from datedown.metrics import Metrics
+from datedown.coverage import Coverage
 import warnings
-from functools import partial
+from itertools import islice
 import sys
+import os
 import argparse
 
+LISTING_DIR = '.datedown_listings'
+
 
 def download_by_dt(dts, url_create_fn,
                    fpath_create_fn, download_fn,
-                   passes=3, recursive=False):
+                   passes=3, recursive=False, chunk_size=1000,
+                   validators=None, state=None, listing=None,
+                   makedirs=False, metrics=None):
     """
     Download data for datetimes. If files are missing try
     again passes times.
 
+    The datetimes are consumed lazily in chunks of chunk_size. Files that
+    are missing after a chunk was downloaded are queued again together with
+    the next chunk so that memory use does not depend on the number of
+    datetimes. Consecutive datetimes that result in the same url and
+    filename are only downloaded once.
+
     Parameters
     ----------
-    dts: list
-        list of datetime.datetime objects
+    dts: iterable
+        iterable over datetime.datetime objects
     url_create_fn: function
-        function that creates an URL from a datetime object
+        function that creates an URL from a datetime object.
+        If both url_create_fn and fpath_create_fn have a render_many
+        method like datedown.urlcreator.DtTemplate then every chunk is
+        rendered at once.
     fpath_create_fn: function
         function that creates a filename from a datetime object
     download_fn: function
@@ -61,24 +87,107 @@ def download_by_dt(dts, url_create_fn,
         If set then no exact filenames can be given.
         The data will then be downloaded recursively and stored in the target folder.
         No checking of downloaded files is possible in this case.
+    chunk_size: int, optional
+        number of datetimes that are planned and downloaded at once
+    validators: list, optional
+        validator functions from datedown.validate that every downloaded
+        file has to pass. Invalid files are deleted and downloaded again.
+    state: datedown.state.StateStore, optional
+        If given, (url, fname) pairs that are done according to the state
+        store are skipped and the result of every download is recorded.
+    listing: datedown.listing.ListingCache, optional
+        If given, the listing of every remote directory is fetched once
+        and urls of files that are not in it are not downloaded.
+    makedirs: boolean, optional
+        If set the directories of all planned files are created once
+        before every chunk is downloaded so that download_fn does not
+        have to check them for every file.
+    metrics: datedown.metrics.Metrics, optional
+        If given the number of downloaded, missing and failed files and
+        the bytes of repeated downloads are recorded in it. To record
+        every download pass the same object to download_fn, e.g.
+        datedown.down.download.
+
+    A datedown.down.Downloader can be passed as download_fn to keep its
+    workers, connections and login for all chunks and passes and for
+    further calls of download_by_dt with other datasets.
     """
-    urls = map(url_create_fn, dts)
-    fnames = map(fpath_create_fn, dts)
-    for p in range(passes):
-        download_fn(urls, fnames)
-        if not recursive:
-            no_urls, no_fnames = check_downloaded(urls, fnames)
-            urls = no_urls
-            fnames = no_fnames
-            if len(no_urls) == 0:
-                break
+    dts = iter(dts)
+    # (url, fname, attempt) of files that are missing after the last chunk
+    retries = []
+    failed = []
+    not_listed = 0
+    last = None
+    dirs = set()
+    while True:
+        chunk = list(islice(dts, chunk_size))
+        if (hasattr(url_create_fn, 'render_many') and
+                hasattr(fpath_create_fn, 'render_many')):
+            pairs = zip(url_create_fn.render_many(chunk),
+                        fpath_create_fn.render_many(chunk))
         else:
-            urls = []
+            pairs = [(url_create_fn(dt), fpath_create_fn(dt)) for dt in chunk]
+        planned = []
+        for pair in pairs:
+            if pair != last:
+                planned.append(pair + (1,))
+            last = pair
+        if len(chunk) == 0 and len(retries) == 0:
             break
+        if state is not None and len(planned) != 0:
+            done = state.done([(url, fname) for url, fname, attempt
+                               in planned])
+            planned = [task for task in planned
+                       if (task[0], task[1]) not in done]
+        if listing is not None and len(planned) != 0:
+            listing.prefetch([task[0] for task in planned])
+            n_planned = len(planned)
+            planned = [task for task in planned if listing.exists(task[0])]
+            not_listed += n_planned - len(planned)
+        tasks = retries + planned
+        if len(tasks) == 0:
+            continue
+        urls = [task[0] for task in tasks]
+        fnames = [task[1] for task in tasks]
+        if makedirs:
+            dirs.update(create_dirs([task[1] for task in planned],
+                                    exclude=dirs))
+        download_fn(urls, fnames)
+        retries = []
+        if recursive:
+            continue
+        index = DirectoryIndex()
+        no_urls, no_fnames = check_downloaded(urls, fnames,
+                                              validators=validators,
+                                              index=index)
+        missing = set(no_fnames)
+        if metrics is not None:
+            metrics.record_checked(len(tasks) - len(missing), missing)
+        for url, fname, attempt in tasks:
+            if fname not in missing:
+                if state is not None:
+                    state.record(url, fname, DONE, nbytes=index.size(fname))
+                continue
+            if state is not None:
+                state.record(url, fname, FAILED)
+            if attempt < passes:
+                retries.append((url, fname, attempt + 1))
+            else:
+                failed.append(url)
+
+    if state is not None:
+        state.commit()
+    if metrics is not None:
+        metrics.record_failed(len(failed))
+        metrics.finish()
+
+    if not_listed != 0:
+        warnings.warn("{} URL's are not in the remote directory listings "
+                      "and were skipped.".format(not_listed))
 
-    if len(urls) != 0:
+    if len(failed) != 0:
         warnings.warn("Not all URL's were downloaded.")
-        warnings.warn("\n".join(urls))
+        warnings.warn("\n".join(failed))
 
 
 def mkdate(datestring):
@@ -88,16 +197,54 @@ def mkdate(datestring):
         return datetime.strptime(datestring, '%Y-%m-%dT%H:%M')
 
 
-def n_hours(intervalstring):
+def plan_dts(dts, templates):
     """
-    Convert an interval string like 1D, 6H etc. to the
-    number of hours it represents.
+    Reduce datetimes to the resolution of the strftime templates that
+    are used for the urls and filenames so that every remote resource is
+    only planned once. E.g. with monthly subdirectories and no date in
+    the filename a daily interval results in one datetime per month.
+
+    Parameters
+    ----------
+    dts: iterable
+        iterable over sorted datetime.datetime objects
+    templates: list
+        strftime templates of the urls and filenames.
+        None entries are ignored.
+
+    Returns
+    -------
+    dts: iterator
+        first datetime of every period of the resolution
     """
-    multid = {'H': 1,
-              'D': 24}
-    multi = multid[intervalstring[-1].upper()]
-    hours = multi * int(intervalstring[:-1])
-    return hours
+    return collapse(dts, template_resolution(templates))
+
+
+def interval(intervalstring):
+    """
+    Convert an interval string like 10min, 6H, 1M or dekad to an
+    interval tuple for datedown.dates.date_range.
+    """
+    try:
+        return parse_interval(intervalstring)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def mkbandwidth(sizestring):
+    """
+    Convert a bandwidth like 500K, 200M or 1G per second
+    to bytes per second. Units are powers of 1024 like for wget.
+    """
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    sizestring = sizestring.strip().upper()
+    try:
+        if sizestring[-1:] in units:
+            return float(sizestring[:-1]) * units[sizestring[-1]]
+        return float(sizestring)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "Invalid bandwidth {}".format(sizestring))
 
 
 def parse_args(args):
@@ -131,15 +278,103 @@ def parse_args(args):
                               'This can be a list of directories that can contain date string templates.'
                               'e.g. --localsubdirs %%Y %%m would look for files in localroot/YYYY/MM/localfname.'
                               'If not given then the urlsubdirs are used.'))
-    parser.add_argument("--interval", type=n_hours, default='1D',
+    parser.add_argument("--interval", type=interval, default='1D',
                         help=('Interval of datetimes between the start and end. '
-                              'Supported types are e.g. 6H for 6 hourly or 2D for 2 daily.'))
+                              'Supported types are e.g. 10min for 10 minutely, 6H for 6 hourly, '
+                              '2D for 2 daily, 1M for monthly, 1Y for yearly, dekad, pentad '
+                              'or 8doy for every 8th day of the year.'))
+    parser.add_argument("--only_missing", "--only-missing", dest='only_missing',
+                        action='store_true',
+                        help=('Scan the local archive once and only download the datetimes '
+                              'between start and end whose file does not exist yet.'))
+    parser.add_argument("--since_last", "--since-last", dest='since_last',
+                        action='store_true',
+                        help=('Only download the datetimes after the latest file that '
+                              'exists in the local archive, e.g. for daily runs.'))
     parser.add_argument("--username",
                         help='Username to use for download.')
     parser.add_argument("--password",
                         help='password to use for download.')
+    parser.add_argument("--login_url",
+                        help=('URL that starts the login if a username is given. '
+                              'By default the first URL that is downloaded. The login is done '
+                              'once and its cookies are shared by all workers.'))
+    parser.add_argument("--session_max_age", default=3600, type=float,
+                        help='Seconds after which the login is renewed.')
     parser.add_argument("--n_proc", default=1, type=int,
                         help='Number of parallel processes to use for downloading.')
+    parser.add_argument("--backend", "--engine", dest='backend', default='wget',
+                        choices=['wget', 'http', 'async', 'ftp'],
+                        help=('Download backend. wget starts one wget process per file, '
+                              'http downloads in n_proc threads over persistent connections, '
+                              'async runs up to --concurrency transfers on one event loop, '
+                              'ftp downloads in n_proc threads over one FTP session per host.'))
+    parser.add_argument("--executor", default='thread', choices=EXECUTORS,
+                        help=('Run the n_proc parallel downloads in threads, in worker '
+                              'processes (wget backend only) or one after another inline. '
+                              'The workers are started once for the whole run.'))
+    parser.add_argument("--concurrency", default=100, type=int,
+                        help='Number of concurrent transfers of the async backend.')
+    parser.add_argument("--batch_size", type=int,
+                        help=('Download up to this many files from the same host into the same '
+                              'directory with one wget process or, for the ftp backend, from '
+                              'the same remote directory in one batch.'))
+    parser.add_argument("--max_per_host", type=int,
+                        help='Maximum number of concurrent downloads from one host.')
+    parser.add_argument("--rate_per_host", type=float,
+                        help='Maximum number of downloads started per second and host.')
+    parser.add_argument("--max_bandwidth", "--max-bandwidth", dest='max_bandwidth',
+                        type=mkbandwidth,
+                        help=('Maximum bytes per second of all downloads together, '
+                              'e.g. 500K, 200M or 1G. The http, async and ftp backends share '
+                              'the limit. The wget backend gives every wget process a fixed '
+                              '--limit-rate of max_bandwidth / n_proc, so fewer parallel '
+                              'downloads do not use the whole limit.'))
+    parser.add_argument("--resume", action='store_true',
+                        help=('Download to .part files and resume interrupted '
+                              'downloads with HTTP Range requests.'))
+    parser.add_argument("--manifest", action='store_true',
+                        help=('Keep a manifest of ETag and Last-Modified headers in the '
+                              'localroot and only transfer files that changed on the server. '
+                              'Needs the http or async backend.'))
+    parser.add_argument("--max_attempts", default=1, type=int,
+                        help=('Maximum number of attempts per file. Files that fail with a '
+                              'transient error are tried again with exponential backoff '
+                              'while the other downloads continue. Files that do not exist '
+                              'on the server are not tried again.'))
+    parser.add_argument("--backoff", default=1., type=float,
+                        help='Seconds to wait before the first retry of a file.')
+    parser.add_argument("--segment_threshold", type=int,
+                        help=('Download files of at least this many bytes in segments over '
+                              'several connections. Needs the http backend.'))
+    parser.add_argument("--segments", default=4, type=int,
+                        help='Number of segments per large file.')
+    parser.add_argument("--validate", action='store_true',
+                        help=('Check that downloaded files are not empty, not HTML error pages '
+                              'and start with the signature of their file type '
+                              '(NetCDF, HDF5, GRIB, zip, gzip). The http, async and ftp backends '
+                              'also compare the size with the size announced by the server. '
+                              'Invalid files are downloaded again.'))
+    parser.add_argument("--checksums", action='store_true',
+                        help=('Compare downloaded files with checksum files like file.md5 or '
+                              'file.sha256 next to them. Invalid files are downloaded again.'))
+    parser.add_argument("--state",
+                        help=('SQLite database that stores the state of every file. '
+                              'Files that are done according to it are skipped '
+                              'so that interrupted jobs resume immediately.'))
+    parser.add_argument("--listing", action='store_true',
+                        help=('Fetch the listing of every remote directory once and only '
+                              'download files that are in it. Listings are cached in '
+                              'localroot/%s.' % LISTING_DIR))
+    parser.add_argument("--report",
+                        help=('Write a JSON summary of the run with throughput, statuses, '
+                              'retries and time per file to this file and print a histogram '
+                              'of the time per file.'))
+    parser.add_argument("--prometheus",
+                        help=('Write the metrics of the run to this file in the Prometheus '
+                              'text format, e.g. for the textfile collector of the node exporter.'))
+    parser.add_argument("--listing_ttl", default=3600, type=float,
+                        help='Seconds after which a cached directory listing is fetched again.')
     args = parser.parse_args(args)
     # set defaults that can not be handled by argparse
     if args.localfname is None:
@@ -150,19 +385,122 @@ def parse_args(args):
 
 
 def main(args):
-    args = parse_args(args)
+    download_dataset(parse_args(args))
 
-    dts = list(n_hourly(args.start, args.end, args.interval))
-    url_create_fn = partial(create_dt_url, root=args.urlroot,
-                            fname=args.urlfname, subdirs=args.urlsubdirs)
-    fname_create_fn = partial(create_dt_fpath, root=args.localroot,
-                              fname=args.localfname, subdirs=args.localsubdirs)
-    down_func = partial(download,
-                        num_proc=args.n_proc,
-                        username=args.username,
-                        password=args.password)
-    download_by_dt(dts, url_create_fn,
-                   fname_create_fn, down_func)
+
+def download_dataset(args, pool=None, labels=None, scheduler=None,
+                     metrics=None):
+    """
+    Download one dataset as described by the command line parameters.
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        command line parameters from parse_args. args.max_bandwidth can
+        also be a datedown.scheduler.BandwidthLimiter that is shared with
+        other datasets.
+    pool: multiprocessing.pool.Pool, optional
+        workers that are shared with other datasets, see
+        datedown.down.make_pool
+    labels: dict, optional
+        labels of the Prometheus metrics, e.g. the name of the dataset
+    scheduler: datedown.scheduler.Scheduler, optional
+        scheduler that is shared with other datasets so that the limits
+        per host hold for all of them, see datedown.down.Downloader
+    metrics: datedown.metrics.Metrics, optional
+        records the downloads of the dataset, e.g. to write them
+        together with the metrics of other datasets
+    """
+    dts = date_range(args.start, args.end, args.interval)
+    if args.only_missing or args.since_last:
+        coverage = Coverage.scan(args.localroot, args.localfname,
+                                 args.localsubdirs)
+        if args.since_last:
+            dts = coverage.since_last(dts)
+        if args.only_missing:
+            dts = coverage.missing(dts)
+    dts = plan_dts(to_datetimes(dts),
+                   [args.urlfname, args.localfname] +
+                   (args.urlsubdirs or []) + (args.localsubdirs or []))
+    url_create_fn = compile_dt_url(root=args.urlroot,
+                                   fname=args.urlfname, subdirs=args.urlsubdirs)
+    fname_create_fn = compile_dt_fpath(root=args.localroot,
+                                       fname=args.localfname, subdirs=args.localsubdirs)
+    options = dict(concurrency=args.concurrency,
+                   batch_size=args.batch_size,
+                   max_per_host=args.max_per_host,
+                   rate_per_host=args.rate_per_host,
+                   resume=args.resume,
+                   segment_threshold=args.segment_threshold,
+                   segments=args.segments,
+                   makedirs=False)
+    passes = 3
+    if args.max_attempts > 1:
+        # failed files are retried by the scheduler instead of in passes
+        passes = 1
+        options['retry'] = RetryPolicy(max_attempts=args.max_attempts,
+                                       backoff=args.backoff)
+    if args.manifest:
+        options['manifest'] = Manifest(os.path.join(args.localroot,
+                                                    MANIFEST_FNAME))
+    validators = []
+    if args.validate:
+        validators.extend(validate.DEFAULT_VALIDATORS)
+        if args.backend != 'wget':
+            # compare every file with the size the server announced
+            sizes = {}
+            options['sizes'] = sizes
+            validators.append(validate.expected_size(sizes))
+    if args.checksums:
+        validators.append(validate.checksum)
+    state = None
+    if args.state is not None:
+        state = StateStore(args.state)
+        options['callback'] = state.record_download
+    session = None
+    if args.username is not None and args.backend != 'ftp':
+        session = AuthSession(args.username, args.password,
+                              login_url=args.login_url,
+                              max_age=args.session_max_age)
+    if metrics is None and (args.report is not None or
+                            args.prometheus is not None):
+        metrics = Metrics()
+    if metrics is not None:
+        options['metrics'] = metrics
+    listing = None
+    if args.listing:
+        listing = ListingCache(os.path.join(args.localroot, LISTING_DIR),
+                               ttl=args.listing_ttl,
+                               username=args.username,
+                               password=args.password)
+    # one set of workers and one bandwidth limit for all chunks and passes
+    with Downloader(num_proc=args.n_proc,
+                    executor=args.executor,
+                    username=args.username,
+                    password=args.password,
+                    backend=args.backend,
+                    session=session,
+                    max_bandwidth=args.max_bandwidth,
+                    pool=pool,
+                    scheduler=scheduler,
+                    **options) as downloader:
+        download_by_dt(dts, url_create_fn,
+                       fname_create_fn, downloader,
+                       passes=passes,
+                       validators=validators or None,
+                       state=state,
+                       listing=listing,
+                       makedirs=True,
+                       metrics=metrics)
+    if args.report is not None:
+        metrics.write_json(args.report)
+        print(metrics.histogram())
+    if args.prometheus is not None:
+        metrics.write_prometheus(args.prometheus, labels)
+    if state is not None:
+        state.close()
+    if session is not None:
+        session.close()
 
 
 def run():
@@ -195,15 +533,21 @@ def parse_args_recursive(args):
                               'This can be a list of directories that can contain date string templates.'
                               'e.g. --localsubdirs %%Y %%m would look for files in localroot/YYYY/MM/localfname.'
                               'If not given then the urlsubdirs are used.'))
-    parser.add_argument("--interval", type=n_hours, default='1D',
+    parser.add_argument("--interval", type=interval, default='1D',
                         help=('Interval of datetimes between the start and end. '
-                              'Supported types are e.g. 6H for 6 hourly or 2D for 2 daily.'))
+                              'Supported types are e.g. 10min for 10 minutely, 6H for 6 hourly, '
+                              '2D for 2 daily, 1M for monthly, 1Y for yearly, dekad, pentad '
+                              'or 8doy for every 8th day of the year.'))
     parser.add_argument("--username",
                         help='Username to use for download.')
     parser.add_argument("--password",
                         help='password to use for download.')
     parser.add_argument("--n_proc", default=1, type=int,
                         help='Number of parallel processes to use for downloading.')
+    parser.add_argument("--max_per_host", type=int,
+                        help='Maximum number of concurrent downloads from one host.')
+    parser.add_argument("--rate_per_host", type=float,
+                        help='Maximum number of downloads started per second and host.')
     args = parser.parse_args(args)
     # set defaults that can not be handled by argparse
     if args.localsubdirs is None:
@@ -214,19 +558,23 @@ def parse_args_recursive(args):
 def main_recursive(args):
     args = parse_args_recursive(args)
 
-    dts = list(n_hourly(args.start, args.end, args.interval))
-    url_create_fn = partial(create_dt_url, root=args.urlroot,
-                            fname='', subdirs=args.urlsubdirs)
-    fname_create_fn = partial(create_dt_fpath, root=args.localroot,
-                              fname='', subdirs=args.localsubdirs)
-    down_func = partial(download,
-                        num_proc=args.n_proc,
-                        username=args.username,
-                        password=args.password,
-                        recursive=True)
-    download_by_dt(dts, url_create_fn,
-                   fname_create_fn, down_func,
-                   recursive=True)
+    dts = plan_dts(datetimes(args.start, args.end, args.interval),
+                   (args.urlsubdirs or []) + (args.localsubdirs or []))
+    url_create_fn = compile_dt_url(root=args.urlroot,
+                                   fname='', subdirs=args.urlsubdirs)
+    fname_create_fn = compile_dt_fpath(root=args.localroot,
+                                       fname='', subdirs=args.localsubdirs)
+    with Downloader(num_proc=args.n_proc,
+                    username=args.username,
+                    password=args.password,
+                    recursive=True,
+                    max_per_host=args.max_per_host,
+                    rate_per_host=args.rate_per_host,
+                    makedirs=False) as downloader:
+        download_by_dt(dts, url_create_fn,
+                       fname_create_fn, downloader,
+                       recursive=True,
+                       makedirs=True)
 
 
 def run_recursive():
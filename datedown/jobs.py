@@ -0,0 +1,310 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Download several datasets described in one job file.
+
+A job file in YAML or TOML format lists datasets with the same settings
+as the command line options of datedown, e.g.
+
+.. code-block:: yaml
+
+    n_proc: 16
+    max_bandwidth: 200M
+    max_per_host: 4
+    prometheus: /var/lib/node_exporter/datedown.prom
+    defaults:
+      backend: http
+      interval: 1D
+    datasets:
+      - name: smap
+        urlroot: https://example.com/SMAP
+        urlsubdirs: ['%Y.%m.%d']
+        urlfname: SMAP_L3_%Y%m%d.h5
+        localroot: /data/smap
+        start: 2020-01-01
+        end: 2020-02-01
+        username: user
+        password: secret
+
+All datasets are planned at the same time and their downloads are run by
+one pool of n_proc workers so that the workers stay busy until the last
+file of the last dataset is downloaded. The limits per host hold for the
+downloads of all datasets together and the metrics of all datasets are
+written to one Prometheus textfile with a dataset label.
+'''
+
+import argparse
+from datetime import date, datetime
+from functools import partial
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+
+from datedown.down import make_pool, check_backend, EXECUTORS
+from datedown.interface import parse_args as parse_dataset_args
+from datedown.interface import download_dataset, mkbandwidth
+from datedown.metrics import Metrics, write_prometheus
+from datedown.scheduler import BandwidthLimiter, Scheduler
+
+# positional command line parameters of a dataset in their order
+POSITIONAL = ('start', 'end', 'urlroot', 'urlfname', 'localroot')
+# settings that are shared by all datasets of a job
+JOB_SETTINGS = ('n_proc', 'executor', 'max_bandwidth', 'max_per_host',
+                'rate_per_host')
+
+
+def load_job(path):
+    """
+    Read a job file.
+
+    Parameters
+    ----------
+    path: string
+        path of a YAML file or of a TOML file with the extension .toml
+
+    Returns
+    -------
+    job: dict
+        content of the job file
+    """
+    if path.endswith('.toml'):
+        try:
+            # Python 3.11
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(path, 'rb') as fid:
+            job = tomllib.load(fid)
+    else:
+        import yaml
+        with open(path) as fid:
+            job = yaml.safe_load(fid)
+    if not isinstance(job, dict) or not job.get('datasets'):
+        raise ValueError("Job file {} has no datasets.".format(path))
+    return job
+
+
+def format_value(value):
+    """
+    Format a value of a job file as command line parameter.
+    """
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%dT%H:%M')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def dataset_args(dataset, defaults=None):
+    """
+    Convert the settings of a dataset to command line parameters of datedown.
+
+    Parameters
+    ----------
+    dataset: dict
+        settings of the dataset with the names of the command line
+        parameters as keys. Flags like resume are set with true.
+    defaults: dict, optional
+        settings for all datasets that the dataset can override
+
+    Returns
+    -------
+    args: argparse.Namespace
+        command line parameters as returned by datedown.interface.parse_args
+    """
+    settings = dict(defaults or {})
+    settings.update(dataset)
+    name = settings.pop('name', None)
+    shared = [key for key in JOB_SETTINGS if key in settings]
+    if shared:
+        raise ValueError("Dataset {}: {} can only be set for the whole "
+                         "job.".format(name, ', '.join(shared)))
+    argv = []
+    for key in POSITIONAL:
+        if key not in settings:
+            raise ValueError("Dataset {} has no {}.".format(name, key))
+        argv.append(format_value(settings.pop(key)))
+    for key, value in sorted(settings.items()):
+        option = '--' + key
+        if value is None or value is False:
+            continue
+        if value is True:
+            argv.append(option)
+        elif isinstance(value, (list, tuple)):
+            argv.append(option)
+            argv.extend(format_value(item) for item in value)
+        else:
+            argv.append('{}={}'.format(option, format_value(value)))
+    return parse_dataset_args(argv)
+
+
+def parse_args(args):
+    """
+    Parse command line parameters
+
+    :param args: command line parameters as list of strings
+    :return: command line parameters as :obj:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(
+        description="Download several datasets described in a YAML or TOML job file.")
+    parser.add_argument("jobfile",
+                        help='Job file. TOML if it ends with .toml, otherwise YAML.')
+    parser.add_argument("--datasets", nargs='+',
+                        help='Only download the datasets with these names.')
+    parser.add_argument("--n_proc", type=int,
+                        help='Number of parallel downloads of all datasets together. '
+                             'Overrides n_proc of the job file.')
+    parser.add_argument("--executor", choices=EXECUTORS,
+                        help='Overrides executor of the job file.')
+    parser.add_argument("--max_bandwidth", "--max-bandwidth", dest='max_bandwidth',
+                        type=mkbandwidth,
+                        help='Maximum bytes per second of all datasets together. '
+                             'Overrides max_bandwidth of the job file. Datasets with the '
+                             'wget backend give every wget process a fixed share of '
+                             'max_bandwidth / n_proc and can not be mixed with datasets '
+                             'of other backends.')
+    parser.add_argument("--max_per_host", type=int,
+                        help='Maximum number of concurrent downloads from one host '
+                             'of all datasets together. Overrides max_per_host of the job file.')
+    parser.add_argument("--rate_per_host", type=float,
+                        help='Maximum number of downloads started per second and host '
+                             'of all datasets together. Overrides rate_per_host of the job file.')
+    parser.add_argument("--prometheus",
+                        help='Write the metrics of all datasets to this file in the Prometheus '
+                             'text format with a dataset label. Overrides prometheus of the '
+                             'job file.')
+    return parser.parse_args(args)
+
+
+def check_prometheus(datasets):
+    """
+    Check that no two datasets write their metrics to the same file.
+
+    Parameters
+    ----------
+    datasets: list
+        (name, args) tuples of the datasets
+
+    Raises
+    ------
+    ValueError
+        if several datasets have the same prometheus path
+    """
+    names = {}
+    for name, args in datasets:
+        if args.prometheus is None:
+            continue
+        path = os.path.abspath(args.prometheus)
+        if path in names:
+            raise ValueError("Datasets {} and {} write their metrics to the same "
+                             "file {}. Set prometheus for the whole job to write "
+                             "the metrics of all datasets to one file.".format(
+                                 names[path], name, args.prometheus))
+        names[path] = name
+
+
+def main(args):
+    args = parse_args(args)
+    job = load_job(args.jobfile)
+
+    n_proc = args.n_proc or job.get('n_proc', 1)
+    executor = args.executor or job.get('executor', 'thread')
+    max_bandwidth = args.max_bandwidth
+    if max_bandwidth is None and job.get('max_bandwidth') is not None:
+        max_bandwidth = mkbandwidth(str(job['max_bandwidth']))
+    limiter = None
+    if max_bandwidth is not None:
+        limiter = BandwidthLimiter(max_bandwidth)
+    max_per_host = args.max_per_host or job.get('max_per_host')
+    rate_per_host = args.rate_per_host or job.get('rate_per_host')
+    scheduler = None
+    if max_per_host is not None or rate_per_host is not None:
+        # one scheduler so that the limits per host hold for all datasets
+        scheduler = Scheduler(n_proc, max_per_host=max_per_host,
+                              rate_per_host=rate_per_host)
+    prometheus = args.prometheus or job.get('prometheus')
+
+    datasets = []
+    for i, dataset in enumerate(job['datasets']):
+        name = dataset.get('name', 'dataset{}'.format(i))
+        if args.datasets is not None and name not in args.datasets:
+            continue
+        # all datasets are checked before the first download starts
+        dataset_ns = dataset_args(dataset, job.get('defaults'))
+        dataset_ns.n_proc = n_proc
+        dataset_ns.executor = executor
+        dataset_ns.max_bandwidth = limiter
+        try:
+            check_backend(dataset_ns.backend, executor,
+                          manifest=dataset_ns.manifest)
+        except ValueError as e:
+            raise ValueError("Dataset {}: {}".format(name, e))
+        if scheduler is not None and dataset_ns.backend == 'async':
+            raise ValueError("Dataset {}: the async backend can not share the "
+                             "limits per host of the job.".format(name))
+        datasets.append((name, dataset_ns))
+    if not datasets:
+        return
+    check_prometheus(datasets)
+    backends = set(dataset_ns.backend for name, dataset_ns in datasets)
+    if limiter is not None and 'wget' in backends and len(backends) > 1:
+        # wget processes get a fixed share and do not take from the limit
+        # that the other backends share, together they would exceed it
+        raise ValueError("max_bandwidth can not be shared by datasets with "
+                         "the wget backend and datasets with the {} "
+                         "backend.".format(', '.join(sorted(backends - {'wget'}))))
+
+    metrics = [Metrics() if prometheus is not None else None
+               for _ in datasets]
+    pool = make_pool(executor, n_proc)
+    # one thread per dataset plans its chunks and checks the downloaded
+    # files while the downloads of all datasets share the pool
+    drivers = ThreadPool(len(datasets))
+    try:
+        drivers.map(partial(run_dataset, pool=pool, scheduler=scheduler),
+                    [dataset + (dataset_metrics,) for dataset, dataset_metrics
+                     in zip(datasets, metrics)],
+                    chunksize=1)
+    finally:
+        drivers.close()
+        drivers.join()
+        pool.close()
+        pool.join()
+    if prometheus is not None:
+        write_prometheus(prometheus,
+                         [(dataset_metrics, {'dataset': name}) for
+                          (name, _), dataset_metrics in zip(datasets, metrics)])
+
+
+def run_dataset(dataset, pool, scheduler=None):
+    """
+    Download a (name, args, metrics) dataset with the shared pool
+    and scheduler.
+    """
+    name, args, metrics = dataset
+    download_dataset(args, pool=pool, labels={'dataset': name},
+                     scheduler=scheduler, metrics=metrics)
+
+
+def run():
+    main(sys.argv[1:])
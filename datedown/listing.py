@@ -0,0 +1,270 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Listings of remote directories.
+
+Remote directories are fetched once, parsed and cached on disk so that
+urls of files that do not exist on the server can be dropped before
+they are requested. Supported are HTML index pages as generated by
+Apache or nginx, FTP LIST output and JSON lists of filenames.
+'''
+
+import ftplib
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    # Python 3
+    from urllib.parse import urlsplit, urljoin, unquote
+    from urllib.request import build_opener, HTTPBasicAuthHandler
+    from urllib.request import HTTPPasswordMgrWithDefaultRealm
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit, urljoin
+    from urllib import unquote
+    from urllib2 import build_opener, HTTPBasicAuthHandler
+    from urllib2 import HTTPPasswordMgrWithDefaultRealm
+    from urllib2 import HTTPError, URLError
+
+from datedown.fname_creator import replace
+
+HREF = re.compile(r'''href\s*=\s*["']?([^"' >]+)''', re.IGNORECASE)
+
+
+def dir_url(url):
+    """
+    URL of the directory of a file URL including the trailing slash.
+    """
+    return url.rsplit('/', 1)[0] + '/'
+
+
+def url_fname(url):
+    """
+    Filename of a file URL.
+    """
+    return unquote(posixpath.basename(urlsplit(url).path))
+
+
+def parse_listing(content, url):
+    """
+    Parse the listing of a remote directory.
+
+    Parameters
+    ----------
+    content: string
+        body of the response to a directory request
+    url: string
+        URL of the directory
+
+    Returns
+    -------
+    fnames: set
+        names of the files and subdirectories in the directory
+    """
+    stripped = content.lstrip()
+    if stripped.startswith('[') or stripped.startswith('{'):
+        entries = json.loads(stripped)
+        if isinstance(entries, dict):
+            entries = entries.get('files', entries.get('entries', []))
+        fnames = set()
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry = entry.get('name')
+            if entry:
+                fnames.add(entry.rstrip('/'))
+        return fnames
+
+    if '<' in stripped[:1000]:
+        path = urlsplit(url).path
+        if not path.endswith('/'):
+            path = path + '/'
+        fnames = set()
+        for href in HREF.findall(content):
+            full = urlsplit(urljoin(url, href))
+            if full.query or not full.path.startswith(path):
+                continue
+            name = full.path[len(path):].rstrip('/')
+            if name and '/' not in name:
+                fnames.add(unquote(name))
+        return fnames
+
+    # FTP LIST output in ls -l format or plain names as from NLST
+    fnames = set()
+    for line in content.splitlines():
+        fields = line.split(None, 8)
+        if len(fields) == 9:
+            name = fields[8]
+            if fields[0].startswith('l') and ' -> ' in name:
+                name = name.split(' -> ')[0]
+            fnames.add(name)
+        elif len(fields) == 1:
+            fnames.add(fields[0])
+    fnames.discard('.')
+    fnames.discard('..')
+    return fnames
+
+
+def fetch_listing(url, username=None, password=None, timeout=60):
+    """
+    Fetch and parse the listing of a remote directory over
+    HTTP, HTTPS or FTP.
+
+    Returns
+    -------
+    fnames: set
+        names of the files in the directory
+    """
+    handlers = []
+    if username is not None:
+        passwords = HTTPPasswordMgrWithDefaultRealm()
+        passwords.add_password(None, url, username, password)
+        handlers.append(HTTPBasicAuthHandler(passwords))
+    opener = build_opener(*handlers)
+    response = opener.open(url, timeout=timeout)
+    try:
+        content = response.read().decode('utf-8', 'replace')
+    finally:
+        response.close()
+    return parse_listing(content, url)
+
+
+def missing_directory(error):
+    """
+    Check if fetching a listing failed because the directory does not
+    exist, in contrast to errors after which a later attempt can succeed.
+    """
+    if isinstance(error, HTTPError):
+        return error.code in (404, 410)
+    if isinstance(error, URLError):
+        reason = error.reason
+        return isinstance(reason, ftplib.error_perm) and \
+            str(reason).startswith('550')
+    return False
+
+
+class ListingCache(object):
+    """
+    Listings of remote directories cached in memory and on disk.
+    A directory that does not exist (404 or FTP 550) has an empty listing.
+    If a listing can not be fetched for other reasons, e.g. a timeout or
+    a server error, none of its files are dropped.
+
+    Parameters
+    ----------
+    path: string
+        directory in which the listings are stored
+    ttl: float, optional
+        seconds after which a listing is fetched again
+    username: string, optional
+        username for the servers
+    password: string, optional
+        password for the servers
+    num_threads: int, optional
+        number of listings that are fetched at the same time
+    """
+
+    def __init__(self, path, ttl=3600, username=None, password=None,
+                 num_threads=8):
+        self.path = path
+        self.ttl = ttl
+        self.username = username
+        self.password = password
+        self.num_threads = num_threads
+        self.listings = {}
+
+    def _cache_fname(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def _load(self, url):
+        fname = self._cache_fname(url)
+        if not os.path.exists(fname):
+            return None
+        with open(fname) as fid:
+            cached = json.load(fid)
+        if time.time() - cached['time'] > self.ttl:
+            return None
+        return set(cached['fnames'])
+
+    def _store(self, url, fnames):
+        if not os.path.exists(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path):
+                    raise
+        fd, tmp_path = tempfile.mkstemp(prefix='.datedown', dir=self.path)
+        with os.fdopen(fd, 'w') as fid:
+            json.dump({'url': url, 'time': time.time(),
+                       'fnames': sorted(fnames)}, fid)
+        replace(tmp_path, self._cache_fname(url))
+
+    def _get(self, url):
+        fnames = self._load(url)
+        if fnames is None:
+            try:
+                fnames = fetch_listing(url, username=self.username,
+                                       password=self.password)
+            except (IOError, OSError, ValueError) as e:
+                if not missing_directory(e):
+                    # without a listing nothing can be dropped
+                    return url, None
+                # none of the files of a missing directory exist
+                fnames = set()
+            self._store(url, fnames)
+        return url, fnames
+
+    def prefetch(self, urls):
+        """
+        Get the listings of all directories of the given file urls.
+        Every directory that is not cached is fetched once.
+        """
+        dirs = sorted(set(dir_url(url) for url in urls)
+                      .difference(self.listings))
+        if len(dirs) == 0:
+            return
+        pool = ThreadPool(min(self.num_threads, len(dirs)))
+        try:
+            self.listings.update(pool.map(self._get, dirs))
+        finally:
+            pool.close()
+            pool.join()
+
+    def exists(self, url):
+        """
+        Check if a file url is in the listing of its directory.
+        Returns True if the listing could not be fetched because of an
+        error other than a missing directory.
+        """
+        directory = dir_url(url)
+        if directory not in self.listings:
+            self.prefetch([url])
+        fnames = self.listings[directory]
+        return fnames is None or url_fname(url) in fnames
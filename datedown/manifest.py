@@ -0,0 +1,122 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Manifest of downloaded files for conditional requests.
+
+For every target the ETag, Last-Modified header and size of the last
+download are stored in a JSON file in the local root. On the next run
+these are sent as If-None-Match and If-Modified-Since headers so that
+unchanged files are answered with 304 Not Modified and not transferred again.
+'''
+
+import json
+import os
+import tempfile
+import threading
+
+from datedown.fname_creator import replace
+
+MANIFEST_FNAME = '.datedown_manifest.json'
+
+
+class Manifest(object):
+    """
+    Persistent record of ETag, Last-Modified and size per target.
+    Can be shared between threads.
+
+    Parameters
+    ----------
+    path: string
+        path of the manifest file. Usually MANIFEST_FNAME
+        in the root of the local dataset.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as fid:
+                self.entries = json.load(fid)
+
+    def _key(self, target):
+        return os.path.relpath(os.path.abspath(target), self.root)
+
+    def get(self, target):
+        """
+        Get the stored entry of a target.
+
+        Returns
+        -------
+        entry: dict
+            with the keys etag, last_modified and size or None
+            if the target is not in the manifest.
+        """
+        with self._lock:
+            return self.entries.get(self._key(target))
+
+    def update(self, target, etag=None, last_modified=None):
+        """
+        Record the headers of a finished download of target.
+        The size is taken from the file on disk.
+        """
+        entry = {'etag': etag,
+                 'last_modified': last_modified,
+                 'size': os.path.getsize(target)}
+        with self._lock:
+            self.entries[self._key(target)] = entry
+
+    def conditional_headers(self, target):
+        """
+        Headers for a conditional request of target.
+        Only given if the local file still has the recorded size.
+
+        Returns
+        -------
+        headers: dict
+            If-None-Match and/or If-Modified-Since header
+        """
+        entry = self.get(target)
+        if entry is None or not os.path.exists(target) or \
+                os.path.getsize(target) != entry['size']:
+            return {}
+        headers = {}
+        if entry['etag'] is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified'] is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def save(self):
+        """
+        Write the manifest to disk. The file is replaced atomically.
+        """
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix='.datedown',
+                                            dir=self.root)
+            with os.fdopen(fd, 'w') as fid:
+                json.dump(self.entries, fid)
+        replace(tmp_path, self.path)
@@ -0,0 +1,360 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Metrics of download runs.
+
+A Metrics object is passed to datedown.down.download and
+datedown.interface.download_by_dt. It counts downloads, HTTP or wget
+statuses, bytes, retries and the bytes of downloads that had to be
+repeated, and keeps a histogram of the time per file. Every download only
+costs a few counter updates and one stat of the target, so metrics can
+stay enabled for production runs.
+
+At the end of a run the metrics can be written as a JSON summary, a text
+histogram and a Prometheus textfile for the node exporter.
+'''
+
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from datedown.fname_creator import replace
+from datedown.retry import WGET_OK
+
+#: statuses of downloads that transferred the file
+TRANSFER_CODES = (WGET_OK, 200, 206)
+#: status of conditional requests for files that did not change
+NOT_MODIFIED = 304
+
+#: upper bounds in seconds of the buckets of the duration histogram
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.,
+                    30., 60., 300.)
+
+
+class Metrics(object):
+    """
+    Counters and duration histogram of the downloads of a run.
+
+    Parameters
+    ----------
+    buckets: tuple, optional
+        sorted upper bounds in seconds of the histogram buckets
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.start = time.time()
+        self.end = None
+        self.downloads = 0
+        self.duration_sum = 0.
+        self.duration_max = 0.
+        self.statuses = Counter()
+        self.bytes = 0
+        self.not_modified = 0
+        self.wasted_bytes = 0
+        self.retries = 0
+        self.files_done = 0
+        self.files_missing = 0
+        self.files_failed = 0
+        # bytes of the downloads of the current chunk by target
+        self._chunk_bytes = {}
+        self._lock = threading.Lock()
+
+    def record(self, url, target, status, duration):
+        """
+        Record a finished download. Has the signature of the callback of
+        datedown.down.download. The size of the target is only counted
+        if it was transferred, not for unchanged files (304).
+        """
+        nbytes = 0
+        if status in TRANSFER_CODES:
+            try:
+                nbytes = os.path.getsize(target)
+            except OSError:
+                pass
+        with self._lock:
+            self.downloads += 1
+            self.statuses[status] += 1
+            if status == NOT_MODIFIED:
+                self.not_modified += 1
+            self.bytes += nbytes
+            self.duration_sum += duration
+            self.duration_max = max(self.duration_max, duration)
+            self.counts[bisect.bisect_left(self.buckets, duration)] += 1
+            self._chunk_bytes[target] = (self._chunk_bytes.get(target, 0) +
+                                         nbytes)
+
+    def record_retry(self, url, target, status):
+        """
+        Record a download that failed and is tried again.
+        """
+        with self._lock:
+            self.retries += 1
+
+    def record_checked(self, done, missing):
+        """
+        Record the result of checking the downloaded files of a chunk.
+        Bytes downloaded for files that are missing or invalid afterwards
+        are counted as wasted.
+
+        Parameters
+        ----------
+        done: int
+            number of files that were downloaded
+        missing: iterable
+            targets that are missing or invalid
+        """
+        with self._lock:
+            self.files_done += done
+            for target in missing:
+                self.files_missing += 1
+                self.wasted_bytes += self._chunk_bytes.get(target, 0)
+            self._chunk_bytes = {}
+
+    def record_failed(self, n):
+        """
+        Record the number of files that could not be downloaded at all.
+        """
+        with self._lock:
+            self.files_failed += n
+
+    def callback(self, callback=None):
+        """
+        Download callback that records the download and then
+        calls callback if it is given.
+        """
+        if callback is None:
+            return self.record
+
+        def record(url, target, status, duration):
+            self.record(url, target, status, duration)
+            callback(url, target, status, duration)
+        return record
+
+    def finish(self):
+        """
+        Mark the end of the run.
+        """
+        self.end = time.time()
+
+    @property
+    def elapsed(self):
+        return (self.end or time.time()) - self.start
+
+    def percentile(self, q):
+        """
+        Duration below which q percent of the downloads finished,
+        interpolated linearly within the histogram bucket.
+        """
+        if self.downloads == 0:
+            return None
+        rank = q / 100. * self.downloads
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.
+                upper = (self.buckets[i] if i < len(self.buckets)
+                         else self.duration_max)
+                fraction = (rank - cumulative) / float(count)
+                return min(lower + fraction * (upper - lower),
+                           self.duration_max)
+            cumulative += count
+        return self.duration_max
+
+    def summary(self):
+        """
+        Summary of the run as a dictionary that can be stored as JSON.
+        """
+        elapsed = self.elapsed
+        return {'elapsed_seconds': elapsed,
+                'downloads': self.downloads,
+                'retries': self.retries,
+                'files_done': self.files_done,
+                'files_missing': self.files_missing,
+                'files_failed': self.files_failed,
+                'bytes': self.bytes,
+                'not_modified': self.not_modified,
+                'wasted_bytes': self.wasted_bytes,
+                'files_per_second': self.downloads / elapsed if elapsed else None,
+                'bytes_per_second': self.bytes / elapsed if elapsed else None,
+                'statuses': dict((str(status), count) for status, count
+                                 in self.statuses.items()),
+                'duration_seconds': {
+                    'mean': (self.duration_sum / self.downloads
+                             if self.downloads else None),
+                    'p50': self.percentile(50),
+                    'p90': self.percentile(90),
+                    'p99': self.percentile(99),
+                    'max': self.duration_max},
+                'histogram': [{'le': le, 'count': count} for le, count
+                              in zip(self.buckets + ('+Inf',), self.counts)]}
+
+    def write_json(self, path):
+        """
+        Write the summary to a JSON file.
+        """
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def histogram(self, width=40):
+        """
+        Text histogram of the time per file.
+
+        Returns
+        -------
+        text: string
+            one line per bucket with the upper bound, the count and a bar
+        """
+        largest = max(self.counts) or 1
+        lines = []
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            label = '<= {}s'.format(le) if le != '+Inf' else '> {}s'.format(
+                self.buckets[-1])
+            bar = '#' * int(round(width * count / float(largest)))
+            lines.append('{:>10} {:>8} {}'.format(label, count, bar))
+        return '\n'.join(lines)
+
+    def prometheus(self, labels=None):
+        """
+        Metrics in the Prometheus text exposition format.
+
+        Parameters
+        ----------
+        labels: dict, optional
+            labels that are added to every metric, e.g. the dataset
+        """
+        return format_prometheus([(self, labels)])
+
+    def _families(self, labels=None):
+        """
+        List of (name, type, help text, sample lines) of every metric.
+        """
+        base = ''.join(',{}="{}"'.format(key, value)
+                       for key, value in sorted((labels or {}).items()))
+
+        def fmt(extra=''):
+            text = (extra + base).lstrip(',')
+            return '{' + text + '}' if text else ''
+
+        families = []
+
+        def metric(name, kind, help_text, values):
+            families.append((name, kind, help_text,
+                             ['{}{} {}'.format(name, fmt(extra), value)
+                              for extra, value in values]))
+
+        metric('datedown_downloads_total', 'counter',
+               'Finished downloads by status.',
+               [('status="{}"'.format(status), count) for status, count
+                in sorted(self.statuses.items(), key=lambda x: str(x[0]))])
+        metric('datedown_retries_total', 'counter',
+               'Downloads that were tried again.', [('', self.retries)])
+        metric('datedown_files_total', 'counter',
+               'Files by result of the check after downloading.',
+               [('result="done"', self.files_done),
+                ('result="missing"', self.files_missing),
+                ('result="failed"', self.files_failed)])
+        metric('datedown_bytes_total', 'counter',
+               'Bytes of transferred files.', [('', self.bytes)])
+        metric('datedown_not_modified_total', 'counter',
+               'Files that were not transferred since they did not change.',
+               [('', self.not_modified)])
+        metric('datedown_wasted_bytes_total', 'counter',
+               'Bytes of downloads that had to be repeated.',
+               [('', self.wasted_bytes)])
+        cumulative = 0
+        samples = []
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            samples.append('datedown_download_duration_seconds_bucket{} {}'
+                           .format(fmt('le="{}"'.format(le)), cumulative))
+        samples.append('datedown_download_duration_seconds_sum{} {}'
+                       .format(fmt(), self.duration_sum))
+        samples.append('datedown_download_duration_seconds_count{} {}'
+                       .format(fmt(), self.downloads))
+        families.append(('datedown_download_duration_seconds', 'histogram',
+                         'Time per download.', samples))
+        metric('datedown_run_duration_seconds', 'gauge',
+               'Duration of the run.', [('', self.elapsed)])
+        metric('datedown_last_run_timestamp_seconds', 'gauge',
+               'End of the run as unix timestamp.',
+               [('', self.end or time.time())])
+        return families
+
+    def write_prometheus(self, path, labels=None):
+        """
+        Write the metrics to a textfile for the textfile collector of the
+        Prometheus node exporter. The file is replaced atomically so that
+        the exporter never reads a partial file.
+        """
+        write_prometheus(path, [(self, labels)])
+
+
+def format_prometheus(metrics):
+    """
+    Metrics of several runs in one text in the Prometheus text exposition
+    format. The samples of every metric are grouped under one header.
+
+    Parameters
+    ----------
+    metrics: list
+        (Metrics, labels) tuples. The labels have to be different for every
+        run, e.g. the name of the dataset.
+    """
+    names = []
+    families = {}
+    for run_metrics, labels in metrics:
+        for name, kind, help_text, samples in run_metrics._families(labels):
+            if name not in families:
+                names.append(name)
+                families[name] = (kind, help_text, [])
+            families[name][2].extend(samples)
+    lines = []
+    for name in names:
+        kind, help_text, samples = families[name]
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, metrics):
+    """
+    Write the metrics of several runs to one textfile for the textfile
+    collector of the Prometheus node exporter, see format_prometheus.
+    The file is replaced atomically.
+    """
+    _write_atomic(path, format_prometheus(metrics))
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.datedown', dir=directory)
+    with os.fdopen(fd, 'w') as fid:
+        fid.write(text)
+    os.chmod(tmp_path, 0o644)
+    replace(tmp_path, path)
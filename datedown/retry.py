@@ -0,0 +1,128 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Classification of download results and retry delays.
+
+The backends return either a HTTP status code or, for wget, the exit
+status of wget. wget exit statuses are always smaller than 100 so both
+can be told apart.
+'''
+
+import random
+
+# exit statuses of wget, see the EXIT STATUS section of man wget
+WGET_OK = 0
+WGET_ERROR = 1
+WGET_PARSE_ERROR = 2
+WGET_IO_ERROR = 3
+WGET_AUTH_FAILURE = 6
+WGET_SERVER_ERROR = 8
+
+SUCCESS_CODES = (WGET_OK, 200, 206, 304)
+PERMANENT_WGET_CODES = (WGET_PARSE_ERROR, WGET_IO_ERROR, WGET_AUTH_FAILURE)
+# client errors after which a later attempt can succeed
+TRANSIENT_HTTP_CODES = (408, 425, 429)
+
+
+def is_success(status):
+    """
+    Check if a download with status succeeded.
+
+    Parameters
+    ----------
+    status: int
+        HTTP status code, wget exit status or None
+        if no response was received.
+    """
+    return status in SUCCESS_CODES
+
+
+def is_permanent(status):
+    """
+    Check if a download failed in a way that does not change
+    when it is tried again, e.g. 404 Not Found.
+    Network errors, timeouts and 5xx responses are transient.
+
+    Parameters
+    ----------
+    status: int
+        HTTP status code, wget exit status or None
+        if no response was received.
+    """
+    if status is None or is_success(status):
+        return False
+    if status < 100:
+        return status in PERMANENT_WGET_CODES
+    if status in TRANSIENT_HTTP_CODES:
+        return False
+    return status < 500
+
+
+class RetryPolicy(object):
+    """
+    Decides if and when a failed download is tried again.
+
+    The delay before attempt n+1 is backoff * 2 ** (n - 1) seconds, at most
+    max_backoff, randomly shortened by up to jitter times the delay so that
+    failed downloads do not all hit the server at the same moment.
+
+    Parameters
+    ----------
+    max_attempts: int, optional
+        maximum number of attempts per download including the first one
+    backoff: float, optional
+        delay in seconds after the first failed attempt
+    max_backoff: float, optional
+        maximum delay in seconds
+    jitter: float, optional
+        fraction of the delay that is randomized
+    """
+
+    def __init__(self, max_attempts=3, backoff=1., max_backoff=60.,
+                 jitter=0.5):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def should_retry(self, status, attempt):
+        """
+        Check if a download should be tried again.
+
+        Parameters
+        ----------
+        status: int
+            result of the last attempt
+        attempt: int
+            number of the last attempt starting at 1
+        """
+        if is_success(status) or is_permanent(status):
+            return False
+        return attempt < self.max_attempts
+
+    def delay(self, attempt):
+        """
+        Seconds to wait after attempt failed before trying again.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
@@ -0,0 +1,364 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Dispatching of download tasks under per host and global limits.
+'''
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from functools import partial
+
+try:
+    # Python 3
+    from urllib.parse import urlsplit
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit
+
+
+def task_host(task):
+    """
+    Host of a (url, target) task or of the first task in a batch of tasks.
+    """
+    if isinstance(task[0], (list, tuple)):
+        task = task[0]
+    return urlsplit(task[0]).netloc
+
+
+def guarded(func, task):
+    """
+    Call func with the task and catch its exception, so that it can be
+    reported through the callback of Pool.apply_async, which has no
+    error_callback in Python 2.
+
+    Returns
+    -------
+    ok: boolean
+        False if func raised an exception
+    result: object
+        return value of func or the exception
+    """
+    try:
+        return True, func(task)
+    except Exception as e:
+        return False, e
+
+
+class TokenBucket(object):
+    """
+    Token bucket that allows rate requests per second on average
+    and bursts of up to capacity requests. Can be shared between threads.
+
+    Parameters
+    ----------
+    rate: float
+        tokens added per second
+    capacity: float, optional
+        maximum number of tokens in the bucket. Defaults to rate
+        but at least 1.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if capacity is None:
+            capacity = max(rate, 1)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens=1):
+        """
+        Take tokens out of the bucket if enough are available.
+
+        Returns
+        -------
+        wait: float
+            0 if the tokens were taken, otherwise the number of seconds
+            until enough tokens will be available.
+        """
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+
+class BandwidthLimiter(object):
+    """
+    Limit of the bytes per second of all transfers that share it.
+
+    Every transfer reserves the bytes of each block it received and waits
+    until the reservation is covered by the rate. Capacity that idle
+    transfers do not use is taken by the active ones, so that the total
+    stays at the limit. Can be shared between threads and coroutines.
+
+    Parameters
+    ----------
+    rate: float
+        bytes per second
+    burst: float, optional
+        bytes that can be transferred at once after an idle time.
+        Defaults to one second at rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.last = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes):
+        """
+        Reserve nbytes of the bandwidth.
+
+        Returns
+        -------
+        wait: float
+            seconds to wait before the next block may be received
+        """
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= nbytes
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def throttle(self, nbytes):
+        """
+        Reserve nbytes and sleep until they are covered.
+        """
+        wait = self.reserve(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Scheduler(object):
+    """
+    Dispatch tasks to a multiprocessing or thread pool so that at most
+    max_total tasks run at the same time, at most max_per_host tasks run
+    against the same host and no host gets more than rate_per_host
+    requests per second.
+
+    Tasks are read lazily and queued per host so that a throttled host
+    does not block the tasks for other hosts. If a retry policy is given
+    then failed tasks are queued again after their backoff delay while the
+    other tasks keep running.
+
+    The limits hold for all runs of the scheduler together, so that one
+    scheduler can be shared by several threads that run tasks at the same
+    time, e.g. one for every dataset of a job.
+
+    Parameters
+    ----------
+    max_total: int
+        maximum number of tasks running at the same time
+    max_per_host: int, optional
+        maximum number of tasks running against one host at the same time
+    rate_per_host: float, optional
+        maximum number of tasks started per second and host
+    host_fn: function, optional
+        function that returns the host of a task
+    retry: datedown.retry.RetryPolicy, optional
+        policy that decides from the return value of a task
+        if and when it is tried again
+    status_fn: function, optional
+        function that gets the status for the retry policy from the
+        return value of a task. By default the return value is the status.
+    on_retry: function, optional
+        called as on_retry(task, status) for every task that is
+        queued again
+    """
+
+    def __init__(self, max_total, max_per_host=None, rate_per_host=None,
+                 host_fn=task_host, retry=None, status_fn=None,
+                 on_retry=None):
+        self.max_total = max_total
+        self.max_per_host = max_per_host
+        self.rate_per_host = rate_per_host
+        self.host_fn = host_fn
+        self.retry = retry
+        self.status_fn = status_fn
+        self.on_retry = on_retry
+        self.buckets = {}
+        # how many tasks are read ahead from the task iterator
+        self.max_queued = max(1000, 10 * max_total)
+        # running tasks of all runs
+        self._cond = threading.Condition()
+        self._active = {}
+        self._total = 0
+
+    def _bucket(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate_per_host)
+        return self.buckets[host]
+
+    def run(self, pool, func, tasks, retry=None, status_fn=None,
+            on_retry=None):
+        """
+        Run func on all tasks in the pool.
+
+        Parameters
+        ----------
+        pool: multiprocessing.pool.Pool
+            pool that executes the tasks
+        func: function
+            function that is called with one task as only argument
+        tasks: iterable
+            tasks to run
+        retry: datedown.retry.RetryPolicy, optional
+            retry policy of this run instead of the one of the scheduler
+        status_fn: function, optional
+            status_fn of this run instead of the one of the scheduler
+        on_retry: function, optional
+            on_retry of this run instead of the one of the scheduler
+
+        Yields
+        ------
+        task: object
+            finished task
+        result: object
+            return value of the last attempt of func for the task
+        """
+        if retry is None:
+            retry = self.retry
+        if status_fn is None:
+            status_fn = self.status_fn
+        if on_retry is None:
+            on_retry = self.on_retry
+        cond = self._cond
+        active = self._active
+        queues = {}
+        # tasks of this run, the limits are checked against all runs
+        state = {'active': 0, 'queued': 0}
+        # heap of (ready time, sequence number, host, task, attempt)
+        delayed = []
+        finished = deque()
+        errors = []
+        tasks = iter(tasks)
+        exhausted = False
+        counter = itertools.count()
+
+        def done(host, task, attempt, result):
+            with cond:
+                active[host] -= 1
+                self._total -= 1
+                state['active'] -= 1
+                status = result
+                if status_fn is not None:
+                    status = status_fn(result)
+                if retry is not None and \
+                        retry.should_retry(status, attempt):
+                    ready = time.time() + retry.delay(attempt)
+                    heapq.heappush(delayed, (ready, next(counter), host,
+                                             task, attempt + 1))
+                    if on_retry is not None:
+                        on_retry(task, status)
+                else:
+                    finished.append((task, result))
+                # the free slot can be taken by any run
+                cond.notify_all()
+
+        def failed(host, error):
+            with cond:
+                active[host] -= 1
+                self._total -= 1
+                state['active'] -= 1
+                errors.append(error)
+                cond.notify_all()
+
+        def returned(host, task, attempt, outcome):
+            ok, result = outcome
+            if ok:
+                done(host, task, attempt, result)
+            else:
+                failed(host, result)
+
+        while True:
+            with cond:
+                now = time.time()
+                while delayed and delayed[0][0] <= now:
+                    ready, _, host, task, attempt = heapq.heappop(delayed)
+                    # retries go first so that their file is not
+                    # delayed further by the tasks read in the meantime
+                    queues[host].appendleft((task, attempt))
+                    state['queued'] += 1
+
+                while not exhausted and state['queued'] < self.max_queued:
+                    try:
+                        task = next(tasks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    host = self.host_fn(task)
+                    queues.setdefault(host, deque()).append((task, 1))
+                    active.setdefault(host, 0)
+                    state['queued'] += 1
+
+                timeout = None
+                if delayed:
+                    timeout = max(0, delayed[0][0] - now)
+                for host, queue in queues.items():
+                    while queue and self._total < self.max_total:
+                        if self.max_per_host is not None and \
+                                active[host] >= self.max_per_host:
+                            break
+                        if self.rate_per_host is not None:
+                            wait = self._bucket(host).consume()
+                            if wait > 0:
+                                if timeout is None or wait < timeout:
+                                    timeout = wait
+                                break
+                        task, attempt = queue.popleft()
+                        state['queued'] -= 1
+                        active[host] += 1
+                        self._total += 1
+                        state['active'] += 1
+                        pool.apply_async(guarded, (func, task),
+                                         callback=partial(returned, host,
+                                                          task, attempt))
+
+                refill = not exhausted and state['queued'] < self.max_queued
+                if not finished and not errors and not refill:
+                    if exhausted and state['queued'] == 0 and \
+                            state['active'] == 0 and not delayed:
+                        return
+                    cond.wait(timeout)
+                if errors:
+                    raise errors[0]
+                results = list(finished)
+                finished.clear()
+
+            for result in results:
+                yield result
@@ -0,0 +1,234 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Persistent state of download jobs in a SQLite database.
+
+For every (url, target) pair the status, number of attempts, size,
+duration and last error are stored. A later run of the same job only
+has to download what is not done yet without checking the filesystem.
+'''
+
+import sqlite3
+import threading
+import time
+
+from datedown.retry import is_success
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    url TEXT NOT NULL,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER,
+    duration REAL,
+    error TEXT,
+    updated REAL,
+    PRIMARY KEY (url, target)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+"""
+
+# the pairs are looked up through the primary key, the unary + keeps
+# SQLite from scanning all done rows through the status index instead
+DONE_QUERY = """
+SELECT tasks.url, tasks.target FROM (VALUES {}) AS pairs
+JOIN tasks ON tasks.url = pairs.column1 AND tasks.target = pairs.column2
+WHERE +tasks.status = ?
+"""
+
+# values that are None do not overwrite the stored values
+RECORD = """
+INSERT INTO tasks (url, target, status, attempts, bytes, duration,
+                   error, updated)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (url, target) DO UPDATE SET
+    status = excluded.status,
+    attempts = attempts + excluded.attempts,
+    bytes = COALESCE(excluded.bytes, bytes),
+    duration = COALESCE(excluded.duration, duration),
+    error = CASE WHEN excluded.status = 'done' THEN NULL
+                 ELSE COALESCE(excluded.error, error) END,
+    updated = excluded.updated
+"""
+
+# results of download attempts do not change the status
+RECORD_DOWNLOAD = """
+INSERT INTO tasks (url, target, status, duration, error, updated)
+VALUES (?, ?, 'pending', ?, ?, ?)
+ON CONFLICT (url, target) DO UPDATE SET
+    duration = excluded.duration,
+    error = COALESCE(excluded.error, error),
+    updated = excluded.updated
+"""
+
+
+class StateStore(object):
+    """
+    SQLite database with the state of every (url, target) pair of a job.
+
+    Updates are buffered and written in one transaction every batch_size
+    updates. Can be shared between threads.
+
+    Parameters
+    ----------
+    path: string
+        path of the database file
+    batch_size: int, optional
+        number of updates that are committed together
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def _add(self, statement, values):
+        with self._lock:
+            self._buffer.append((statement, values))
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        with self._conn:
+            for statement, values in buffer:
+                self._conn.execute(statement, values)
+
+    def record(self, url, target, status, attempts=1, nbytes=None,
+               duration=None, error=None):
+        """
+        Record the state of a (url, target) pair.
+
+        Parameters
+        ----------
+        url: string
+            url of the file
+        target: string
+            local path of the file
+        status: string
+            PENDING, DONE or FAILED
+        attempts: int, optional
+            number of attempts to add to the stored attempts
+        nbytes: int, optional
+            size of the downloaded file
+        duration: float, optional
+            duration of the last attempt in seconds
+        error: string, optional
+            description of the last error
+        """
+        self._add(RECORD, (url, target, status, attempts, nbytes, duration,
+                           error, time.time()))
+
+    def record_download(self, url, target, status, duration):
+        """
+        Record duration and error of a download attempt.
+        Has the signature of the callback of datedown.down.download.
+        """
+        error = None
+        if not is_success(status):
+            error = 'status {}'.format(status)
+        self._add(RECORD_DOWNLOAD, (url, target, duration, error,
+                                    time.time()))
+
+    def commit(self):
+        """
+        Write all buffered updates to the database.
+        """
+        with self._lock:
+            self._flush()
+
+    def done(self, pairs):
+        """
+        Find the (url, target) pairs that are done.
+
+        Parameters
+        ----------
+        pairs: list
+            list of (url, target) tuples
+
+        Returns
+        -------
+        done: set
+            set of (url, target) tuples that were downloaded successfully
+        """
+        done = set()
+        self.commit()
+        with self._lock:
+            # stay below the SQLite limit of host parameters per statement
+            for i in range(0, len(pairs), 400):
+                chunk = pairs[i:i + 400]
+                query = DONE_QUERY.format(', '.join(['(?, ?)'] * len(chunk)))
+                params = [value for pair in chunk for value in pair]
+                rows = self._conn.execute(query, params + [DONE])
+                done.update(rows)
+        return done
+
+    def pending(self):
+        """
+        Iterate over (url, target) pairs that are not done.
+        """
+        self.commit()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT url, target FROM tasks WHERE status != ?',
+                (DONE,)).fetchall()
+        return iter(rows)
+
+    def get(self, url, target):
+        """
+        Stored state of a (url, target) pair.
+
+        Returns
+        -------
+        state: dict
+            with the keys status, attempts, bytes, duration and error
+            or None if the pair is unknown.
+        """
+        self.commit()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, attempts, bytes, duration, error FROM tasks '
+                'WHERE url = ? AND target = ?', (url, target)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('status', 'attempts', 'bytes', 'duration', 'error'),
+                        row))
+
+    def close(self):
+        """
+        Commit all updates and close the database.
+        """
+        self.commit()
+        self._conn.close()
@@ -24,6 +24,16 @@
 Module for creating the URLs from the datetimes.
 '''
 
+import re
+
+import numpy as np
+
+DIRECTIVE = re.compile(r'%(.)')
+
+#: directives that can be rendered from numeric fields and their formats
+FIELD_FORMATS = {'Y': '%04d', 'y': '%02d', 'm': '%02d', 'd': '%02d',
+                 'j': '%03d', 'H': '%02d', 'M': '%02d', 'S': '%02d'}
+
 
 def create_dt_url(dt, root, fname, subdirs=[]):
     """
@@ -55,3 +65,183 @@ def create_dt_url(dt, root, fname, subdirs=[]):
     dt_fname = dt.strftime(fname)
     url = '/'.join([root] + dt_subdirs + [dt_fname])
     return url
+
+
+def dt_fields(dts, directives):
+    """
+    Numeric fields of datetimes for strftime directives.
+
+    Parameters
+    ----------
+    dts: list or numpy.ndarray
+        datetime.datetime objects or datetime64 array
+    directives: list
+        directives from FIELD_FORMATS
+
+    Returns
+    -------
+    fields: dict
+        list of integers for every directive
+    """
+    dts = np.asarray(dts, dtype='M8[us]')
+    years = dts.astype('M8[Y]')
+    months = dts.astype('M8[M]')
+    days = dts.astype('M8[D]')
+    hours = dts.astype('M8[h]')
+    minutes = dts.astype('M8[m]')
+    fields = {}
+    for directive in set(directives):
+        if directive == 'Y':
+            field = years.astype(np.int64) + 1970
+        elif directive == 'y':
+            field = (years.astype(np.int64) + 1970) % 100
+        elif directive == 'm':
+            field = months.astype(np.int64) % 12 + 1
+        elif directive == 'd':
+            field = (days - months.astype('M8[D]')).astype(np.int64) + 1
+        elif directive == 'j':
+            field = (days - years.astype('M8[D]')).astype(np.int64) + 1
+        elif directive == 'H':
+            field = (hours - days).astype(np.int64)
+        elif directive == 'M':
+            field = (minutes - hours).astype(np.int64)
+        else:
+            field = (dts.astype('M8[s]') - minutes).astype(np.int64)
+        fields[directive] = field.tolist()
+    return fields
+
+
+class DtTemplate(object):
+    """
+    Template for strings like URLs or paths that depend on a datetime.
+    The template is parsed once into literal parts and datetime fields so
+    that many datetimes can be rendered at once.
+
+    Parameters
+    ----------
+    prefix: string
+        literal start of every string, e.g. the root of the URL
+    template: string
+        strftime template of the rest of the string
+    sep: string, optional
+        separator of directories. Directories are only rendered once
+        for consecutive datetimes that share them.
+    """
+
+    def __init__(self, prefix, template, sep='/'):
+        self.prefix = prefix
+        self.template = template
+        directives = DIRECTIVE.findall(template)
+        self.compiled = all(d in FIELD_FORMATS or d == '%'
+                            for d in directives)
+        split = template.rfind(sep) + 1
+        self.dir_fmt, self.dir_fields = self._compile(prefix,
+                                                      template[:split])
+        self.name_fmt, self.name_fields = self._compile('', template[split:])
+
+    def _compile(self, prefix, template):
+        """
+        Convert a strftime template to a %-format and a list of the
+        directives that are filled in.
+        """
+        fmt = [prefix.replace('%', '%%')]
+        fields = []
+        pos = 0
+        for match in DIRECTIVE.finditer(template):
+            fmt.append(template[pos:match.start()].replace('%', '%%'))
+            directive = match.group(1)
+            if directive == '%':
+                fmt.append('%%')
+            else:
+                fmt.append(FIELD_FORMATS.get(directive, ''))
+                fields.append(directive)
+            pos = match.end()
+        fmt.append(template[pos:].replace('%', '%%'))
+        return ''.join(fmt), fields
+
+    def render(self, dt):
+        """
+        Render the template for one datetime.
+
+        Parameters
+        ----------
+        dt: datetime.datetime
+            date as basis for the string
+
+        Returns
+        -------
+        string: string
+        """
+        return self.prefix + dt.strftime(self.template)
+
+    __call__ = render
+
+    def render_many(self, dts):
+        """
+        Render the template for many datetimes at once.
+
+        Parameters
+        ----------
+        dts: list or numpy.ndarray
+            datetime.datetime objects or datetime64 array
+
+        Returns
+        -------
+        strings: list
+        """
+        if not self.compiled:
+            if isinstance(dts, np.ndarray):
+                dts = dts.astype('M8[us]').tolist()
+            return [self.render(dt) for dt in dts]
+        if len(dts) == 0:
+            return []
+        fields = dt_fields(dts, self.dir_fields + self.name_fields)
+        n = len(dts)
+
+        # render every directory only where it changes
+        dir_values = [fields[d] for d in self.dir_fields]
+        starts = [0]
+        if dir_values:
+            changes = np.zeros(n - 1, dtype=bool)
+            for values in dir_values:
+                values = np.asarray(values)
+                changes |= values[1:] != values[:-1]
+            starts.extend((np.flatnonzero(changes) + 1).tolist())
+        counts = np.diff(starts + [n]).tolist()
+        dirs = [self.dir_fmt % tuple(values[i] for values in dir_values)
+                for i in starts]
+
+        name_values = list(zip(*[fields[d] for d in self.name_fields]))
+        if not name_values:
+            name_values = [()] * n
+        name_fmt = self.name_fmt
+        strings = []
+        i = 0
+        for directory, count in zip(dirs, counts):
+            strings.extend([directory + name_fmt % values
+                            for values in name_values[i:i + count]])
+            i += count
+        return strings
+
+
+def compile_dt_url(root, fname, subdirs=[]):
+    """
+    Compile the URL template of create_dt_url.
+
+    Parameters
+    ----------
+    root: string
+        root of the url
+    fname: string
+        filename to use
+    subdirs: list, optional
+        list of strings.
+        Each element represents a subdirectory.
+
+    Returns
+    -------
+    template: DtTemplate
+        callable that creates the same URLs as create_dt_url and
+        renders many datetimes at once with render_many
+    """
+    return DtTemplate(root + '/', '/'.join(list(subdirs or []) + [fname]))
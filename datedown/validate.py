@@ -0,0 +1,200 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Validation of downloaded files.
+
+A validator is a function that takes the path of a downloaded file and
+returns True if the file is valid. The validators in this module only
+read the first few bytes of a file, except for the checksum validator.
+'''
+
+import hashlib
+import os
+from multiprocessing.pool import ThreadPool
+
+# known file signatures by file extension
+MAGIC_BYTES = {'.nc': (b'CDF\x01', b'CDF\x02', b'CDF\x05',
+                       b'\x89HDF\r\n\x1a\n'),
+               '.nc4': (b'\x89HDF\r\n\x1a\n',),
+               '.h5': (b'\x89HDF\r\n\x1a\n',),
+               '.hdf5': (b'\x89HDF\r\n\x1a\n',),
+               '.he5': (b'\x89HDF\r\n\x1a\n',),
+               '.grb': (b'GRIB',),
+               '.grib': (b'GRIB',),
+               '.grb2': (b'GRIB',),
+               '.grib2': (b'GRIB',),
+               '.zip': (b'PK\x03\x04',),
+               '.gz': (b'\x1f\x8b',)}
+
+# HDF5 files can start with a user block of 512, 1024, 2048... bytes
+HDF5_OFFSETS = (0, 512, 1024, 2048)
+
+CHECKSUM_EXTENSIONS = (('.md5', 'md5'),
+                       ('.sha1', 'sha1'),
+                       ('.sha256', 'sha256'),
+                       ('.sha512', 'sha512'))
+
+
+def _read_head(target, size, offset=0):
+    with open(target, 'rb') as fid:
+        fid.seek(offset)
+        return fid.read(size)
+
+
+def not_empty(target):
+    """
+    Check that the file is not empty.
+    """
+    return os.path.getsize(target) > 0
+
+
+def not_html(target):
+    """
+    Check that the file is not a HTML page, e.g. an error or login page
+    that was stored instead of the data. HTML files themselves pass.
+    """
+    if os.path.splitext(target)[1].lower() in ('.html', '.htm'):
+        return True
+    head = _read_head(target, 512).lstrip().lower()
+    return not (head.startswith(b'<!doctype html') or
+                head.startswith(b'<html'))
+
+
+def magic_bytes(target):
+    """
+    Check the signature of NetCDF, HDF5, GRIB, zip and gzip files.
+    Files with other extensions pass.
+    """
+    signatures = MAGIC_BYTES.get(os.path.splitext(target)[1].lower())
+    if signatures is None:
+        return True
+    length = max(len(signature) for signature in signatures)
+    head = _read_head(target, length)
+    if any(head.startswith(signature) for signature in signatures):
+        return True
+    if b'\x89HDF\r\n\x1a\n' in signatures:
+        for offset in HDF5_OFFSETS[1:]:
+            if _read_head(target, 8, offset) == b'\x89HDF\r\n\x1a\n':
+                return True
+    return False
+
+
+def checksum(target, blocksize=1048576):
+    """
+    Compare the file with a checksum sidecar file like target.md5
+    or target.sha256 in the same directory. The sidecar has to contain the
+    hex digest as the first word like the output of md5sum.
+    Files without sidecar pass.
+    """
+    for extension, algorithm in CHECKSUM_EXTENSIONS:
+        sidecar = target + extension
+        if not os.path.exists(sidecar):
+            continue
+        with open(sidecar) as fid:
+            words = fid.read().split()
+        if len(words) == 0:
+            return False
+        digest = hashlib.new(algorithm)
+        with open(target, 'rb') as fid:
+            while True:
+                block = fid.read(blocksize)
+                if not block:
+                    break
+                digest.update(block)
+        return digest.hexdigest() == words[0].lower()
+    return True
+
+
+def expected_size(sizes):
+    """
+    Create a validator that compares the file size with the
+    size that was announced by the server.
+
+    Parameters
+    ----------
+    sizes: dict
+        expected size in bytes by target path, e.g. the Content-Length
+        of the responses. Targets that are not in sizes pass.
+
+    Returns
+    -------
+    validator: function
+    """
+    def validator(target):
+        size = sizes.get(target)
+        return size is None or os.path.getsize(target) == size
+    return validator
+
+
+# validators that only read the first bytes of every file
+DEFAULT_VALIDATORS = [not_empty, not_html, magic_bytes]
+
+
+def is_valid(target, validators):
+    """
+    Check a file with all validators.
+
+    Parameters
+    ----------
+    target: string
+        path of the file
+    validators: list
+        list of validator functions
+
+    Returns
+    -------
+    valid: boolean
+        True if all validators accept the file
+    """
+    try:
+        return all(validator(target) for validator in validators)
+    except (IOError, OSError):
+        return False
+
+
+def validate(targets, validators=DEFAULT_VALIDATORS, num_threads=8):
+    """
+    Check files in parallel threads.
+
+    Parameters
+    ----------
+    targets: list
+        paths of existing files
+    validators: list, optional
+        list of validator functions
+    num_threads: int, optional
+        number of threads that check files at the same time
+
+    Returns
+    -------
+    valid: list
+        one boolean per target
+    """
+    if len(targets) == 0:
+        return []
+    pool = ThreadPool(min(num_threads, len(targets)))
+    try:
+        return pool.map(lambda target: is_valid(target, validators), targets)
+    finally:
+        pool.close()
+        pool.join()
@@ -26,10 +26,78 @@ Interface to wget command line utility.
 
 import subprocess
 import os
+import re
+import sys
+import shutil
+import tempfile
+import posixpath
+try:
+    # Python 3
+    from urllib.parse import urlsplit, unquote
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit
+    from urllib import unquote
+
+from datedown.fname_creator import part_fname, replace
+import datedown.fname_creator as fname_creator
+from datedown.retry import WGET_OK, WGET_ERROR, WGET_SERVER_ERROR
+
+
+def call(cmd_list):
+    """
+    Run a wget command through the shell. The output of wget
+    is passed through and searched for HTTP errors.
+
+    Parameters
+    ----------
+    cmd_list: list
+        wget command and arguments
+
+    Returns
+    -------
+    status: int
+        exit status of wget. If wget exited because of a server error
+        and reported a HTTP status code then this status code.
+    """
+    proc = subprocess.Popen(" ".join(cmd_list), shell=True,
+                            stderr=subprocess.PIPE)
+    http_status = None
+    for line in iter(proc.stderr.readline, b''):
+        sys.stderr.write(line.decode('utf-8', 'replace'))
+        match = re.search(br'ERROR (\d{3})', line)
+        if match is not None:
+            http_status = int(match.group(1))
+    proc.stderr.close()
+    status = proc.wait()
+    if status == WGET_SERVER_ERROR and http_status is not None:
+        status = http_status
+    return status
+
+
+def cookie_args(cookie_file, save_cookies=True):
+    """
+    wget arguments for using a cookie file.
+
+    Parameters
+    ----------
+    cookie_file: string
+        file with cookies in Netscape format
+    save_cookies: boolean, optional
+        If set wget also writes the cookies it receives to the file.
+        Otherwise the file is only read, e.g. if it is shared by many
+        wget processes.
+    """
+    args = ['--load-cookies', cookie_file]
+    if save_cookies:
+        args = args + ['--save-cookies', cookie_file,
+                       '--keep-session-cookies']
+    return args
 
 
 def download(url, target, username=None, password=None, cookie_file=None,
-             recursive=False, filetypes=None):
+             recursive=False, filetypes=None, resume=False, makedirs=True,
+             save_cookies=True, limit_rate=None):
     """
     Download a url using wget.
     Retry as often as necessary and store cookies if
@@ -52,7 +120,27 @@ def download(url, target, username=None, password=None, cookie_file=None,
         The data will then be downloaded recursively and stored in the target folder.
     filetypes: list, optional
         list of file extension to download, any others will no be downloaded
+    resume: boolean, optional
+        If set the file is downloaded to target.part and renamed to target
+        once wget finished successfully. An existing target.part is continued.
+        Ignored for recursive downloads.
+    makedirs: boolean, optional
+        Create the directory of the target if it does not exist.
+        Can be switched off if the directories were created beforehand,
+        see datedown.fname_creator.create_dirs.
+    save_cookies: boolean, optional
+        If not set the cookie file is only read, e.g. for the cookie file
+        of a datedown.auth.AuthSession.
+    limit_rate: int, optional
+        maximum bytes per second of this wget process
+
+    Returns
+    -------
+    status: int
+        exit status of wget. If wget reported a server error
+        the HTTP status code of the error, e.g. 404.
     """
+    resume = resume and not recursive
     cmd_list = ['wget',
                 url,
                 '--retry-connrefused']
@@ -62,31 +150,35 @@ def download(url, target, username=None, password=None, cookie_file=None,
         cmd_list = cmd_list + ['-nd']
         cmd_list = cmd_list + ['-np']
         cmd_list = cmd_list + ['-r']
+    elif resume:
+        cmd_list = cmd_list + ['-c', '-O', part_fname(target)]
     else:
         cmd_list = cmd_list + ['-O', target]
 
     if filetypes is not None:
         cmd_list = cmd_list + ['-A ' + ','.join(filetypes)]
+    if limit_rate is not None:
+        cmd_list.append('--limit-rate={}'.format(int(limit_rate)))
 
-    target_path = os.path.split(target)[0]
-    if not os.path.exists(target_path):
-        os.makedirs(target_path)
+    if makedirs:
+        fname_creator.makedirs(os.path.split(target)[0])
 
     if username is not None:
         cmd_list.append('--user={}'.format(username))
     if password is not None:
         cmd_list.append('--password={}'.format(password))
     if cookie_file is not None:
-        cmd_list = cmd_list + [
-            '--load-cookies', cookie_file,
-            '--save-cookies', cookie_file,
-            '--keep-session-cookies']
+        cmd_list = cmd_list + cookie_args(cookie_file, save_cookies)
 
-    subprocess.call(" ".join(cmd_list), shell=True)
+    status = call(cmd_list)
+    if resume and status == 0:
+        replace(part_fname(target), target)
+    return status
 
 
 def map_download(url_target, username=None, password=None, cookie_file=None,
-                 recursive=False, filetypes=None):
+                 recursive=False, filetypes=None, resume=False,
+                 makedirs=True, save_cookies=True, limit_rate=None):
     """
     variant of the function that only takes one argument.
     Otherwise map_async of the multiprocessing module can not work with the function.
@@ -106,10 +198,126 @@ def map_download(url_target, username=None, password=None, cookie_file=None,
         The data will then be downloaded recursively and stored in the target folder.
     filetypes: list, optional
         list of file extension to download, any others will no be downloaded
+    resume: boolean, optional
+        download to a .part file and resume it if it exists
+    makedirs: boolean, optional
+        create the directory of the target if it does not exist
+    save_cookies: boolean, optional
+        write received cookies to the cookie file
+    limit_rate: int, optional
+        maximum bytes per second of the wget process
+    """
+    return download(url_target[0], url_target[1],
+                    username=username,
+                    password=password,
+                    cookie_file=cookie_file,
+                    recursive=recursive,
+                    filetypes=filetypes,
+                    resume=resume,
+                    makedirs=makedirs,
+                    save_cookies=save_cookies,
+                    limit_rate=limit_rate)
+
+
+def url_fname(url):
     """
-    download(url_target[0], url_target[1],
-             username=username,
-             password=password,
-             cookie_file=cookie_file,
-             recursive=recursive,
-             filetypes=filetypes)
+    Filename that wget uses when storing a url without -O.
+
+    Parameters
+    ----------
+    url: string
+        URL
+
+    Returns
+    -------
+    fname: string
+        last part of the path of the url
+    """
+    return unquote(posixpath.basename(urlsplit(url).path))
+
+
+def batch_download(url_targets, username=None, password=None,
+                   cookie_file=None, makedirs=True, save_cookies=True,
+                   limit_rate=None):
+    """
+    Download several urls with one wget process so that wget can reuse
+    its connection to the server. All targets must be in the same
+    directory and the filenames of the urls must be unique, see
+    url_fname. Urls with a query are stored under another name by wget
+    and have to be downloaded alone.
+
+    The files are first downloaded into a temporary directory next to
+    the targets and then renamed to the target filenames. A single url
+    is downloaded directly to its target.
+
+    Parameters
+    ----------
+    url_targets: list
+        list of (url, target) tuples
+    username: string, optional
+        username
+    password: string, optional
+        password
+    cookie_file: string, optional
+        file where to store cookies
+    makedirs: boolean, optional
+        create the directory of the targets if it does not exist
+    save_cookies: boolean, optional
+        write received cookies to the cookie file
+    limit_rate: int, optional
+        maximum bytes per second of the wget process
+
+    Returns
+    -------
+    statuses: list
+        exit status of wget for every file. Files that are missing after
+        wget exited with 0 get datedown.retry.WGET_ERROR. wget does not
+        tell which of the other files failed.
+    """
+    if len(url_targets) == 1:
+        url, target = url_targets[0]
+        return [download(url, target, username=username, password=password,
+                         cookie_file=cookie_file, makedirs=makedirs,
+                         save_cookies=save_cookies, limit_rate=limit_rate)]
+
+    target_path = os.path.split(url_targets[0][1])[0]
+    if makedirs:
+        fname_creator.makedirs(target_path)
+
+    tmp_path = tempfile.mkdtemp(prefix='.datedown', dir=target_path)
+    try:
+        url_list = os.path.join(tmp_path, '.urls')
+        with open(url_list, 'w') as fid:
+            for url, target in url_targets:
+                fid.write(url + '\n')
+
+        cmd_list = ['wget',
+                    '-i', url_list,
+                    '-P', tmp_path,
+                    '-nd',
+                    '--retry-connrefused']
+        if username is not None:
+            cmd_list.append('--user={}'.format(username))
+        if password is not None:
+            cmd_list.append('--password={}'.format(password))
+        if cookie_file is not None:
+            cmd_list = cmd_list + cookie_args(cookie_file, save_cookies)
+        if limit_rate is not None:
+            cmd_list.append('--limit-rate={}'.format(int(limit_rate)))
+
+        status = call(cmd_list)
+
+        statuses = []
+        for url, target in url_targets:
+            downloaded = os.path.join(tmp_path, url_fname(url))
+            if os.path.exists(downloaded):
+                if os.path.exists(target):
+                    os.remove(target)
+                os.rename(downloaded, target)
+                statuses.append(status)
+            else:
+                statuses.append(status if status != WGET_OK else WGET_ERROR)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return statuses
+
@@ -10,3 +10,102 @@
 from __future__ import print_function, absolute_import, division
 
 import pytest
+import io
+import os
+import sys
+import threading
+
+try:
+    # Python 3
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients abort transfers on purpose, e.g. for segmented downloads
+        if not isinstance(sys.exc_info()[1], (IOError, OSError)):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+class KeepAliveHandler(SimpleHTTPRequestHandler):
+    """
+    Serve the tests directory with HTTP/1.1 keep-alive and
+    count the number of connections that were opened.
+    """
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+
+    def setup(self):
+        SimpleHTTPRequestHandler.setup(self)
+        KeepAliveHandler.connections += 1
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        SimpleHTTPRequestHandler.end_headers(self)
+
+    def send_head(self):
+        """
+        Support single byte ranges like bytes=100- or bytes=100-199.
+        """
+        byte_range = self.headers.get('Range')
+        path = self.translate_path(self.path)
+        if byte_range is None or not os.path.isfile(path):
+            return SimpleHTTPRequestHandler.send_head(self)
+        start, end = byte_range.split('=')[1].split('-')
+        start = int(start)
+        size = os.path.getsize(path)
+        end = min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        fid = io.BytesIO()
+        with open(path, 'rb') as source:
+            source.seek(start)
+            fid.write(source.read(end - start + 1))
+        fid.seek(0)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range",
+                         "bytes {}-{}/{}".format(start, end, size))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        return fid
+
+    def translate_path(self, path):
+        path = SimpleHTTPRequestHandler.translate_path(self, path)
+        relpath = os.path.relpath(path, os.getcwd())
+        return os.path.join(os.path.dirname(__file__), relpath)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(request):
+    """
+    Serve the tests directory in a thread of the test process.
+    Returns the root URL of the server.
+    """
+    KeepAliveHandler.connections = 0
+    server = ThreadingHTTPServer(('localhost', 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(stop)
+
+    return "http://localhost:{}".format(server.server_address[1])
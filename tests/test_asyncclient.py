@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the asyncio download engine.
+'''
+import os
+import shutil
+
+from datedown.asyncclient import download
+from datedown.down import check_downloaded
+from datedown.interface import main
+from datedown.interface import parse_args
+import pytest
+
+
+@pytest.fixture
+def output_path(request):
+
+    output_path = os.path.join(os.path.dirname(__file__), "output_async")
+
+    def cleanup():
+        shutil.rmtree(output_path)
+
+    try:
+        cleanup()
+    except OSError:
+        pass
+
+    request.addfinalizer(cleanup)
+
+    return output_path
+
+
+def test_download(output_path, http_server):
+    from conftest import KeepAliveHandler
+    fnames = ["2000/01/file_2000_01_01.txt",
+              "2000/01/file_2000_01_02.txt",
+              "2000/02/file_2000_02_01.txt",
+              "2000/02/file_2000_02_02.txt"]
+    urls = [http_server + "/test_data/year_month_subfolders/" + fname
+            for fname in fnames]
+    targets = [os.path.join(output_path, fname) for fname in fnames]
+    statuses = download(urls, targets, concurrency=4, max_per_host=1,
+                        rate_per_host=100)
+    assert statuses == [200, 200, 200, 404]
+    not_urls, not_fnames = check_downloaded(urls, targets)
+    assert not_fnames == targets[3:]
+    assert KeepAliveHandler.connections == 1
+
+
+def test_main_async(output_path, http_server):
+    args = ["2000-01-01", "2000-01-02",
+            http_server,
+            "file_%Y_%m_%d.txt",
+            output_path,
+            "--urlsubdirs", "test_data", "year_month_subfolders", '%Y', '%m',
+            "--engine", "async", "--concurrency", "8"]
+    assert parse_args(args).concurrency == 8
+
+    main(args)
+
+    for day in ['01', '02']:
+        assert os.path.exists(os.path.join(
+            output_path, "test_data", "year_month_subfolders", '2000', '01',
+            'file_2000_01_{}.txt'.format(day)))
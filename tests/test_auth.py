@@ -0,0 +1,119 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the shared authenticated session.
+'''
+import base64
+import os
+import threading
+
+import pytest
+
+from conftest import ThreadingHTTPServer, KeepAliveHandler
+from datedown.auth import AuthSession
+from datedown.down import download
+
+TOKEN = 'session=abc123'
+
+
+class LoginHandler(KeepAliveHandler):
+    """
+    Redirect requests without session cookie to /login which
+    sets the cookie after a successful basic authentication.
+    """
+    logins = 0
+
+    def send_head(self):
+        if self.path.startswith('/login'):
+            expected = base64.b64encode(b'user:secret').decode('ascii')
+            if self.headers.get('Authorization') != 'Basic ' + expected:
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', 'Basic realm="test"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            LoginHandler.logins += 1
+            self.send_response(302)
+            self.send_header('Set-Cookie', TOKEN + '; Path=/')
+            self.send_header('Location', self.path.split('?next=')[1])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        if TOKEN not in (self.headers.get('Cookie') or ''):
+            self.send_response(302)
+            self.send_header('Location', '/login?next=' + self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        return KeepAliveHandler.send_head(self)
+
+
+@pytest.fixture
+def login_server(request):
+    LoginHandler.logins = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LoginHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(stop)
+
+    return "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+FNAMES = ['2000/01/file_2000_01_01.txt', '2000/01/file_2000_01_02.txt',
+          '2000/02/file_2000_02_01.txt']
+
+
+def test_login(login_server):
+    session = AuthSession('user', 'secret')
+    session.ensure(login_server + '/test_data/year_month_subfolders/' +
+                   FNAMES[0])
+    assert LoginHandler.logins == 1
+    with open(session.cookie_file) as fid:
+        assert 'abc123' in fid.read()
+    # not renewed before max_age or for other errors
+    session.ensure()
+    assert not session.check(404)
+    assert not session.check(401)
+    session.logged_in -= 60
+    assert session.check(401)
+    assert LoginHandler.logins == 2
+    session.close()
+    assert not os.path.exists(session.cookie_file)
+
+
+@pytest.mark.parametrize('backend', ['wget', 'http'])
+def test_download_shared_session(tmpdir, login_server, backend):
+    urls = [login_server + '/test_data/year_month_subfolders/' + fname
+            for fname in FNAMES]
+    targets = [str(tmpdir.join(fname)) for fname in FNAMES]
+    session = AuthSession('user', 'secret')
+    download(urls, targets, num_proc=2, backend=backend, session=session)
+    for target in targets:
+        assert os.path.exists(target)
+    assert LoginHandler.logins == 1
+    session.close()
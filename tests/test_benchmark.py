@@ -0,0 +1,75 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the helpers of the benchmark.
+'''
+import math
+import os
+import sys
+
+import pytest
+
+# the benchmark is a script and not part of the package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'benchmarks'))
+from benchmark import parse_size, file_sizes, compare, percentile
+
+
+def test_parse_size():
+    assert parse_size('512') == 512
+    assert parse_size('64K') == 64 * 1024
+    assert parse_size('1.5m') == int(1.5 * 1024 ** 2)
+    assert parse_size(' 2GB ') == 2 * 1024 ** 3
+
+
+def test_file_sizes():
+    assert file_sizes('fixed:1K', 3) == [1024] * 3
+    sizes = file_sizes('uniform:1K:2K', 100)
+    assert len(sizes) == 100
+    assert min(sizes) >= 1024
+    assert max(sizes) <= 2048
+    # the same seed gives the same sizes
+    assert file_sizes('lognormal:1M:1.5', 10, seed=1) == \
+        file_sizes('lognormal:1M:1.5', 10, seed=1)
+    assert min(file_sizes('lognormal:1:5', 100)) >= 1
+    with pytest.raises(ValueError):
+        file_sizes('normal:1M:1', 10)
+
+
+def test_percentile():
+    values = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert percentile(values, 0) == 0.1
+    assert percentile(values, 50) == 0.3
+    assert percentile(values, 100) == 0.5
+    assert percentile([2.], 99) == 2.
+    assert math.isnan(percentile([], 50))
+
+
+def test_compare():
+    baseline = [{'backend': 'http', 'concurrency': 4, 'files_per_s': 100.},
+                {'backend': 'wget', 'concurrency': 4, 'files_per_s': 10.}]
+    results = [{'backend': 'http', 'concurrency': 4, 'files_per_s': 80.},
+               {'backend': 'wget', 'concurrency': 4, 'files_per_s': 9.5},
+               {'backend': 'async', 'concurrency': 4, 'files_per_s': 1.}]
+    assert compare(results, baseline, 0.1) == [('http', 4, 80., 100.)]
+    assert compare(results, baseline, 0.25) == []
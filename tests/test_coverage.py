@@ -0,0 +1,114 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the coverage of local archives.
+'''
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from datedown.coverage import template_regex, scan_dt_fpaths, Coverage
+from datedown.dates import date_range
+from datedown.fname_creator import create_dt_fpath
+
+
+def touch(path):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    open(path, 'w').close()
+
+
+def test_template_regex():
+    regex = template_regex('f_%Y%m%d_%H%%_%Y.nc')
+    assert regex.match('f_20000102_03%_2000.nc').groupdict() == \
+        {'Y': '2000', 'm': '01', 'd': '02', 'H': '03'}
+    assert regex.match('f_20000102_03%_2001.nc') is None
+    assert regex.match('f_20000102_03%_2000.nc.part') is None
+    with pytest.raises(ValueError):
+        template_regex('%b')
+
+
+def test_scan_dt_fpaths(tmpdir):
+    root = str(tmpdir)
+    fname = 'f_%Y%m%d.nc'
+    subdirs = ['data', '%Y', '%m']
+    dts = [datetime(2000, 12, 31), datetime(2001, 1, 1),
+           datetime(2001, 1, 3)]
+    for dt in dts:
+        touch(create_dt_fpath(dt, root, fname, subdirs))
+    # unfinished download, other files and a year that does not match
+    touch(create_dt_fpath(datetime(2001, 1, 2), root, fname, subdirs) +
+          '.part')
+    touch(os.path.join(root, 'data', '2001', 'notes.txt'))
+    touch(os.path.join(root, 'data', '2001', '02', 'f_20020201.nc'))
+    found = scan_dt_fpaths(root, fname, subdirs)
+    np.testing.assert_array_equal(found, np.array(dts, dtype='M8[us]'))
+    assert len(scan_dt_fpaths(os.path.join(root, 'missing'),
+                              fname, subdirs)) == 0
+    with pytest.raises(ValueError):
+        scan_dt_fpaths(root, 'f.nc', ['data'])
+
+
+def test_scan_dt_fpaths_doy(tmpdir):
+    root = str(tmpdir)
+    touch(os.path.join(root, '99', 'f_060_12.nc'))
+    touch(os.path.join(root, '00', 'f_060_12.nc'))
+    found = scan_dt_fpaths(root, 'f_%j_%H.nc', ['%y'])
+    np.testing.assert_array_equal(
+        found, np.array([datetime(1999, 3, 1, 12), datetime(2000, 2, 29, 12)],
+                        dtype='M8[us]'))
+
+
+def test_coverage():
+    present = np.array([datetime(2000, 1, 1), datetime(2000, 1, 2),
+                        datetime(2000, 1, 5)], dtype='M8[us]')
+    coverage = Coverage(present, 'day')
+    dts = date_range(datetime(2000, 1, 1), datetime(2000, 1, 7), '12H')
+    assert coverage.covered(dts).tolist() == [True] * 4 + [False] * 4 + \
+        [True] * 2 + [False] * 3
+    np.testing.assert_array_equal(coverage.since_last(dts), dts[10:])
+    np.testing.assert_array_equal(coverage.missing(dts),
+                                  np.concatenate([dts[4:8], dts[10:]]))
+    assert coverage.gaps(dts) == [(dts[4], dts[7]), (dts[10], dts[12])]
+    assert coverage.last == np.datetime64('2000-01-05')
+
+
+def test_coverage_empty():
+    coverage = Coverage(np.array([], dtype='M8[us]'), 'month')
+    dts = date_range(datetime(2000, 1, 1), datetime(2000, 3, 1), '1M')
+    assert coverage.last is None
+    assert len(coverage) == 0
+    np.testing.assert_array_equal(coverage.missing(dts), dts)
+    np.testing.assert_array_equal(coverage.since_last(dts), dts)
+
+
+def test_coverage_scan(tmpdir):
+    root = str(tmpdir)
+    touch(os.path.join(root, '2000', 'f_2000_02.nc'))
+    coverage = Coverage.scan(root, 'f_%Y_%m.nc', ['%Y'])
+    assert coverage.resolution == 'month'
+    dts = date_range(datetime(2000, 1, 1), datetime(2000, 3, 31), '1D')
+    assert len(coverage.missing(dts)) == 31 + 31
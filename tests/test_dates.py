@@ -27,6 +27,9 @@ Tests for the dates module.
 import datedown.dates as dt
 from datetime import datetime
 
+import numpy as np
+import pytest
+
 
 def test_10_hourly():
 
@@ -79,3 +82,93 @@ def test_daily():
                     datetime(2000, 3, 1),
                     datetime(2000, 3, 2)]
     assert steps == steps_should
+
+
+def test_template_resolution():
+    assert dt.template_resolution(['file_%Y%m%d.nc']) == 'day'
+    assert dt.template_resolution(['%Y', '%m', 'file.nc', None]) == 'month'
+    assert dt.template_resolution(['%Y', 'file_%Y%m%d_%H%M.nc']) == 'minute'
+    assert dt.template_resolution(['%Y', 'file_%j.nc', '100%%']) == 'day'
+    assert dt.template_resolution(['%-d']) == 'day'
+    assert dt.template_resolution(['file.nc']) is None
+
+
+def test_collapse():
+    steps = dt.n_hourly(datetime(2000, 1, 30), datetime(2000, 3, 2), 24)
+    assert list(dt.collapse(steps, 'month')) == [datetime(2000, 1, 30),
+                                                 datetime(2000, 2, 1),
+                                                 datetime(2000, 3, 1)]
+    steps = dt.n_hourly(datetime(2000, 1, 1), datetime(2000, 1, 2), 6)
+    assert len(list(dt.collapse(steps, 'day'))) == 2
+    assert len(list(dt.collapse(steps, 'hour'))) == 0
+    steps = dt.n_hourly(datetime(2000, 1, 1), datetime(2000, 1, 2), 6)
+    assert len(list(dt.collapse(steps, 'hour'))) == 5
+    steps = dt.n_hourly(datetime(2000, 1, 1), datetime(2000, 1, 2), 6)
+    assert list(dt.collapse(steps, None)) == [datetime(2000, 1, 1)]
+
+
+def test_parse_interval():
+    assert dt.parse_interval('10min') == (10, 'm')
+    assert dt.parse_interval('6H') == (6, 'h')
+    assert dt.parse_interval('2d') == (2, 'D')
+    assert dt.parse_interval('1M') == (1, 'M')
+    assert dt.parse_interval('Y') == (1, 'Y')
+    assert dt.parse_interval('dekad') == (1, 'dekad')
+    assert dt.parse_interval('3pentads') == (3, 'pentad')
+    assert dt.parse_interval('8doy') == (8, 'doy')
+    for invalid in ['1m', '0D', '5', 'week']:
+        with pytest.raises(ValueError):
+            dt.parse_interval(invalid)
+
+
+def test_date_range_fixed():
+    steps = dt.date_range(datetime(2000, 1, 1), datetime(2000, 1, 1, 1), '20min')
+    assert steps.dtype == np.dtype('M8[us]')
+    assert steps.tolist() == [datetime(2000, 1, 1, 0, 0),
+                              datetime(2000, 1, 1, 0, 20),
+                              datetime(2000, 1, 1, 0, 40),
+                              datetime(2000, 1, 1, 1, 0)]
+    assert (dt.date_range(datetime(2000, 2, 28), datetime(2000, 3, 1), (10, 'h'))
+            .tolist() == list(dt.n_hourly(datetime(2000, 2, 28),
+                                          datetime(2000, 3, 1), 10)))
+
+
+def test_date_range_months():
+    steps = dt.date_range(datetime(2000, 1, 31, 6), datetime(2000, 5, 1), '1M')
+    assert steps.tolist() == [datetime(2000, 1, 31, 6),
+                              datetime(2000, 2, 29, 6),
+                              datetime(2000, 3, 31, 6),
+                              datetime(2000, 4, 30, 6)]
+    steps = dt.date_range(datetime(2000, 2, 29), datetime(2004, 3, 1), '2Y')
+    assert steps.tolist() == [datetime(2000, 2, 29),
+                              datetime(2002, 2, 28),
+                              datetime(2004, 2, 29)]
+
+
+def test_date_range_dekads_pentads():
+    steps = dt.date_range(datetime(2000, 1, 5), datetime(2000, 2, 15), 'dekad')
+    assert steps.tolist() == [datetime(2000, 1, 11),
+                              datetime(2000, 1, 21),
+                              datetime(2000, 2, 1),
+                              datetime(2000, 2, 11)]
+    steps = dt.date_range(datetime(2000, 2, 1), datetime(2000, 3, 1), 'pentad')
+    assert [d.day for d in steps.tolist()] == [1, 6, 11, 16, 21, 26, 1]
+
+
+def test_date_range_doy():
+    steps = dt.date_range(datetime(2000, 12, 20), datetime(2001, 1, 10), '8doy')
+    assert steps.tolist() == [datetime(2000, 12, 26),
+                              datetime(2001, 1, 1),
+                              datetime(2001, 1, 9)]
+
+
+def test_datetimes():
+    steps = list(dt.datetimes(datetime(2000, 1, 1), datetime(2000, 1, 5),
+                              '1D', chunk_size=2))
+    assert steps == list(dt.daily(datetime(2000, 1, 1), datetime(2000, 1, 5)))
+
+
+def test_to_datetimes():
+    dts = dt.date_range(datetime(2000, 1, 1), datetime(2000, 1, 3), '1D')
+    assert list(dt.to_datetimes(dts, chunk_size=2)) == \
+        [datetime(2000, 1, 1), datetime(2000, 1, 2), datetime(2000, 1, 3)]
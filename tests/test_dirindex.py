@@ -0,0 +1,77 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the directory index.
+'''
+from datedown.dirindex import DirectoryIndex
+from datedown.down import check_downloaded
+
+
+def test_index(tmpdir):
+    for subdir in ['a', 'b']:
+        tmpdir.mkdir(subdir)
+        tmpdir.join(subdir, 'file.txt').write('12345')
+    index = DirectoryIndex()
+    paths = [str(tmpdir.join('a', 'file.txt')),
+             str(tmpdir.join('a', 'other.txt')),
+             str(tmpdir.join('b', 'file.txt')),
+             str(tmpdir.join('c', 'file.txt'))]
+    assert index.missing(paths) == [False, True, False, True]
+    assert sorted(index.listings) == [str(tmpdir.join(d)) for d in 'abc']
+    # sizes are only read for the files that are asked for
+    assert index.sizes == {}
+    assert index.size(paths[0]) == 5
+    assert index.size(paths[1]) is None
+    assert index.sizes == {paths[0]: 5}
+
+    # cached listings are only updated on refresh
+    tmpdir.join('a', 'other.txt').write('')
+    assert not index.exists(paths[1])
+    assert index.missing(paths[:2], refresh=True) == [False, False]
+    assert index.sizes == {}
+
+
+def test_index_only_needed_directories(tmpdir):
+    for subdir in ['a', 'b']:
+        tmpdir.mkdir(subdir)
+        tmpdir.join(subdir, 'file.txt').write('')
+    index = DirectoryIndex()
+    assert index.missing([str(tmpdir.join('a', 'file.txt'))]) == [False]
+    assert list(index.listings) == [str(tmpdir.join('a'))]
+
+
+def test_index_relative(tmpdir):
+    tmpdir.join('file.txt').write('')
+    with tmpdir.as_cwd():
+        assert DirectoryIndex().missing(['file.txt', 'no.txt']) == [False, True]
+
+
+def test_check_downloaded_index(tmpdir):
+    tmpdir.join('file.txt').write('')
+    index = DirectoryIndex()
+    targets = [str(tmpdir.join('file.txt')), str(tmpdir.join('no.txt'))]
+    not_urls, not_fnames = check_downloaded(['u1', 'u2'], targets, index=index)
+    assert not_urls == ['u2']
+    tmpdir.join('no.txt').write('')
+    not_urls, not_fnames = check_downloaded(['u1', 'u2'], targets, index=index)
+    assert not_urls == []
@@ -27,6 +27,10 @@ import os
 import shutil
 from datedown.down import download
 from datedown.down import check_downloaded
+from datedown.down import group_batches
+from datedown.down import Downloader
+from datedown.retry import WGET_OK, WGET_ERROR
+from datedown.wget import batch_download
 import pytest
 
 
@@ -63,3 +67,153 @@ def test_download(targets):
     not_urls, not_fnames = check_downloaded(urls, targets)
     assert len(not_urls) == 0
     assert len(not_fnames) == 0
+
+
+def test_group_batches():
+    urls = ["http://a.com/x/f1.nc",
+            "http://a.com/x/f2.nc",
+            "http://b.com/x/f3.nc",
+            "http://a.com/y/f1.nc",
+            "http://a.com/x/f4.nc"]
+    targets = ["/data/x/f1.nc",
+               "/data/x/f2.nc",
+               "/data/x/f3.nc",
+               "/data/x/f1_y.nc",
+               "/data/z/f4.nc"]
+    batches = group_batches(urls, targets, 2)
+    assert batches == [[(urls[0], targets[0]), (urls[1], targets[1])],
+                       [(urls[2], targets[2])],
+                       [(urls[3], targets[3])],
+                       [(urls[4], targets[4])]]
+    # wget stores urls with a query under another name
+    urls = ["http://a.com/x/f1.nc?v=1", "http://a.com/x/f2.nc",
+            "http://a.com/x/", "http://a.com/x/f3.nc"]
+    targets = ["/data/x/f1.nc", "/data/x/f2.nc", "/data/x/index.html",
+               "/data/x/f3.nc"]
+    batches = group_batches(urls, targets, 10)
+    assert batches == [[(urls[0], targets[0])],
+                       [(urls[1], targets[1]), (urls[3], targets[3])],
+                       [(urls[2], targets[2])]]
+
+
+def test_download_batched(http_server, tmpdir):
+    fnames = ["2000/01/file_2000_01_01.txt",
+              "2000/01/file_2000_01_02.txt",
+              "2000/02/file_2000_02_01.txt"]
+    urls = [http_server + "/test_data/year_month_subfolders/" + fname
+            for fname in fnames]
+    targets = [os.path.join(str(tmpdir), "local_" + fname.replace('/', '_'))
+               for fname in fnames]
+    download(urls, targets, num_proc=2, batch_size=10)
+    not_urls, not_fnames = check_downloaded(urls, targets)
+    assert len(not_urls) == 0
+    assert sorted(os.listdir(str(tmpdir))) == sorted(
+        os.path.basename(t) for t in targets)
+
+
+def test_download_batched_query(http_server, tmpdir):
+    fnames = ["2000/01/file_2000_01_01.txt?v=1",
+              "2000/01/file_2000_01_02.txt?v=1",
+              "2000/02/file_2000_02_01.txt"]
+    urls = [http_server + "/test_data/year_month_subfolders/" + fname
+            for fname in fnames]
+    targets = [str(tmpdir.join(str(i))) for i in range(3)]
+    statuses = []
+    download(urls, targets, num_proc=2, batch_size=10,
+             callback=lambda url, target, status, duration:
+             statuses.append(status))
+    assert statuses == [WGET_OK] * 3
+    assert all(os.path.exists(target) for target in targets)
+
+    # files that wget stored under another name are reported as failed
+    for target in targets:
+        os.remove(target)
+    assert batch_download(list(zip(urls, targets))) == \
+        [WGET_ERROR, WGET_ERROR, WGET_OK]
+    assert os.listdir(str(tmpdir)) == ['2']
+
+
+def year_month_files(http_server, tmpdir, fnames):
+    urls = [http_server + "/test_data/year_month_subfolders/" + fname
+            for fname in fnames]
+    targets = [os.path.join(str(tmpdir), fname.replace('/', '_'))
+               for fname in fnames]
+    return urls, targets
+
+
+@pytest.mark.parametrize("backend", ['wget', 'http', 'async'])
+def test_downloader_reuses_workers(http_server, tmpdir, backend):
+    urls, targets = year_month_files(http_server, tmpdir,
+                                     ["2000/01/file_2000_01_01.txt",
+                                      "2000/01/file_2000_01_02.txt",
+                                      "2000/02/file_2000_02_01.txt"])
+    statuses = []
+
+    def callback(url, target, status, duration):
+        statuses.append(status)
+
+    with Downloader(num_proc=2, backend=backend,
+                    callback=callback) as downloader:
+        downloader(urls[:2], targets[:2])
+        pool = downloader.pool
+        connections = downloader.connections
+        loop = downloader.loop
+        downloader(urls[2:], targets[2:])
+        assert downloader.pool is pool
+        assert downloader.connections is connections
+        assert downloader.loop is loop
+    assert downloader.closed
+    if backend == 'async':
+        assert loop.is_closed()
+    assert len(statuses) == 3
+    not_urls, not_fnames = check_downloaded(urls, targets)
+    assert len(not_urls) == 0
+
+
+def test_downloader_async_connections(http_server, tmpdir):
+    from conftest import KeepAliveHandler
+    urls, targets = year_month_files(http_server, tmpdir,
+                                     ["2000/01/file_2000_01_01.txt",
+                                      "2000/01/file_2000_01_02.txt"])
+    with Downloader(backend='async', concurrency=1,
+                    rate_per_host=100) as downloader:
+        for url, target in zip(urls, targets):
+            downloader([url], [target])
+        buckets = downloader.buckets
+        # the request rate is kept across the calls
+        assert list(buckets) == [urls[0].split('/')[2]]
+    assert KeepAliveHandler.connections == 1
+
+
+def test_downloader_inline(http_server, tmpdir):
+    urls, targets = year_month_files(http_server, tmpdir,
+                                     ["2000/01/file_2000_01_01.txt",
+                                      "2000/02/file_2000_02_01.txt"])
+    statuses = []
+
+    def callback(url, target, status, duration):
+        statuses.append(status)
+
+    with Downloader(backend='http', executor='inline') as downloader:
+        # options can be changed per call
+        downloader(urls, targets, callback=callback, max_per_host=1)
+    assert statuses == [200, 200]
+    not_urls, not_fnames = check_downloaded(urls, targets)
+    assert len(not_urls) == 0
+
+
+def test_downloader_close():
+    downloader = Downloader(backend='http')
+    downloader.close()
+    downloader.close()
+    with pytest.raises(ValueError):
+        downloader(["http://example.com/f.txt"], ["/tmp/f.txt"])
+
+
+def test_downloader_invalid_arguments():
+    with pytest.raises(ValueError):
+        Downloader(executor='cluster')
+    with pytest.raises(ValueError):
+        Downloader(backend='http', executor='process')
+    with pytest.raises(TypeError):
+        Downloader(num_threads=2)
@@ -23,8 +23,11 @@
 '''
 Tests for filename creator
 '''
-from datetime import datetime
+import os
+from datetime import datetime, timedelta
 from datedown.fname_creator import create_dt_fpath
+from datedown.fname_creator import compile_dt_fpath
+from datedown.fname_creator import create_dirs
 
 
 def test_create_dt_fpath_no_dt():
@@ -55,3 +58,30 @@ def test_create_dt_fpath_subdir_dt():
                             "file%Y%m%dname.nc",
                             subdirs=["%Y", "%m"])
     assert fpath == fpath_should
+
+
+def test_compile_dt_fpath():
+    dts = [datetime(2000, 1, 1) + timedelta(days=3 * i) for i in range(100)]
+    for root in ["/example", "/example/", "example", ""]:
+        template = compile_dt_fpath(root, "file%Y%m%dname.nc",
+                                    subdirs=["%Y", "%m"])
+        fpaths_should = [create_dt_fpath(dt, root, "file%Y%m%dname.nc",
+                                         subdirs=["%Y", "%m"]) for dt in dts]
+        assert template.render_many(dts) == fpaths_should
+        assert template(dts[0]) == fpaths_should[0]
+
+
+def test_create_dirs(tmpdir):
+    root = str(tmpdir)
+    fpaths = [os.path.join(root, "2000", month, "file.nc")
+              for month in ["01", "01", "02"]]
+    fpaths.append(os.path.join(root, "2000", "file.nc"))
+    dirs = create_dirs(fpaths)
+    assert dirs == set([os.path.join(root, "2000"),
+                        os.path.join(root, "2000", "01"),
+                        os.path.join(root, "2000", "02")])
+    for path in dirs:
+        assert os.path.isdir(path)
+    # existing and excluded directories are no problem
+    assert create_dirs(fpaths, exclude=dirs) == dirs
+    assert create_dirs(["file.nc"]) == set()
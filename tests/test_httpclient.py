@@ -0,0 +1,404 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the http.client based download backend.
+'''
+import os
+import shutil
+import threading
+import time
+
+from datedown.httpclient import download
+from datedown.httpclient import ConnectionPool
+from datedown.httpclient import parse_content_range
+from datedown.httpclient import announced_size
+from datedown.manifest import Manifest
+import datedown.down as down
+from conftest import ThreadingHTTPServer, KeepAliveHandler
+import pytest
+
+
+@pytest.fixture
+def output_path(request):
+
+    output_path = os.path.join(os.path.dirname(__file__), "output_http")
+
+    def cleanup():
+        shutil.rmtree(output_path)
+
+    try:
+        cleanup()
+    except OSError:
+        pass
+
+    request.addfinalizer(cleanup)
+
+    return output_path
+
+
+def test_download(output_path, http_server):
+    url = http_server + "/test_data/year_month_subfolders/2000/01/file_2000_01_01.txt"
+    target = os.path.join(output_path, "2000", "file.txt")
+    pool = ConnectionPool()
+    status = download(url, target, pool=pool)
+    assert status == 200
+    with open(target) as fid, \
+            open(os.path.join(os.path.dirname(__file__), "test_data",
+                              "year_month_subfolders", "2000", "01",
+                              "file_2000_01_01.txt")) as orig:
+        assert fid.read() == orig.read()
+
+
+def test_download_not_found(output_path, http_server):
+    url = http_server + "/test_data/missing.txt"
+    target = os.path.join(output_path, "missing.txt")
+    status = download(url, target, pool=ConnectionPool())
+    assert status == 404
+    assert not os.path.exists(target)
+
+
+def test_connection_reuse(output_path, http_server):
+    from conftest import KeepAliveHandler
+    pool = ConnectionPool()
+    fnames = ["2000/01/file_2000_01_01.txt",
+              "2000/01/file_2000_01_02.txt",
+              "2000/02/file_2000_02_01.txt"]
+    for fname in fnames:
+        url = http_server + "/test_data/year_month_subfolders/" + fname
+        status = download(url, os.path.join(output_path, fname), pool=pool)
+        assert status == 200
+    assert KeepAliveHandler.connections == 1
+    pool.close()
+
+
+def test_down_http_backend(output_path, http_server):
+    fnames = ["2000/01/file_2000_01_01.txt",
+              "2000/01/file_2000_01_02.txt",
+              "2000/02/file_2000_02_01.txt"]
+    urls = [http_server + "/test_data/year_month_subfolders/" + fname
+            for fname in fnames]
+    targets = [os.path.join(output_path, fname) for fname in fnames]
+    down.download(urls, targets, num_proc=2, backend='http')
+    not_urls, not_fnames = down.check_downloaded(urls, targets)
+    assert len(not_urls) == 0
+
+
+def test_down_http_backend_limited(output_path, http_server):
+    fnames = ["2000/01/file_2000_01_01.txt",
+              "2000/01/file_2000_01_02.txt",
+              "2000/02/file_2000_02_01.txt"]
+    urls = [http_server + "/test_data/year_month_subfolders/" + fname
+            for fname in fnames]
+    targets = [os.path.join(output_path, fname) for fname in fnames]
+    down.download(urls, targets, num_proc=2, backend='http',
+                  max_per_host=1, rate_per_host=100)
+    not_urls, not_fnames = down.check_downloaded(urls, targets)
+    assert len(not_urls) == 0
+
+
+@pytest.fixture
+def source_file(output_path):
+    """
+    Random binary file that is served by the test server.
+    """
+    fpath = os.path.join(output_path, "src", "big.bin")
+    os.makedirs(os.path.dirname(fpath))
+    with open(fpath, 'wb') as fid:
+        fid.write(os.urandom(100000))
+    return fpath
+
+
+@pytest.mark.parametrize("backend", ['http', 'wget', 'async'])
+def test_resume(output_path, http_server, source_file, backend):
+    url = http_server + "/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    os.makedirs(os.path.dirname(target))
+    with open(source_file, 'rb') as fid:
+        data = fid.read()
+    # the existing part differs from the source so that we can see
+    # that only the rest of the file was requested
+    with open(target + ".part", 'wb') as fid:
+        fid.write(b'\0' * 30000)
+
+    down.download([url], [target], backend=backend, resume=True)
+
+    assert not os.path.exists(target + ".part")
+    with open(target, 'rb') as fid:
+        assert fid.read() == b'\0' * 30000 + data[30000:]
+
+
+@pytest.mark.parametrize("backend", ['http', 'async'])
+def test_announced_sizes(output_path, http_server, source_file, backend):
+    url = http_server + "/output_http/src/big.bin"
+    targets = [os.path.join(output_path, "dst", "full.bin"),
+               os.path.join(output_path, "dst", "resumed.bin")]
+    os.makedirs(os.path.dirname(targets[0]))
+    with open(targets[1] + ".part", 'wb') as fid:
+        fid.write(b'\0' * 30000)
+    sizes = {}
+    down.download([url, url], targets, backend=backend, resume=True,
+                  sizes=sizes)
+    # the total size of a range response is taken from Content-Range
+    assert sizes == {targets[0]: 100000, targets[1]: 100000}
+
+
+def test_announced_size():
+    assert announced_size(200, '100', None) == 100
+    assert announced_size(206, '70', 'bytes 30-99/100') == 100
+    assert announced_size(206, '70', 'bytes 30-99/*') is None
+    assert announced_size(200, None, None) is None
+    assert announced_size(304, None, None) is None
+
+
+def test_resume_complete_part(output_path, http_server, source_file):
+    url = http_server + "/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    os.makedirs(os.path.dirname(target))
+    shutil.copy(source_file, target + ".part")
+
+    status = download(url, target, pool=ConnectionPool(), resume=True)
+
+    assert status == 200
+    assert not os.path.exists(target + ".part")
+    assert os.path.getsize(target) == 100000
+
+
+def test_resume_not_found(output_path, http_server):
+    url = http_server + "/output_http/src/missing.bin"
+    target = os.path.join(output_path, "dst", "missing.bin")
+    status = download(url, target, pool=ConnectionPool(), resume=True)
+    assert status == 404
+    assert not os.path.exists(target)
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 100-199/200") == (100, 200)
+    assert parse_content_range("bytes */200") == (None, 200)
+    assert parse_content_range("bytes 0-10/*") == (0, None)
+    assert parse_content_range(None) == (None, None)
+
+
+@pytest.mark.parametrize("backend", ['http', 'async'])
+def test_manifest_conditional(output_path, http_server, source_file, backend):
+    url = http_server + "/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    manifest_path = os.path.join(output_path, "dst", ".manifest.json")
+
+    down.download([url], [target], backend=backend, manifest=manifest_path)
+    entry = Manifest(manifest_path).get(target)
+    assert entry['size'] == 100000
+    assert entry['last_modified'] is not None
+
+    # mark the local file so that we can see if it is overwritten
+    with open(target, 'r+b') as fid:
+        fid.write(b'MARK')
+    manifest = Manifest(manifest_path)
+    assert 'If-Modified-Since' in manifest.conditional_headers(target)
+    down.download([url], [target], backend=backend, manifest=manifest)
+    with open(target, 'rb') as fid:
+        assert fid.read(4) == b'MARK'
+
+
+def test_manifest_size_mismatch(output_path):
+    target = os.path.join(output_path, "file.bin")
+    os.makedirs(output_path)
+    with open(target, 'wb') as fid:
+        fid.write(b'12345')
+    manifest = Manifest(os.path.join(output_path, ".manifest.json"))
+    manifest.update(target, etag='"abc"')
+    assert manifest.conditional_headers(target) == {'If-None-Match': '"abc"'}
+    manifest.save()
+    with open(target, 'wb') as fid:
+        fid.write(b'123')
+    manifest = Manifest(os.path.join(output_path, ".manifest.json"))
+    assert manifest.conditional_headers(target) == {}
+
+
+def test_segmented_download(output_path, http_server, source_file):
+    from conftest import KeepAliveHandler
+    url = http_server + "/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    status = download(url, target, pool=ConnectionPool(),
+                      segment_threshold=50000, segments=3)
+    assert status == 200
+    # one aborted request and one connection per segment
+    assert KeepAliveHandler.connections == 4
+    assert not os.path.exists(target + ".part")
+    with open(target, 'rb') as fid, open(source_file, 'rb') as orig:
+        assert fid.read() == orig.read()
+
+
+def test_segmented_download_small_file(output_path, http_server, source_file):
+    from conftest import KeepAliveHandler
+    url = http_server + "/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    down.download([url], [target], backend='http',
+                  segment_threshold=200000, segments=3)
+    assert KeepAliveHandler.connections == 1
+    assert os.path.getsize(target) == 100000
+
+
+@pytest.mark.parametrize("backend", ['http', 'async'])
+def test_max_bandwidth(output_path, http_server, source_file, backend):
+    from datedown.scheduler import BandwidthLimiter
+    url = http_server + "/output_http/src/big.bin"
+    targets = [os.path.join(output_path, "dst", str(i)) for i in range(2)]
+    limiter = BandwidthLimiter(400000, burst=0)
+    start = time.time()
+    down.download([url, url], targets, num_proc=2, backend=backend,
+                  max_bandwidth=limiter)
+    # 200000 bytes at 400000 bytes per second shared by both transfers
+    assert time.time() - start >= 0.4
+    for target in targets:
+        assert os.path.getsize(target) == 100000
+
+
+class RedirectHandler(KeepAliveHandler):
+    """
+    Redirect /data/ to /signed/ and /login/ to /private/ on another
+    host name of the server. /signed/ rejects credentials like a signed
+    S3 URL, /private/ asks for them.
+    """
+    requests = []
+
+    def send_head(self):
+        auth = self.headers.get('Authorization')
+        prefix, rest = self.path[1:].split('/', 1)
+        RedirectHandler.requests.append((prefix, auth is not None))
+        if prefix in ('data', 'login'):
+            location = 'http://127.0.0.1:{}/{}/{}'.format(
+                self.server.server_address[1],
+                'signed' if prefix == 'data' else 'private', rest)
+            self.send_response(302)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        if (prefix == 'signed' and auth is not None) or \
+                (prefix == 'private' and auth is None):
+            self.send_response(400 if prefix == 'signed' else 401)
+            self.send_header('WWW-Authenticate', 'Basic realm="test"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        self.path = '/' + rest
+        return KeepAliveHandler.send_head(self)
+
+
+@pytest.fixture
+def redirect_server(request):
+    RedirectHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RedirectHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(stop)
+
+    return "http://localhost:{}".format(server.server_address[1])
+
+
+@pytest.mark.parametrize("backend", ['http', 'async'])
+def test_redirect_credentials(output_path, redirect_server, backend):
+    fname = "test_data/year_month_subfolders/2000/01/file_2000_01_01.txt"
+    urls = [redirect_server + "/data/" + fname,
+            redirect_server + "/login/" + fname]
+    targets = [os.path.join(output_path, "signed.txt"),
+               os.path.join(output_path, "private.txt")]
+    down.download(urls, targets, backend=backend,
+                  username='user', password='secret')
+    for target in targets:
+        assert os.path.exists(target)
+    # the other host only gets the credentials after it asked for them
+    assert sorted(RedirectHandler.requests) == sorted(
+        [('data', True), ('signed', False),
+         ('login', True), ('private', False), ('private', True)])
+
+
+class BrokenHandler(KeepAliveHandler):
+    """
+    Serve /norange/ with the whole file for every Range request although
+    Accept-Ranges is sent and cut off the body of every response
+    under /short/ after half of its announced length.
+    """
+
+    def send_head(self):
+        prefix, rest = self.path[1:].split('/', 1)
+        self.prefix = prefix
+        self.path = '/' + rest
+        if prefix == 'norange' and 'Range' in self.headers:
+            del self.headers['Range']
+        return KeepAliveHandler.send_head(self)
+
+    def copyfile(self, source, outputfile):
+        if self.prefix != 'short':
+            return KeepAliveHandler.copyfile(self, source, outputfile)
+        data = source.read()
+        outputfile.write(data[:len(data) // 2])
+        self.close_connection = True
+
+
+@pytest.fixture
+def broken_server(request):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BrokenHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    request.addfinalizer(stop)
+
+    return "http://127.0.0.1:{}".format(server.server_address[1])
+
+
+@pytest.mark.parametrize("prefix", ['norange', 'short'])
+def test_segmented_download_broken(output_path, broken_server, source_file,
+                                   prefix):
+    url = broken_server + "/" + prefix + "/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    status = download(url, target, pool=ConnectionPool(),
+                      segment_threshold=50000, segments=3)
+    assert status is None
+    assert not os.path.exists(target)
+    assert not os.path.exists(target + ".part")
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_download_cut_off(output_path, broken_server, source_file, resume):
+    url = broken_server + "/short/output_http/src/big.bin"
+    target = os.path.join(output_path, "dst", "big.bin")
+    sizes = {}
+    status = download(url, target, pool=ConnectionPool(), resume=resume,
+                      sizes=sizes)
+    assert status is None
+    assert not os.path.exists(target)
+    assert sizes == {}
+    # the part is kept to resume from it
+    assert os.path.exists(target + ".part") == resume
+    if resume:
+        assert os.path.getsize(target + ".part") == 50000
@@ -35,7 +35,9 @@ import shutil
 from datedown.urlcreator import create_dt_url
 from datedown.fname_creator import create_dt_fpath
 from datedown.interface import download_by_dt
-from datedown.interface import n_hours
+from datedown.interface import mkbandwidth
+from datedown.interface import plan_dts
+from datedown.dates import n_hourly
 from datedown.interface import parse_args
 from datedown.interface import main
 from datedown.interface import main_recursive
@@ -97,21 +99,10 @@ def test_interface(output_path, temp_http_server):
         assert os.path.exists(fname_should)
 
 
-def test_n_hours():
-    st = "6H"
-    assert 6 == n_hours(st)
-    st = "6h"
-    assert 6 == n_hours(st)
-    st = "8H"
-    assert 8 == n_hours(st)
-    st = "18H"
-    assert 18 == n_hours(st)
-    st = "2D"
-    assert 48 == n_hours(st)
-    st = "2d"
-    assert 48 == n_hours(st)
-    st = "1D"
-    assert 24 == n_hours(st)
+def test_mkbandwidth():
+    assert mkbandwidth("200M") == 200 * 1024 ** 2
+    assert mkbandwidth("1.5k") == 1536
+    assert mkbandwidth("1000") == 1000
 
 
 def test_parse_args():
@@ -135,7 +126,7 @@ def test_parse_args():
     assert a.urlsubdirs == ['%Y', '%m']
     assert a.localfname == 'local.txt'
     assert a.localsubdirs == ['%m', '%d']
-    assert a.interval == 5
+    assert a.interval == (5, 'h')
     assert a.username == "test"
     assert a.password == "test"
     assert a.n_proc == 4
@@ -159,7 +150,7 @@ def test_parse_args_single_subdirs():
     assert a.urlsubdirs == ['%Y']
     assert a.localfname == 'local.txt'
     assert a.localsubdirs == ['%m']
-    assert a.interval == 5
+    assert a.interval == (5, 'h')
     assert a.n_proc == 1
     assert a.username == None
     assert a.password == None
@@ -180,10 +171,11 @@ def test_parse_args_defaults():
     assert a.urlsubdirs == ['%Y']
     assert a.localfname == 'file.txt'
     assert a.localsubdirs == ['%Y']
-    assert a.interval == 24
+    assert a.interval == (1, 'D')
     assert a.n_proc == 1
     assert a.username == None
     assert a.password == None
+    assert a.backend == 'wget'
 
 
 def test_main(output_path, temp_http_server):
@@ -205,6 +197,33 @@ def test_main(output_path, temp_http_server):
         assert os.path.exists(fname_should)
 
 
+def test_main_only_missing(output_path, http_server):
+    local = os.path.join(output_path, '2000', '01')
+    os.makedirs(local)
+    for day in ['01', '03']:
+        with open(os.path.join(local, 'file_2000_01_{}.txt'.format(day)),
+                  'w') as fid:
+            fid.write('local')
+    args = ["2000-01-01", "2000-02-01",
+            http_server + "/test_data/year_month_subfolders",
+            "file_%Y_%m_%d.txt",
+            output_path,
+            "--urlsubdirs", '%Y', '%m',
+            "--since-last", "--only-missing", "--backend", "http"]
+
+    with pytest.warns(UserWarning):
+        # the days after January 3rd do not exist on the server
+        main(args)
+
+    # only the datetimes after the latest local file are downloaded
+    assert sorted(os.listdir(local)) == ['file_2000_01_01.txt',
+                                         'file_2000_01_03.txt']
+    with open(os.path.join(local, 'file_2000_01_01.txt')) as fid:
+        assert fid.read() == 'local'
+    assert os.path.exists(os.path.join(output_path, '2000', '02',
+                                       'file_2000_02_01.txt'))
+
+
 def test_main_recursive(output_path, temp_http_server):
     args = ["2000-01-01", "2000-01-02",
             "http://localhost:8888",
@@ -221,3 +240,97 @@ def test_main_recursive(output_path, temp_http_server):
                                   'file_2000_01_02.txt')]
     for fname_should in fnames_should:
         assert os.path.exists(fname_should)
+
+
+def test_download_by_dt_streaming(tmpdir):
+    """
+    Datetimes are consumed lazily in chunks and missing
+    files are retried together with the next chunk.
+    """
+    calls = []
+
+    def download_fn(urls, fnames):
+        calls.append(list(urls))
+        for url, fname in zip(urls, fnames):
+            # the first file only works on the second attempt
+            if url == "u2000-01-01" and len(calls) == 1:
+                continue
+            open(fname, 'w').close()
+
+    def dts():
+        for day in range(1, 6):
+            yield datetime(2000, 1, day)
+
+    download_by_dt(dts(), lambda dt: dt.strftime("u%Y-%m-%d"),
+                   lambda dt: os.path.join(str(tmpdir), dt.strftime("%Y%m%d")),
+                   download_fn, chunk_size=2)
+
+    assert calls == [["u2000-01-01", "u2000-01-02"],
+                     ["u2000-01-01", "u2000-01-03", "u2000-01-04"],
+                     ["u2000-01-05"]]
+    assert len(os.listdir(str(tmpdir))) == 5
+
+
+def test_download_by_dt_failed(tmpdir):
+    calls = []
+
+    def download_fn(urls, fnames):
+        calls.append(list(urls))
+
+    with pytest.warns(UserWarning):
+        download_by_dt([datetime(2000, 1, 1)], lambda dt: "url",
+                       lambda dt: os.path.join(str(tmpdir), "fname"),
+                       download_fn, passes=3)
+    assert calls == [["url"], ["url"], ["url"]]
+
+
+def test_plan_dts():
+    dts = n_hourly(datetime(2000, 1, 1), datetime(2000, 2, 28), 24)
+    assert list(plan_dts(dts, ['%Y', '%m', None])) == [datetime(2000, 1, 1),
+                                                       datetime(2000, 2, 1)]
+    dts = n_hourly(datetime(2000, 1, 1), datetime(2000, 1, 2), 6)
+    assert len(list(plan_dts(dts, ['file_%Y%m%d.nc']))) == 2
+
+
+def test_download_by_dt_duplicates(tmpdir):
+    calls = []
+
+    def download_fn(urls, fnames):
+        calls.append(list(urls))
+        for fname in fnames:
+            open(fname, 'w').close()
+
+    dts = n_hourly(datetime(2000, 1, 1), datetime(2000, 1, 3), 6)
+    download_by_dt(dts, lambda dt: dt.strftime("u%Y-%m-%d"),
+                   lambda dt: os.path.join(str(tmpdir), dt.strftime("%Y%m%d")),
+                   download_fn, chunk_size=3)
+    assert sum(calls, []) == ["u2000-01-01", "u2000-01-02", "u2000-01-03"]
+
+
+def test_download_by_dt_duplicates_longer_than_chunk(tmpdir):
+    calls = []
+
+    def download_fn(urls, fnames):
+        calls.append(list(urls))
+        for fname in fnames:
+            open(fname, 'w').close()
+
+    # every monthly url repeats for more than one chunk of daily datetimes
+    dts = n_hourly(datetime(2000, 1, 1), datetime(2000, 3, 30), 24)
+    download_by_dt(dts, lambda dt: dt.strftime("u%Y%m.nc"),
+                   lambda dt: os.path.join(str(tmpdir), dt.strftime("%Y%m.nc")),
+                   download_fn, chunk_size=5)
+    assert sum(calls, []) == ["u200001.nc", "u200002.nc", "u200003.nc"]
+
+
+def test_download_by_dt_makedirs(tmpdir):
+    def download_fn(urls, fnames):
+        # fails if the directories do not exist
+        for fname in fnames:
+            open(fname, 'w').close()
+
+    dts = n_hourly(datetime(2000, 1, 30), datetime(2000, 2, 2), 24)
+    download_by_dt(dts, lambda dt: dt.strftime("u%Y-%m-%d"),
+                   lambda dt: os.path.join(str(tmpdir), dt.strftime("%Y/%m/%d")),
+                   download_fn, chunk_size=2, makedirs=True)
+    assert sorted(os.listdir(str(tmpdir.join("2000")))) == ["01", "02"]
@@ -0,0 +1,167 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for job files with several datasets.
+'''
+import os
+from datetime import date, datetime
+
+import pytest
+
+from datedown.jobs import dataset_args, load_job, main
+
+
+def test_dataset_args():
+    args = dataset_args({'name': 'smap',
+                         'start': date(2020, 1, 1),
+                         'end': datetime(2020, 1, 2, 12),
+                         'urlroot': 'http://example.com',
+                         'urlfname': 'f_%Y%m%d.h5',
+                         'urlsubdirs': ['%Y', '%m'],
+                         'resume': True,
+                         'validate': False,
+                         'password': '-secret'},
+                        defaults={'localroot': '/data', 'interval': '6H',
+                                  'backend': 'http'})
+    assert args.start == datetime(2020, 1, 1)
+    assert args.end == datetime(2020, 1, 2, 12)
+    assert args.urlsubdirs == ['%Y', '%m']
+    assert args.localsubdirs == ['%Y', '%m']
+    assert args.localroot == '/data'
+    assert args.interval == (6, 'h')
+    assert args.backend == 'http'
+    assert args.resume
+    assert not args.validate
+    assert args.password == '-secret'
+
+
+def test_dataset_args_invalid():
+    dataset = {'start': '2020-01-01', 'end': '2020-01-02',
+               'urlroot': 'http://example.com', 'urlfname': 'f.h5'}
+    with pytest.raises(ValueError):
+        dataset_args(dataset)
+    with pytest.raises(ValueError):
+        dataset_args(dataset, defaults={'localroot': '/data', 'n_proc': 4})
+    with pytest.raises(ValueError):
+        dataset_args(dataset, defaults={'localroot': '/data',
+                                        'max_per_host': 2})
+
+
+def test_load_job(tmpdir):
+    yaml_path = str(tmpdir.join('job.yml'))
+    with open(yaml_path, 'w') as fid:
+        fid.write("n_proc: 4\n"
+                  "datasets:\n"
+                  "  - name: a\n"
+                  "    start: 2000-01-01\n")
+    toml_path = str(tmpdir.join('job.toml'))
+    with open(toml_path, 'w') as fid:
+        fid.write("n_proc = 4\n"
+                  "[[datasets]]\n"
+                  "name = 'a'\n"
+                  "start = 2000-01-01\n")
+    for path in [yaml_path, toml_path]:
+        job = load_job(path)
+        assert job['n_proc'] == 4
+        assert job['datasets'] == [{'name': 'a', 'start': date(2000, 1, 1)}]
+    empty_path = str(tmpdir.join('empty.yml'))
+    with open(empty_path, 'w') as fid:
+        fid.write("n_proc: 4\n")
+    with pytest.raises(ValueError):
+        load_job(empty_path)
+
+
+def test_main(http_server, tmpdir):
+    localroot = str(tmpdir)
+    job_path = str(tmpdir.join('job.yml'))
+    with open(job_path, 'w') as fid:
+        fid.write("n_proc: 2\n"
+                  "max_bandwidth: 100M\n"
+                  "max_per_host: 1\n"
+                  "prometheus: {}/job.prom\n"
+                  "defaults:\n"
+                  "  urlroot: {}/test_data/year_month_subfolders\n"
+                  "  urlsubdirs: ['%Y', '%m']\n"
+                  "  urlfname: file_%Y_%m_%d.txt\n"
+                  "  backend: http\n"
+                  "datasets:\n"
+                  "  - name: daily\n"
+                  "    start: 2000-01-01\n"
+                  "    end: 2000-01-02\n"
+                  "    localroot: {}/daily\n"
+                  "  - name: monthly\n"
+                  "    start: 2000-02-01\n"
+                  "    end: 2000-02-01\n"
+                  "    interval: 1M\n"
+                  "    localroot: {}/monthly\n"
+                  "    prometheus: {}/monthly.prom\n"
+                  "  - name: skipped\n"
+                  "    start: 2000-01-01\n"
+                  "    end: 2000-01-01\n"
+                  "    localroot: {}/skipped\n".format(
+                      localroot, http_server, localroot, localroot,
+                      localroot, localroot))
+    main([job_path, '--datasets', 'daily', 'monthly'])
+    assert os.path.exists(os.path.join(localroot, 'daily', '2000', '01',
+                                       'file_2000_01_01.txt'))
+    assert os.path.exists(os.path.join(localroot, 'daily', '2000', '01',
+                                       'file_2000_01_02.txt'))
+    assert os.path.exists(os.path.join(localroot, 'monthly', '2000', '02',
+                                       'file_2000_02_01.txt'))
+    assert not os.path.exists(os.path.join(localroot, 'skipped'))
+    with open(os.path.join(localroot, 'monthly.prom')) as fid:
+        assert 'dataset="monthly"' in fid.read()
+    with open(os.path.join(localroot, 'job.prom')) as fid:
+        text = fid.read()
+    assert text.count('# TYPE datedown_downloads_total counter') == 1
+    assert 'datedown_downloads_total{status="200",dataset="daily"} 2' in text
+    assert 'datedown_downloads_total{status="200",dataset="monthly"} 1' in text
+
+
+@pytest.mark.parametrize("job,defaults,second", [
+    # both datasets write the same file
+    ("", "  prometheus: {tmpdir}/datedown.prom\n", ""),
+    ("executor: process\n", "", "    backend: http\n"),
+    ("", "  backend: wget\n", "    manifest: true\n"),
+    # wget does not take its share from the limit of the other backends
+    ("max_bandwidth: 10M\n", "", "    backend: http\n")])
+def test_main_invalid(tmpdir, job, defaults, second):
+    job_path = str(tmpdir.join('job.yml'))
+    with open(job_path, 'w') as fid:
+        fid.write((job +
+                   "defaults:\n"
+                   "  urlroot: http://example.com\n"
+                   "  urlfname: file_%Y_%m_%d.txt\n"
+                   "  start: 2000-01-01\n"
+                   "  end: 2000-01-02\n" +
+                   defaults +
+                   "datasets:\n"
+                   "  - name: a\n"
+                   "    localroot: {tmpdir}/a\n"
+                   "  - name: b\n"
+                   "    localroot: {tmpdir}/b\n" +
+                   second).format(tmpdir=tmpdir))
+    # all datasets are checked before the first download starts
+    with pytest.raises(ValueError):
+        main([job_path])
+    assert not tmpdir.join('a').exists()
@@ -0,0 +1,119 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the remote directory listings.
+'''
+import ftplib
+import json
+import warnings
+try:
+    # Python 3
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    # Python 2
+    from urllib2 import HTTPError, URLError
+
+from datedown.listing import parse_listing, ListingCache, missing_directory
+from datedown.interface import download_by_dt
+
+URL = 'http://example.com/data/2000/'
+
+
+def test_parse_apache():
+    content = ('<html><body><h1>Index of /data/2000</h1><table>'
+               '<tr><td><a href="?C=N;O=D">Name</a></td></tr>'
+               '<tr><td><a href="/data/">Parent Directory</a></td></tr>'
+               '<tr><td><a href="file%201.nc">file 1.nc</a></td></tr>'
+               '<tr><td><a href="01/">01/</a></td></tr>'
+               '<tr><td><a href="http://example.com/data/2000/file2.nc">'
+               'file2.nc</a></td></tr>'
+               '</table></body></html>')
+    assert parse_listing(content, URL) == set(['file 1.nc', '01', 'file2.nc'])
+
+
+def test_parse_ftp():
+    content = ('drwxr-xr-x   2 ftp ftp     4096 Jan 01 00:00 01\r\n'
+               '-rw-r--r--   1 ftp ftp   123456 Jan 01 00:00 file 1.nc\r\n'
+               'lrwxrwxrwx   1 ftp ftp        8 Jan 01 00:00 latest -> file.nc\r\n')
+    assert parse_listing(content, URL) == set(['01', 'file 1.nc', 'latest'])
+    assert parse_listing('a.nc\nb.nc\n', URL) == set(['a.nc', 'b.nc'])
+
+
+def test_parse_json():
+    assert parse_listing('["a.nc", "b/"]', URL) == set(['a.nc', 'b'])
+    content = json.dumps({'files': [{'name': 'a.nc', 'size': 1}]})
+    assert parse_listing(content, URL) == set(['a.nc'])
+
+
+def test_listing_cache(tmpdir, http_server):
+    root = http_server + '/test_data/year_month_subfolders/2000/'
+    cache_dir = str(tmpdir.join('listings'))
+    cache = ListingCache(cache_dir)
+    urls = [root + '01/file_2000_01_01.txt',
+            root + '01/file_2000_01_03.txt',
+            root + '02/file_2000_02_01.txt',
+            root + '03/file_2000_03_01.txt']
+    cache.prefetch(urls)
+    # none of the files of the missing directory exist
+    assert [cache.exists(url) for url in urls] == [True, False, True, False]
+    assert len(tmpdir.join('listings').listdir()) == 3
+    assert ListingCache(cache_dir)._load(root + '03/') == set()
+
+    # listings that can not be fetched for other reasons drop nothing
+    other = ListingCache(str(tmpdir.join('other')))
+    assert other.exists('http://127.0.0.1:1/data/file.nc')
+
+    assert ListingCache(cache_dir)._load(root + '01/') == set(['file_2000_01_01.txt',
+                                                      'file_2000_01_02.txt'])
+    assert ListingCache(cache_dir, ttl=-1)._load(root + '01/') is None
+
+
+def test_missing_directory():
+    assert missing_directory(HTTPError(URL, 404, 'Not Found', {}, None))
+    assert not missing_directory(HTTPError(URL, 503, 'Unavailable', {}, None))
+    assert missing_directory(URLError(ftplib.error_perm('550 No such file')))
+    assert not missing_directory(URLError(ftplib.error_temp('421 Busy')))
+    assert not missing_directory(URLError('timed out'))
+
+
+def test_download_by_dt_listing(tmpdir, http_server):
+    from datetime import datetime
+    root = http_server + '/test_data/year_month_subfolders/2000/01/'
+    cache = ListingCache(str(tmpdir.join('listings')))
+    requested = []
+
+    def download_fn(urls, fnames):
+        requested.extend(urls)
+        for fname in fnames:
+            open(fname, 'w').close()
+
+    dts = [datetime(2000, 1, day) for day in [1, 2, 3]]
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        download_by_dt(dts,
+                       lambda dt: root + dt.strftime('file_%Y_%m_%d.txt'),
+                       lambda dt: str(tmpdir.join(dt.strftime('%d.txt'))),
+                       download_fn, listing=cache)
+    assert requested == [root + 'file_2000_01_01.txt',
+                         root + 'file_2000_01_02.txt']
+    assert len(w) == 1
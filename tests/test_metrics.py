@@ -0,0 +1,114 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the download metrics.
+'''
+import json
+from datetime import datetime
+
+import pytest
+
+from datedown.metrics import Metrics, format_prometheus
+from datedown.interface import download_by_dt
+from datedown.down import download
+
+
+def test_record(tmpdir):
+    target = tmpdir.join('file.nc')
+    target.write('12345')
+    metrics = Metrics(buckets=(0.1, 1.))
+    metrics.record('u1', str(target), 200, 0.05)
+    metrics.record('u2', str(tmpdir.join('missing.nc')), 404, 0.5)
+    metrics.record('u1', str(target), 0, 2.)
+    # unchanged files were not transferred
+    metrics.record('u3', str(target), 304, 0.05)
+    metrics.record_retry('u2', str(tmpdir.join('missing.nc')), 503)
+    metrics.record_checked(1, [str(target)])
+    metrics.record_failed(1)
+    metrics.finish()
+
+    assert metrics.counts == [2, 1, 1]
+    summary = metrics.summary()
+    assert summary['downloads'] == 4
+    assert summary['bytes'] == 10
+    assert summary['not_modified'] == 1
+    assert summary['wasted_bytes'] == 10
+    assert summary['retries'] == 1
+    assert summary['statuses'] == {'200': 1, '404': 1, '0': 1, '304': 1}
+    assert summary['files_failed'] == 1
+    assert summary['duration_seconds']['max'] == 2.
+    assert 0 < summary['duration_seconds']['p50'] <= 1.
+    json.dumps(summary)
+
+    lines = metrics.histogram().splitlines()
+    assert len(lines) == 3
+
+    text = metrics.prometheus(labels={'dataset': 'test'})
+    assert 'datedown_downloads_total{status="200",dataset="test"} 1' in text
+    assert 'datedown_download_duration_seconds_bucket{le="+Inf",dataset="test"} 4' in text
+    assert 'datedown_download_duration_seconds_count{dataset="test"} 4' in text
+    assert 'datedown_not_modified_total{dataset="test"} 1' in text
+    assert 'datedown_wasted_bytes_total{dataset="test"} 10' in text
+
+    metrics.write_prometheus(str(tmpdir.join('datedown.prom')))
+    metrics.write_json(str(tmpdir.join('report.json')))
+    with open(str(tmpdir.join('report.json'))) as fid:
+        assert json.load(fid)['downloads'] == 4
+
+
+def test_format_prometheus():
+    first = Metrics()
+    first.record('u1', 'missing.nc', 404, 0.05)
+    second = Metrics()
+    second.record('u2', 'missing.nc', 404, 0.05)
+    second.record_retry('u2', 'missing.nc', 503)
+    text = format_prometheus([(first, {'dataset': 'a'}),
+                              (second, {'dataset': 'b'})])
+    lines = text.splitlines()
+    # one header per metric with the samples of all runs
+    assert lines.count('# TYPE datedown_retries_total counter') == 1
+    start = lines.index('# TYPE datedown_retries_total counter')
+    assert lines[start + 1:start + 3] == [
+        'datedown_retries_total{dataset="a"} 0',
+        'datedown_retries_total{dataset="b"} 1']
+    assert 'datedown_download_duration_seconds_count{dataset="b"} 1' in lines
+
+
+def test_download_by_dt_metrics(tmpdir, http_server):
+    metrics = Metrics()
+    root = http_server + '/test_data/year_month_subfolders/2000/01/'
+    dts = [datetime(2000, 1, day) for day in [1, 2, 3]]
+    download_fn = lambda urls, fnames: download(urls, fnames,
+                                                backend='http',
+                                                metrics=metrics)
+    with pytest.warns(UserWarning):
+        download_by_dt(dts,
+                       lambda dt: root + dt.strftime('file_%Y_%m_%d.txt'),
+                       lambda dt: str(tmpdir.join(dt.strftime('%d.txt'))),
+                       download_fn, passes=2, metrics=metrics)
+    summary = metrics.summary()
+    assert summary['downloads'] == 4
+    assert summary['statuses'] == {'200': 2, '404': 2}
+    assert summary['files_done'] == 2
+    assert summary['files_missing'] == 2
+    assert summary['files_failed'] == 1
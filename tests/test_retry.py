@@ -0,0 +1,104 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for retrying failed downloads.
+'''
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+from datedown.retry import RetryPolicy
+from datedown.retry import is_permanent
+from datedown.retry import is_success
+from datedown.scheduler import Scheduler
+import datedown.wget as wget
+import datedown.down as down
+
+
+def test_classification():
+    for status in [0, 200, 206, 304]:
+        assert is_success(status)
+        assert not is_permanent(status)
+    for status in [2, 3, 6, 400, 401, 403, 404, 410]:
+        assert is_permanent(status)
+    for status in [None, 1, 4, 5, 7, 8, 408, 429, 500, 502, 503, 504]:
+        assert not is_success(status)
+        assert not is_permanent(status)
+
+
+def test_policy():
+    policy = RetryPolicy(max_attempts=3, backoff=1, max_backoff=3, jitter=0.5)
+    assert policy.should_retry(503, 1)
+    assert policy.should_retry(None, 2)
+    assert not policy.should_retry(503, 3)
+    assert not policy.should_retry(404, 1)
+    assert not policy.should_retry(200, 1)
+    assert 0.5 <= policy.delay(1) <= 1
+    assert 1 <= policy.delay(2) <= 2
+    assert 1.5 <= policy.delay(5) <= 3
+
+
+def test_scheduler_retry():
+    lock = threading.Lock()
+    attempts = {}
+    responses = {'ok': [200],
+                 'flaky': [503, None, 200],
+                 'missing': [404, 200],
+                 'down': [503, 503, 503, 503]}
+
+    def func(task):
+        with lock:
+            attempt = attempts.get(task[1], 0)
+            attempts[task[1]] = attempt + 1
+        return responses[task[1]][attempt]
+
+    tasks = [("http://a.com/" + name, name) for name in sorted(responses)]
+    pool = ThreadPool(2)
+    scheduler = Scheduler(2, retry=RetryPolicy(max_attempts=3, backoff=0.01))
+    results = dict(scheduler.run(pool, func, tasks))
+    pool.close()
+    assert results == {tasks[0]: 503,
+                       tasks[1]: 200,
+                       tasks[2]: 404,
+                       tasks[3]: 200}
+    assert attempts == {'down': 3, 'flaky': 3, 'missing': 1, 'ok': 1}
+
+
+def test_wget_status(http_server, tmpdir):
+    target = os.path.join(str(tmpdir), "missing.txt")
+    status = wget.download(http_server + "/test_data/missing.txt", target)
+    assert status == 404
+    fname = "test_data/year_month_subfolders/2000/01/file_2000_01_01.txt"
+    target = os.path.join(str(tmpdir), "file.txt")
+    assert wget.download(http_server + "/" + fname, target) == 0
+
+
+def test_download_retry(http_server, tmpdir):
+    fname = "test_data/year_month_subfolders/2000/01/file_2000_01_01.txt"
+    urls = [http_server + "/" + fname, http_server + "/test_data/missing.txt"]
+    targets = [os.path.join(str(tmpdir), "file.txt"),
+               os.path.join(str(tmpdir), "missing.txt")]
+    down.download(urls, targets, backend='http',
+                  retry=RetryPolicy(max_attempts=3, backoff=0.01))
+    assert os.path.exists(targets[0])
+    assert not os.path.exists(targets[1])
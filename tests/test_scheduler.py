@@ -0,0 +1,174 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the scheduler.
+'''
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from datedown.scheduler import Scheduler
+from datedown.scheduler import TokenBucket
+from datedown.scheduler import BandwidthLimiter
+from datedown.scheduler import task_host
+
+
+def test_task_host():
+    assert task_host(("http://a.com:8080/x/f.nc", "/f.nc")) == "a.com:8080"
+    assert task_host([("http://b.com/f.nc", "/f.nc")]) == "b.com"
+
+
+def test_token_bucket():
+    bucket = TokenBucket(10, capacity=2)
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    wait = bucket.consume()
+    assert 0 < wait <= 0.1
+
+
+def test_bandwidth_limiter():
+    limiter = BandwidthLimiter(1000)
+    assert limiter.reserve(1000) == 0
+    # the reservations of all transfers add up
+    assert 0.4 < limiter.reserve(500) <= 0.5
+    assert 0.9 < limiter.reserve(500) <= 1.
+    limiter = BandwidthLimiter(1000, burst=0)
+    start = time.time()
+    limiter.throttle(200)
+    assert time.time() - start >= 0.15
+
+
+def test_scheduler_limits():
+    lock = threading.Lock()
+    running = {}
+    peaks = {}
+
+    def func(task):
+        host = task_host(task)
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), running[host])
+            total = sum(running.values())
+            peaks['total'] = max(peaks.get('total', 0), total)
+        time.sleep(0.01)
+        with lock:
+            running[host] -= 1
+        return task[1]
+
+    tasks = [("http://{}.com/{}".format(host, i), i)
+             for i in range(20) for host in ['a', 'b', 'c']]
+    pool = ThreadPool(8)
+    scheduler = Scheduler(5, max_per_host=2)
+    results = list(scheduler.run(pool, func, tasks))
+    pool.close()
+    assert sorted(results) == sorted((task, task[1]) for task in tasks)
+    assert peaks['a.com'] <= 2
+    assert peaks['b.com'] <= 2
+    assert peaks['total'] <= 5
+
+
+def test_scheduler_rate():
+    pool = ThreadPool(4)
+    scheduler = Scheduler(4, rate_per_host=20)
+    tasks = [("http://a.com/{}".format(i), i) for i in range(40)]
+    start = time.time()
+    results = list(scheduler.run(pool, lambda task: task[1], tasks))
+    pool.close()
+    assert len(results) == 40
+    # 20 tokens are available immediately, the other 20 take one second
+    assert time.time() - start >= 0.9
+
+
+def test_scheduler_shared():
+    lock = threading.Lock()
+    running = {'a.com': 0, 'b.com': 0}
+    peaks = {}
+
+    def func(task):
+        host = task_host(task)
+        with lock:
+            running[host] += 1
+            peaks[host] = max(peaks.get(host, 0), running[host])
+            total = sum(running.values())
+            peaks['total'] = max(peaks.get('total', 0), total)
+        time.sleep(0.01)
+        with lock:
+            running[host] -= 1
+        return task[1]
+
+    pool = ThreadPool(8)
+    scheduler = Scheduler(3, max_per_host=2)
+    results = {}
+
+    def run(name):
+        tasks = [("http://{}.com/{}/{}".format(host, name, i), i)
+                 for i in range(10) for host in ['a', 'b']]
+        results[name] = list(scheduler.run(pool, func, tasks))
+
+    # two runs at the same time share the limits of the scheduler
+    drivers = [threading.Thread(target=run, args=(name,))
+               for name in ['x', 'y']]
+    for driver in drivers:
+        driver.start()
+    for driver in drivers:
+        driver.join()
+    pool.close()
+    assert len(results['x']) == 20
+    assert len(results['y']) == 20
+    assert peaks['a.com'] <= 2
+    assert peaks['b.com'] <= 2
+    assert peaks['total'] <= 3
+
+
+class CallbackPool(object):
+    """
+    Pool with the apply_async of Python 2 that has no error_callback.
+    """
+
+    def apply_async(self, func, args=(), kwds=None, callback=None):
+        result = func(*args, **(kwds or {}))
+        if callback is not None:
+            callback(result)
+
+
+def test_scheduler_error():
+    def func(task):
+        if task[1] == 2:
+            raise IOError("failed")
+        return task[1]
+
+    tasks = [("http://a.com/{}".format(i), i) for i in range(5)]
+    scheduler = Scheduler(2)
+    with pytest.raises(IOError):
+        list(scheduler.run(CallbackPool(), func, tasks))
+    pool = ThreadPool(2)
+    with pytest.raises(IOError):
+        list(scheduler.run(pool, func, tasks))
+    pool.close()
+    pool.join()
+    # the slots of the failed runs are free again
+    assert scheduler._total == 0
+    results = list(scheduler.run(CallbackPool(), lambda task: task[1], tasks))
+    assert len(results) == 5
@@ -0,0 +1,101 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the SQLite job state store.
+'''
+import os
+from datetime import datetime
+
+from datedown.state import StateStore, DONE, FAILED, DONE_QUERY
+from datedown.interface import download_by_dt
+import pytest
+
+
+def test_record(tmpdir):
+    store = StateStore(str(tmpdir.join("state.db")), batch_size=2)
+    store.record("u1", "t1", FAILED)
+    store.record_download("u1", "t1", 503, 1.5)
+    assert store.get("u1", "t1") == {'status': FAILED, 'attempts': 1,
+                                     'bytes': None, 'duration': 1.5,
+                                     'error': 'status 503'}
+    store.record("u1", "t1", DONE, nbytes=10)
+    store.record("u2", "t2", FAILED, error="timeout")
+    store.record_download("u3", "t3", 200, 0.1)
+    assert store.get("u1", "t1") == {'status': DONE, 'attempts': 2,
+                                     'bytes': 10, 'duration': 1.5,
+                                     'error': None}
+    assert store.done([("u1", "t1"), ("u2", "t2"), ("u3", "t3")]) == \
+        set([("u1", "t1")])
+    assert sorted(store.pending()) == [("u2", "t2"), ("u3", "t3")]
+    store.close()
+
+    store = StateStore(str(tmpdir.join("state.db")))
+    assert store.get("u2", "t2")['error'] == "timeout"
+    store.close()
+
+
+def test_done_primary_key(tmpdir):
+    store = StateStore(str(tmpdir.join("state.db")))
+    for i in range(1000):
+        store.record("u{}".format(i), "t{}".format(i), DONE)
+    assert store.done([("u1", "t1"), ("u2", "t1"), ("u5000", "t5000")]) == \
+        set([("u1", "t1")])
+    plan = store._conn.execute('EXPLAIN QUERY PLAN ' +
+                               DONE_QUERY.format('(?, ?)'),
+                               ("u1", "t1", DONE)).fetchall()
+    plan = ' '.join(row[-1] for row in plan)
+    assert 'tasks_status' not in plan
+    assert '(url=? AND target=?)' in plan
+    store.close()
+
+
+def test_download_by_dt_state(tmpdir):
+    calls = []
+    store = StateStore(str(tmpdir.join("state.db")))
+
+    def download_fn(urls, fnames):
+        calls.append(list(urls))
+        for fname in fnames:
+            if not fname.endswith("03"):
+                with open(fname, 'w') as fid:
+                    fid.write('data')
+
+    dts = [datetime(2000, 1, day) for day in range(1, 4)]
+    url_fn = lambda dt: dt.strftime("u%d")
+    fname_fn = lambda dt: os.path.join(str(tmpdir), dt.strftime("%d"))
+    with pytest.warns(UserWarning):
+        download_by_dt(dts, url_fn, fname_fn, download_fn, passes=1,
+                       state=store)
+    assert calls == [["u01", "u02", "u03"]]
+    assert store.get("u01", fname_fn(dts[0]))['bytes'] == 4
+    assert store.get("u03", fname_fn(dts[2]))['status'] == FAILED
+
+    # the second run only downloads what is not done, even if the files
+    # were removed in the meantime
+    os.remove(fname_fn(dts[0]))
+    with pytest.warns(UserWarning):
+        download_by_dt(dts, url_fn, fname_fn, download_fn, passes=1,
+                       state=store, chunk_size=1)
+    assert calls[1:] == [["u03"]]
+    assert store.get("u03", fname_fn(dts[2]))['attempts'] == 2
+    store.close()
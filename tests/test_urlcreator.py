@@ -23,8 +23,10 @@
 '''
 Tests for urlcreator
 '''
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
 from datedown.urlcreator import create_dt_url
+from datedown.urlcreator import compile_dt_url
 
 
 def test_create_dt_url_no_dt():
@@ -55,3 +57,20 @@ def test_create_dt_url_subdir_dt():
                         "file%Y%m%dname.nc",
                         subdirs=["%Y", "%m"])
     assert url == url_should
+
+
+def test_compile_dt_url():
+    dts = [datetime(2000, 1, 1) + timedelta(hours=7 * i) for i in range(500)]
+    for fname, subdirs in [("file%Y%m%d_%H%M%S_%j_%y%%name.nc", ["%Y", "%m"]),
+                           ("filename.nc", ["sub1", "%Y"]),
+                           ("file%Y.nc", []),
+                           ("", ["%Y", "%m"]),
+                           ("file%b.nc", ["%Y"])]:
+        template = compile_dt_url("http://example.com/a%20b", fname,
+                                  subdirs=subdirs)
+        urls_should = [create_dt_url(dt, "http://example.com/a%20b", fname,
+                                     subdirs=subdirs) for dt in dts]
+        assert template.render_many(dts) == urls_should
+        assert template.render_many(np.array(dts, dtype='M8[us]')) == urls_should
+        assert template(dts[0]) == urls_should[0]
+    assert template.render_many([]) == []
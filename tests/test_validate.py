@@ -0,0 +1,94 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016,Christoph Paulik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Tests for the validation of downloaded files.
+'''
+import hashlib
+import os
+
+import datedown.validate as validate
+from datedown.down import check_downloaded
+
+
+def write(path, content):
+    with open(path, 'wb') as fid:
+        fid.write(content)
+    return path
+
+
+def test_not_empty(tmpdir):
+    assert not validate.not_empty(write(str(tmpdir.join("a.nc")), b''))
+    assert validate.not_empty(write(str(tmpdir.join("b.nc")), b'CDF\x01'))
+
+
+def test_not_html(tmpdir):
+    page = b'\n  <!DOCTYPE html><html><body>Login</body></html>'
+    assert not validate.not_html(write(str(tmpdir.join("a.nc")), page))
+    assert validate.not_html(write(str(tmpdir.join("a.html")), page))
+    assert validate.not_html(write(str(tmpdir.join("a.txt")), b'data'))
+
+
+def test_magic_bytes(tmpdir):
+    assert validate.magic_bytes(write(str(tmpdir.join("a.nc")), b'CDF\x02...'))
+    assert validate.magic_bytes(write(str(tmpdir.join("b.nc")),
+                                      b'\x89HDF\r\n\x1a\n...'))
+    assert validate.magic_bytes(write(str(tmpdir.join("c.h5")),
+                                      b'\0' * 512 + b'\x89HDF\r\n\x1a\n'))
+    assert validate.magic_bytes(write(str(tmpdir.join("d.grib2")), b'GRIB..'))
+    assert validate.magic_bytes(write(str(tmpdir.join("e.gz")), b'\x1f\x8b..'))
+    assert validate.magic_bytes(write(str(tmpdir.join("f.txt")), b'<html>'))
+    assert not validate.magic_bytes(write(str(tmpdir.join("g.nc")), b'<html>'))
+    assert not validate.magic_bytes(write(str(tmpdir.join("h.zip")), b''))
+    # 64-bit data format (CDF-5)
+    assert validate.magic_bytes(write(str(tmpdir.join("i.nc")), b'CDF\x05...'))
+
+
+def test_checksum(tmpdir):
+    target = write(str(tmpdir.join("a.nc")), b'CDF\x01 data')
+    assert validate.checksum(target)
+    digest = hashlib.md5(b'CDF\x01 data').hexdigest()
+    write(target + ".md5", (digest + "  a.nc\n").encode('ascii'))
+    assert validate.checksum(target)
+    write(target + ".md5", (digest[::-1] + "  a.nc\n").encode('ascii'))
+    assert not validate.checksum(target)
+
+
+def test_expected_size(tmpdir):
+    target = write(str(tmpdir.join("a.nc")), b'12345')
+    assert validate.expected_size({target: 5})(target)
+    assert not validate.expected_size({target: 6})(target)
+    assert validate.expected_size({})(target)
+
+
+def test_check_downloaded_invalid(tmpdir):
+    targets = [write(str(tmpdir.join("good.nc")), b'CDF\x01'),
+               write(str(tmpdir.join("empty.nc")), b''),
+               write(str(tmpdir.join("error.nc")), b'<html>Not Found</html>'),
+               str(tmpdir.join("missing.nc"))]
+    urls = ["good", "empty", "error", "missing"]
+    not_urls, not_fnames = check_downloaded(
+        urls, targets, validators=validate.DEFAULT_VALIDATORS)
+    assert sorted(not_urls) == ["empty", "error", "missing"]
+    assert os.path.exists(targets[0])
+    assert not os.path.exists(targets[1])
+    assert not os.path.exists(targets[2])